@@ -0,0 +1,241 @@
+"""
+This file holds the backtest cache, which remembers the results of running
+backtesters so that they don't need to be run again. stat_analysis.py builds
+thousands of random portfolios over the same in-sample dates, and most of
+their symbols have already been examined by an earlier portfolio, so looking
+the result up is much faster than running every backtester again.
+Results are found by a key that is a hash of everything that decides them:
+the symbol's data (its dates and prices), the backtesters that were tried,
+the cash they started with, and whether MACD periods were swept. Since the
+data itself is part of the key, results are never used for data that has
+changed (e.g. after a split), and nothing ever needs to be invalidated.
+There are two tiers: the most recently used results are kept in memory, and
+every result is saved to disk (one .npz file each), where the least recently
+used files are deleted once the folder gets bigger than its limit.
+"""
+import backtesters
+import parameter_sweep
+import numpy as np
+import collections
+import hashlib
+import pickle
+import os
+
+
+# Default location of the cache.
+CACHE_PATH = '../symbol_data/backtest_cache/'
+
+# Part of every key. Change this whenever a backtester changes how it
+# trades (or the MACD sweep changes how it picks one), so that results saved
+# by the old version aren't used.
+CACHE_VERSION = 2
+
+# The price columns that go into each key, in this order.
+KEY_COLUMNS = ['Adj Close', 'High', 'Low', 'Open', 'Close', 'Volume']
+
+# Caches that have been opened by this process, so that their in-memory tier
+# is shared by every function that uses them (and by forked workers).
+# {'path': BacktestCache, ...}
+_open_caches = {}
+
+
+class BacktestCache:
+    """
+    A class that saves and looks up backtester results by their key.
+    """
+    def __init__(self, path=CACHE_PATH, max_bytes=512 * 1024 ** 2,
+                 max_memory_entries=1024):
+        """
+        Initialize the class variables.
+        :param path: String; the folder the results are saved in.
+        :param max_bytes: Int; how big the folder can get before the least
+        recently used results are deleted. Defaults to 512MB.
+        :param max_memory_entries: Int; how many results are also kept in
+        memory.
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_memory_entries = max_memory_entries
+        # The most recently used results, oldest first.
+        # {'key': (name, position, cash, holdings, state), ...}
+        self.memory = collections.OrderedDict()
+        # How big the folder is, as of the last time it was checked (plus
+        # what this process has saved since). None until it's needed.
+        self.disk_bytes = None
+        self.hits = 0  # How many lookups found a result
+        self.misses = 0  # How many lookups didn't
+
+    @staticmethod
+    def key(symbol_data, cash, backtester_names=None, sweep=False):
+        """
+        Builds the key of a backtest.
+        :param symbol_data: The dataframe the backtesters are run over.
+        :param cash: The cash each backtester starts with.
+        :param backtester_names: A list of the names of the backtesters tried.
+        If None, the preset list (see backtesters.backtesters(cash)).
+        :param sweep: Boolean; whether MACD periods are swept as well (see
+        run_backtesters.examine_backtesters).
+        :return: String; a sha256 hex digest.
+        """
+        if backtester_names is None:
+            backtester_names = [bt.name for bt in
+                                backtesters.backtesters(cash)]
+        # The sweep's grid decides which MACD can win, so it's part of the key.
+        grid = (list(parameter_sweep.SHORT_PERIODS),
+                list(parameter_sweep.LONG_PERIODS)) if sweep else None
+        h = hashlib.sha256()
+        h.update(repr((CACHE_VERSION, float(cash), list(backtester_names),
+                       grid)).encode())
+        h.update(np.ascontiguousarray(
+            symbol_data.index.values.astype('M8[ns]').astype(np.int64)))
+        h.update(np.ascontiguousarray(
+            symbol_data[KEY_COLUMNS].to_numpy(dtype=float)))
+        return h.hexdigest()
+
+    def file(self, key):
+        """
+        :param key: String; see key().
+        :return: String; where the result with this key is saved.
+        """
+        return os.path.join(self.path, key + '.npz')
+
+    def get(self, key):
+        """
+        Looks up a result, first in memory and then on disk.
+        :param key: String; see key().
+        :return: A tuple (name, position, cash, holdings, state) of the
+        winning backtester's name, its position, cash and holdings on each
+        date, and its state on the last date (see Backtester.snapshot), or
+        None if there's no result with this key.
+        """
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.hits += 1
+            return self.memory[key]
+
+        file = self.file(key)
+        try:
+            with np.load(file) as f:
+                entry = (str(f['name'][()]), f['position'], f['cash'],
+                         f['holdings'], pickle.loads(f['state'].tobytes()))
+            # Mark the file as recently used.
+            os.utime(file)
+        except (FileNotFoundError, OSError, KeyError, ValueError,
+                pickle.UnpicklingError):
+            # Either it was never saved, or it was deleted (or only half
+            # written) by another process.
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.remember(key, entry)
+        return entry
+
+    def put(self, key, name, position, cash, holdings, state=None):
+        """
+        Saves a result, both in memory and on disk.
+        :param key: String; see key().
+        :param name: String; the name of the winning backtester.
+        :param position: Numpy array; its position held at each date.
+        :param cash: Numpy array; its cash owned at each date.
+        :param holdings: Numpy array; its position * price at each date.
+        :param state: Its state on the last date (see Backtester.snapshot),
+        or None.
+        :return: Nothing.
+        """
+        entry = (name, np.array(position, dtype=float),
+                 np.array(cash, dtype=float),
+                 np.array(holdings, dtype=float), state)
+        self.remember(key, entry)
+
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path, exist_ok=True)
+        file = self.file(key)
+        # Written to a temporary file first, so other processes never read
+        # half of a result.
+        tmp_file = file + '.' + str(os.getpid()) + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            np.savez(f, name=np.array(name), position=entry[1], cash=entry[2],
+                     holdings=entry[3],
+                     state=np.frombuffer(pickle.dumps(state), dtype=np.uint8))
+        os.replace(tmp_file, file)
+
+        if self.disk_bytes is None:
+            self.disk_bytes = self.folder_size()
+        else:
+            self.disk_bytes += os.path.getsize(file)
+        if self.disk_bytes > self.max_bytes:
+            self.evict()
+
+    def remember(self, key, entry):
+        """
+        Keeps a result in memory, forgetting the least recently used one if
+        there are too many.
+        :param key: String; see key().
+        :param entry: The result; see get().
+        :return: Nothing.
+        """
+        self.memory[key] = entry
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_memory_entries:
+            self.memory.popitem(last=False)
+
+    def folder_size(self):
+        """
+        :return: Int; the number of bytes of results saved on disk.
+        """
+        return sum(entry.stat().st_size for entry in os.scandir(self.path)
+                   if entry.name.endswith('.npz'))
+
+    def evict(self):
+        """
+        Deletes the least recently used results on disk until the folder is
+        down to 90% of max_bytes, so that this doesn't happen on every save.
+        :return: Nothing.
+        """
+        files = []
+        for entry in os.scandir(self.path):
+            if entry.name.endswith('.npz'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        files.sort()
+
+        size = sum(file[1] for file in files)
+        target = 0.9 * self.max_bytes
+        removed = 0
+        for _, file_size, file in files:
+            if size <= target:
+                break
+            try:
+                os.remove(file)
+            except FileNotFoundError:
+                # Another process already deleted it.
+                pass
+            size -= file_size
+            removed += 1
+        print("Removed", removed, "old results from the backtest cache")
+        self.disk_bytes = size
+
+    def clear(self):
+        """
+        Deletes every result, in memory and on disk.
+        :return: Nothing.
+        """
+        self.memory.clear()
+        if os.path.isdir(self.path):
+            for entry in os.scandir(self.path):
+                if entry.name.endswith('.npz'):
+                    os.remove(entry.path)
+        self.disk_bytes = 0
+
+
+def open_cache(path=CACHE_PATH):
+    """
+    Returns the cache at a path, only creating it the first time it's asked
+    for in this process, so that its in-memory tier is reused.
+    :param path: String; the folder the results are saved in.
+    :return: An initialized BacktestCache.
+    """
+    if path not in _open_caches:
+        _open_caches[path] = BacktestCache(path)
+    return _open_caches[path]
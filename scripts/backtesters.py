@@ -10,12 +10,193 @@ import finlib
 import pandas as pd
 import numpy as np
 import sys
+import re
+import copy
+from scipy.signal import lfilter
 
 
 # Examples of more investment strategies to try:
 # https://www.macroaxis.com/invest/Momentum-Indicators/Absolute-Price-Oscillator/GOOG
 
 
+class RollingWindow:
+    """
+    A window over the most recent prices that the moving average backtesters
+    use. The prices are kept in a preallocated ring buffer, and the window also
+    keeps a running sum (for a simple moving average) and an exponential moving
+    average, so each new price is added in constant time without shifting a
+    list or re-averaging the whole window.
+    The exponential moving average follows what MACD has always done: its
+    multiplier is 2 / (number of prices in the window + 1), and the first ema
+    is just the first price.
+    """
+    __slots__ = ('period', 'values', 'head', 'count', 'total', 'ema')
+
+    def __init__(self, period):
+        """
+        Initialize the class variables
+        :param period: Int; the most prices the window holds.
+        """
+        self.period = period
+        self.values = np.zeros(period)  # Ring buffer of the prices
+        self.head = 0  # Where the next price is written in the ring buffer
+        self.count = 0  # How many prices are in the window
+        self.total = 0.0  # Sum of the prices in the window
+        self.ema = None  # Exponential moving average of the prices
+
+    def __len__(self):
+        return self.count
+
+    def append(self, price):
+        """
+        Adds a price to the window, pushing out the oldest price if the window
+        is full, and updates the running sum and ema.
+        :param price: Float; the newest price.
+        :return: Nothing.
+        """
+        if self.count == self.period:
+            self.total -= self.values[self.head]  # Get rid of old information
+        else:
+            self.count += 1
+        self.values[self.head] = price
+        self.total += price
+        self.head += 1
+        if self.head == self.period:
+            # Every time the ring buffer wraps around, re-add the window from
+            # scratch so that rounding errors in the running sum don't build
+            # up. That's once every period prices, so it's still constant time
+            # per price on average.
+            self.head = 0
+            self.total = float(self.values.sum())
+
+        prev_ema = price if self.ema is None else self.ema
+        self.ema = ((price - prev_ema) * (2 / (self.count + 1))) + prev_ema
+
+    def extend(self, prices, ema_after=None):
+        """
+        Adds many prices to the window at once, leaving it in the same state as
+        appending them one by one.
+        :param prices: Numpy array of the newest prices, oldest first.
+        :param ema_after: The ema after the last of the prices, if it has
+        already been computed (e.g. with the function ema()). If None, it is
+        computed here.
+        :return: Nothing.
+        """
+        n = len(prices)
+        if n == 0:
+            return
+        if ema_after is None:
+            ema_after = ema(prices, self.period, self.ema, self.count)[-1]
+
+        kept = np.asarray(prices[-self.period:], dtype=float)
+        skipped = n - len(kept)  # Prices that would've been pushed out anyway
+        slots = (self.head + skipped + np.arange(len(kept))) % self.period
+        self.values[slots] = kept
+        self.head = (self.head + n) % self.period
+        self.count = min(self.count + n, self.period)
+        self.total = float(self.values[:self.count].sum())
+        self.ema = ema_after
+
+    @property
+    def mean(self):
+        """
+        :return: The average of the prices in the window.
+        """
+        return self.total / self.count
+
+
+# The prices that historical_data shows for each day, in this order.
+PRICE_COLUMNS = ['Adj Close', 'High', 'Low', 'Open', 'Close', 'Volume']
+
+
+class Ledger:
+    """
+    Where a backtester records what happened on each day: its position, cash,
+    holdings and total. Everything is kept in numpy arrays that are allocated
+    ahead of time (see reserve()) and only grow, doubling in size, if they run
+    out of room, so recording a day doesn't append to python lists of floats.
+    """
+    __slots__ = ('length', 'position', 'cash', 'holdings', 'total')
+
+    def __init__(self, capacity=0):
+        """
+        Initialize the class variables
+        :param capacity: Int; how many days to make room for.
+        """
+        self.length = 0  # How many days have been recorded
+        self.position = np.empty(capacity)  # Position held at each date
+        self.cash = np.empty(capacity)  # Cash owned at each date
+        self.holdings = np.empty(capacity)  # position * price at each date
+        self.total = np.empty(capacity)  # holdings + cash at each date
+
+    @property
+    def capacity(self):
+        """
+        :return: Int; how many days there's room for.
+        """
+        return len(self.position)
+
+    def reserve(self, num_days):
+        """
+        Makes sure there's room for num_days more days, e.g. the length of the
+        data a backtester is about to be run over.
+        :param num_days: Int; the number of days about to be recorded.
+        :return: Nothing.
+        """
+        needed = self.length + num_days
+        if needed <= self.capacity:
+            return
+        capacity = max(needed, 2 * self.capacity)
+        for name in ('position', 'cash', 'holdings', 'total'):
+            old = getattr(self, name)
+            new = np.empty(capacity)
+            new[:self.length] = old[:self.length]
+            setattr(self, name, new)
+
+    def append(self, position, cash, holdings, total):
+        """
+        Records one day.
+        :param position: The position held.
+        :param cash: The cash owned.
+        :param holdings: position * price.
+        :param total: holdings + cash.
+        :return: Nothing.
+        """
+        i = self.length
+        if i == self.capacity:
+            self.reserve(1)
+        self.position[i] = position
+        self.cash[i] = cash
+        self.holdings[i] = holdings
+        self.total[i] = total
+        self.length = i + 1
+
+    def extend(self, position, cash, holdings, total):
+        """
+        Records many days at once.
+        :param position: Numpy array; the position held at each date.
+        :param cash: Numpy array; the cash owned at each date.
+        :param holdings: Numpy array; position * price at each date.
+        :param total: Numpy array; holdings + cash at each date.
+        :return: Nothing.
+        """
+        n = len(position)
+        self.reserve(n)
+        lo, hi = self.length, self.length + n
+        self.position[lo:hi] = position
+        self.cash[lo:hi] = cash
+        self.holdings[lo:hi] = holdings
+        self.total[lo:hi] = total
+        self.length = hi
+
+    def clear(self):
+        """
+        Forgets every day recorded, keeping the room that was made for them.
+        :return: Nothing.
+        """
+        self.length = 0
+
+
 class Backtester:
     """
     This class is inherited by all backtesters below. It holds variables that
@@ -24,53 +205,229 @@ class Backtester:
     are instead kept as a way to document their exact purpose in a central
     location.
     """
+    # How run_backtesters.run_backtester should drive this backtester:
+    # 'event' feeds it one day at a time through on_market_data_received and
+    # buy_sell_or_hold, while 'vectorized' hands the whole dataframe to
+    # run_vectorized at once. Custom strategies only need the event methods.
+    engine = 'event'
+
+    # Backtesters are made for every symbol and strategy, so their variables
+    # are kept in slots instead of a dictionary per backtester. Subclasses
+    # that don't list their own __slots__ still work; they just get a
+    # dictionary for their extra variables.
+    __slots__ = ('name', 'ledger', 'sources', 'results', 'initial_cash', 'cash',
+                 'total', 'position', 'holdings', 'market_data_count', 'price',
+                 'date')
+
+    # Whether running this backtester with k times the cash gives exactly k
+    # times the totals. That's true when fractional shares are bought, but
+    # not when the number of shares is rounded down to a whole number.
+    scales_with_cash = False
+
+    # The variables that make up the backtester's state on its last day: its
+    # account, and (in subclasses) whatever its model needs to keep going.
+    # See snapshot() and restore().
+    state_variables = ('cash', 'position', 'holdings', 'total',
+                       'market_data_count', 'price', 'date')
+
     def __init__(self, cash):
         """
         Initialize the class variables
         :param cash: The amount of money available at the beginning with
         which to invest.
         """
-        # Information that is used in each backtester
-        self.list_position = []  # List of positions held at each date
-        self.list_cash = []  # List of cash owned at each date
-        self.list_holdings = []  # position * price at each date
-        self.list_total = []  # holdings + cash at each date
+        # Information that is used in each backtester; see list_position,
+        # list_cash, list_holdings and list_total below.
+        self.ledger = Ledger()
 
+        self.initial_cash = cash  # Cash available before the first day
         self.cash = cash  # Hold variable of current liquidity
         self.total = cash  # Hold variable of current total net worth
         self.position = 0  # Hold variable of current position
         self.holdings = 0  # Hold variable of current holdings
         self.market_data_count = 0  # How much market info you have
+        self.price = None  # Hold variable of the latest adjusted close
+        self.date = None  # Hold variable of the latest date
 
-        # In case you want to hold all of the information, you can append
-        # it to this dataframe.
-        self.historical_data = None
+        # The dataframes of prices this backtester has been run over. They're
+        # only referenced, not copied, since the same prices are shared by
+        # every backtester run over a symbol; see historical_data.
+        self.sources = []
 
-        # Holds temp data for dataframe; by creating the dataframe from a dict
-        # instead of appending each time, we can greatly speed up the
-        # backtesting process.
-        self.hist_data_dict = {'Date': [], 'Adj Close': [], 'High': [],
-                               'Low': [], 'Open': [], 'Close': [],
-                               'Volume': []}
+        # A dataframe of the backtester's own results on each date: 'Total',
+        # 'Daily Return' and 'Excess Return'. Filled in by
+        # organize_backtester.
+        self.results = None
 
-    def update_hist_dict(self, price_update):
+    # The account on each date so far. These are views into the ledger, not
+    # copies, so they're only up to date until the next day is recorded.
+    @property
+    def list_position(self):
         """
-        Updates price_update information into hist_datadict
-        :param price_update: The day's stock information; a row from a dataframe
+        :return: Numpy array of the position held at each date.
+        """
+        return self.ledger.position[:self.ledger.length]
+
+    @property
+    def list_cash(self):
+        """
+        :return: Numpy array of the cash owned at each date.
+        """
+        return self.ledger.cash[:self.ledger.length]
+
+    @property
+    def list_holdings(self):
+        """
+        :return: Numpy array of position * price at each date.
+        """
+        return self.ledger.holdings[:self.ledger.length]
+
+    @property
+    def list_total(self):
+        """
+        :return: Numpy array of holdings + cash at each date.
+        """
+        return self.ledger.total[:self.ledger.length]
+
+    def record_source(self, symbol_data):
+        """
+        Remembers the prices that the backtester is being run over, so that
+        historical_data can show them next to its results.
+        :param symbol_data: The dataframe the backtester is being run over.
+        :return: Nothing.
+        """
+        if len(symbol_data) > 0:
+            self.sources.append(symbol_data)
+
+    def source_data(self):
+        """
+        :return: A dataframe of every day of prices the backtester has been
+        run over. This is the dataframe it was run over (not a copy) unless
+        it was run more than once.
+        """
+        if not self.sources:
+            return pd.DataFrame(columns=PRICE_COLUMNS,
+                                index=pd.DatetimeIndex([], name='Date'))
+        if len(self.sources) == 1:
+            return self.sources[0]
+        return pd.concat(self.sources)
+
+    @property
+    def historical_data(self):
+        """
+        Every day the backtester was run over: its prices, the backtester's
+        position, cash and holdings, and (once organize_backtester has been
+        called) its results. This is put together each time it's asked for
+        and isn't kept, so only the backtester's own columns take up memory;
+        use results when only those are needed.
+        :return: A dataframe indexed by date.
+        """
+        prices = self.source_data()
+        df = prices[[column for column in PRICE_COLUMNS
+                     if column in prices.columns]].copy()
+        df['Position'] = self.list_position
+        df['Cash'] = self.list_cash
+        df['Holdings'] = self.list_holdings
+        if self.results is not None:
+            df = df.join(self.results)
+        return df
+
+    def run_vectorized(self, symbol_data):
+        """
+        This is where a backtester computes its positions, cash, holdings and
+        totals over the whole of symbol_data at once, instead of a day at a
+        time. The results should be exactly what the event-driven methods
+        above would have appended, just without the per-day python overhead.
+        Backtesters that don't override this can only be run event-driven.
+        :param symbol_data: A dataframe obtained from yahoo finance containing
+        information on a stock's historical trade data
+        :return: Nothing.
+        """
+        sys.exit(self.name + " can't be run with the vectorized engine")
+
+    def record_vectorized(self, symbol_data, position, cash, holdings):
+        """
+        Saves the arrays computed in run_vectorized into the ledger, the same
+        as the event-driven methods would have filled it, and leaves the
+        current-state variables at their values on the last day.
+        :param symbol_data: The dataframe that was run through the backtester.
+        :param position: Numpy array; the position held at each date.
+        :param cash: Numpy array; the cash owned at each date.
+        :param holdings: Numpy array; position * price at each date.
         :return: Nothing.
         """
-        for key in self.hist_data_dict:
-            self.hist_data_dict[key].append(price_update[key])
+        total = holdings + cash
+        self.ledger.extend(position, cash, holdings, total)
+        self.record_source(symbol_data)
+
+        self.market_data_count += len(symbol_data)
+        if len(symbol_data) > 0:
+            self.price = float(symbol_data['Adj Close'].iloc[-1])
+            self.date = symbol_data.index[-1]
+            self.position = position[-1]
+            self.cash = cash[-1]
+            self.holdings = holdings[-1]
+            self.total = total[-1]
+
+    def snapshot(self):
+        """
+        Saves the backtester's state on its last day (see state_variables), so
+        that another backtester of the same kind can pick up where this one
+        left off with restore(), instead of starting over with an empty model.
+        :return: A dictionary {'variable1': value1, ...}, which can be pickled
+        and sent between processes.
+        """
+        return {name: copy.deepcopy(getattr(self, name))
+                for name in self.state_variables}
 
-    def create_dataframe(self):
+    def restore(self, state):
         """
-        Converts the dictionary hist_data_dict into a dataframe.
-        The information is saved as a dict initially in order to make these
-        backtesters run faster. If they were instead appended onto a dataframe
-        each day, the runtime would be *much* slower.
+        Sets the backtester's state to one saved with snapshot(). The results
+        it has recorded so far (list_total, etc.) aren't touched.
+        :param state: A dictionary returned by snapshot().
         :return: Nothing.
         """
-        self.historical_data = pd.DataFrame.from_dict(data=self.hist_data_dict)
+        for name in self.state_variables:
+            setattr(self, name, copy.deepcopy(state[name]))
+
+    def reset_account(self, cash):
+        """
+        Starts a new account with a different amount of cash, while keeping
+        the model (moving averages, signal, etc.) as it is. Whatever share of
+        the old account was in the stock stays in the stock, so a backtester
+        that was holding keeps holding instead of waiting for its next buy
+        signal. Everything recorded so far is cleared.
+        :param cash: The amount of money in the new account.
+        :return: Nothing.
+        """
+        position = 0
+        if self.price is not None and self.total > 0:
+            position = self.position * (cash / self.total)
+            if not self.scales_with_cash:
+                # Only whole shares are bought.
+                position = np.floor(position)
+            self.holdings = position * self.price
+        else:
+            self.holdings = 0
+        self.position = position
+        self.cash = cash - self.holdings
+        self.total = cash
+        self.initial_cash = cash
+
+        self.ledger.clear()
+        self.sources = []
+        self.results = None
+
+    def scaled_total(self, cash):
+        """
+        Returns what list_total would have been if the backtester had been
+        initialized with a different amount of cash, by rescaling the totals it
+        already has. This is only exact when scales_with_cash is True; for
+        other backtesters it ignores the rounding of whole shares.
+        :param cash: The amount of cash to rescale the totals to.
+        :return: A numpy array of the rescaled totals at each date.
+        """
+        return self.list_total * (cash / self.initial_cash)
 
     def build_model(self, price_update):
         """
@@ -123,6 +480,10 @@ class Hodl(Backtester):
     A backtester who's job is to buy as much of a stock as possible at the
     very beginning and do nothing else except keep relevant data tabulated.
     """
+    engine = 'vectorized'
+    scales_with_cash = True  # Fractional shares are bought on the first day
+    __slots__ = ()
+
     def __init__(self, cash):
         """
         Initialize the class variables
@@ -140,7 +501,6 @@ class Hodl(Backtester):
         :param price_update: The day's stock information; a row from a dataframe
         :return: Nothing
         """
-        self.update_hist_dict(price_update)
         pass
 
     def on_market_data_received(self, price_update):
@@ -182,12 +542,35 @@ class Hodl(Backtester):
             pass
 
         # Regular updates
+        self.price = price_update['Adj Close']
+        self.date = price_update['Date']
         self.holdings = self.position * price_update['Adj Close']
         self.total = (self.holdings + self.cash)
-        self.list_position.append(self.position)
-        self.list_cash.append(self.cash)
-        self.list_holdings.append(self.holdings)
-        self.list_total.append(self.holdings + self.cash)
+        self.ledger.append(self.position, self.cash, self.holdings, self.total)
+
+    def run_vectorized(self, symbol_data):
+        """
+        Buys as much as possible on the first day and holds it, computed over
+        the whole dataframe at once.
+        :param symbol_data: A dataframe obtained from yahoo finance containing
+        information on a stock's historical trade data
+        :return: Nothing.
+        """
+        prices = symbol_data['Adj Close'].to_numpy(dtype=float)
+        n = len(prices)
+        if n == 0:
+            return
+
+        position = self.position
+        cash = self.cash
+        if self.market_data_count == 0:
+            # Same as the 'buy' action on the first day of trading.
+            position += cash / prices[0]
+            cash = 0
+
+        position = np.full(n, position, dtype=float)
+        cash = np.full(n, cash, dtype=float)
+        self.record_vectorized(symbol_data, position, cash, position * prices)
 
 
 # Simple Moving Average backtester; not currently used.
@@ -200,6 +583,13 @@ class SMA(Backtester):
     becomes smaller than that average price for the longer period, we should
     sell our holdings and hold until it flips again.
     """
+    __slots__ = ('long_signal', 'prev_price', 'short_period', 'long_period',
+                 'short_window', 'long_window', 'short_avg', 'long_avg')
+
+    # The model's state also needs its signal and both rolling windows.
+    state_variables = Backtester.state_variables + (
+        'long_signal', 'short_window', 'long_window', 'short_avg', 'long_avg')
+
     def __init__(self, cash, short_period, long_period):
         """
         Initialize the class variables
@@ -217,8 +607,8 @@ class SMA(Backtester):
         self.prev_price = None  # Helps with the rolling average
         self.short_period = short_period
         self.long_period = long_period
-        self.short_window = []
-        self.long_window = []
+        self.short_window = RollingWindow(short_period)
+        self.long_window = RollingWindow(long_period)
         self.short_avg = None
         self.long_avg = None
 
@@ -229,16 +619,11 @@ class SMA(Backtester):
         :param price_update: The day's stock information; a row from a dataframe
         :return: Nothing.
         """
-        if len(self.short_window) == self.short_period:
-            self.short_window.pop(0)  # Get rid of old information
-        if len(self.long_window) == self.long_period:
-            self.long_window.pop(0)  # Get rid of old information
-
         self.short_window.append(price_update['Adj Close'])
         self.long_window.append(price_update['Adj Close'])
 
-        self.short_avg = np.mean(self.short_window)
-        self.long_avg = np.mean(self.long_window)
+        self.short_avg = self.short_window.mean
+        self.long_avg = self.long_window.mean
 
     def on_market_data_received(self, price_update):
         """
@@ -285,12 +670,11 @@ class SMA(Backtester):
             self.position = 0
 
         # Regular updates
+        self.price = price_update['Adj Close']
+        self.date = price_update['Date']
         self.holdings = self.position * price_update['Adj Close']
         self.total = self.holdings + self.cash
-        self.list_position.append(self.position)
-        self.list_cash.append(self.cash)
-        self.list_holdings.append(self.holdings)
-        self.list_total.append(self.total)
+        self.ledger.append(self.position, self.cash, self.holdings, self.total)
 
 
 class MACD(Backtester):
@@ -302,6 +686,16 @@ class MACD(Backtester):
     recent info. As such, it should be more responsive to drastic price
     increases and (hopefully) catch wind of upticks or downticks sooner.
     """
+    engine = 'vectorized'
+    __slots__ = ('long_signal', 'short_period', 'long_period', 'short_window',
+                 'long_window', 'short_ema', 'long_ema', 'prev_short_ema',
+                 'prev_long_ema')
+
+    # The model's state also needs its signal, both rolling windows and emas.
+    state_variables = Backtester.state_variables + (
+        'long_signal', 'short_window', 'long_window', 'short_ema', 'long_ema',
+        'prev_short_ema', 'prev_long_ema')
+
     def __init__(self, cash, short_period, long_period):
         """
         Initialize the class variables
@@ -318,8 +712,9 @@ class MACD(Backtester):
         self.long_signal = False  # A function of the rolling windows
         self.short_period = short_period
         self.long_period = long_period
-        self.short_window = []  # Holds closing price from past days
-        self.long_window = []  # Holds closing price from past days
+        # Hold closing prices from past days, along with their emas
+        self.short_window = RollingWindow(short_period)
+        self.long_window = RollingWindow(long_period)
         self.short_ema = None  # Current day's short ema
         self.long_ema = None  # Current day's long ema
         self.prev_short_ema = None  # Previous day's short ema
@@ -333,17 +728,6 @@ class MACD(Backtester):
         :param price_update: The day's stock information; a row from a dataframe
         :return: Nothing
         """
-        self.update_hist_dict(price_update)
-
-        if len(self.short_window) == self.short_period:
-            self.short_window.pop(0)  # Get rid of old information
-        if len(self.long_window) == self.long_period:
-            self.long_window.pop(0)  # Get rid of old information
-
-        # Updating windows for today's information
-        self.short_window.append(price_update['Adj Close'])
-        self.long_window.append(price_update['Adj Close'])
-
         # Updating previous emas.
         self.prev_short_ema = self.short_ema
         self.prev_long_ema = self.long_ema
@@ -355,15 +739,11 @@ class MACD(Backtester):
             self.prev_short_ema = price_update['Adj Close']
             self.prev_long_ema = price_update['Adj Close']
 
-        # Calculating multiplier
-        short_mult = 2 / (len(self.short_window) + 1)
-        long_mult = 2 / (len(self.long_window) + 1)
-
-        # Calculating current EMAs
-        self.short_ema = ((price_update['Adj Close'] - self.prev_short_ema) *
-                          short_mult) + self.prev_short_ema
-        self.long_ema = ((price_update['Adj Close'] - self.prev_long_ema) *
-                         long_mult) + self.prev_long_ema
+        # Updating windows (and their emas) for today's information
+        self.short_window.append(price_update['Adj Close'])
+        self.long_window.append(price_update['Adj Close'])
+        self.short_ema = self.short_window.ema
+        self.long_ema = self.long_window.ema
 
     def on_market_data_received(self, price_update):
         """
@@ -409,12 +789,121 @@ class MACD(Backtester):
             self.position = 0
 
         # Regular updates
+        self.price = price_update['Adj Close']
+        self.date = price_update['Date']
         self.holdings = self.position * price_update['Adj Close']
         self.total = self.holdings + self.cash
-        self.list_position.append(self.position)
-        self.list_cash.append(self.cash)
-        self.list_holdings.append(self.holdings)
-        self.list_total.append(self.total)
+        self.ledger.append(self.position, self.cash, self.holdings, self.total)
+
+    def run_vectorized(self, symbol_data):
+        """
+        Computes both EMAs with a recursive filter, finds the days where the
+        short EMA crosses the long EMA, and only steps through those crossover
+        days to figure out how many whole shares get bought or sold. Every
+        other day's position and cash is carried forward from the last trade.
+        :param symbol_data: A dataframe obtained from yahoo finance containing
+        information on a stock's historical trade data
+        :return: Nothing.
+        """
+        prices = symbol_data['Adj Close'].to_numpy(dtype=float)
+        n = len(prices)
+        if n == 0:
+            return
+
+        short_ema = ema(prices, self.short_period, self.short_ema,
+                        len(self.short_window))
+        long_ema = ema(prices, self.long_period, self.long_ema,
+                       len(self.long_window))
+
+        # We only start buying or selling once we have more than long_period
+        # days of information. After that, the signal is long while the short
+        # ema is above the long ema, and flat while it is below. If they're
+        # exactly equal, the signal doesn't change.
+        counts = self.market_data_count + np.arange(1, n + 1)
+        active = counts > self.long_period
+        signal = np.full(n + 1, -1, dtype=np.int8)
+        signal[0] = self.long_signal
+        signal[1:][active & (short_ema > long_ema)] = 1
+        signal[1:][active & (short_ema < long_ema)] = 0
+        last_set = np.where(signal >= 0, np.arange(n + 1), 0)
+        signal = signal[np.maximum.accumulate(last_set)].astype(bool)
+
+        # Crossovers are where the signal flips.
+        trades = np.flatnonzero(signal[1:] != signal[:-1])
+
+        position = np.empty(n, dtype=float)
+        cash = np.empty(n, dtype=float)
+        curr_position = self.position
+        curr_cash = self.cash
+        prev_trade = 0
+        for i in trades:
+            position[prev_trade:i] = curr_position
+            cash[prev_trade:i] = curr_cash
+            if signal[i + 1]:
+                # Buy as many positions of the stock as we can.
+                curr_position = np.floor(curr_cash / prices[i])
+                curr_cash -= curr_position * prices[i]
+            else:
+                # Sell all of our position.
+                curr_cash += curr_position * prices[i]
+                curr_position = 0
+            prev_trade = i
+        position[prev_trade:] = curr_position
+        cash[prev_trade:] = curr_cash
+
+        # Leave the model where the event-driven version would have left it.
+        self.long_signal = bool(signal[-1])
+        self.short_window.extend(prices, short_ema[-1])
+        self.long_window.extend(prices, long_ema[-1])
+        self.prev_short_ema = short_ema[-2] if n > 1 else self.short_ema
+        self.prev_long_ema = long_ema[-2] if n > 1 else self.long_ema
+        if self.prev_short_ema is None:
+            self.prev_short_ema = prices[0]
+            self.prev_long_ema = prices[0]
+        self.short_ema = short_ema[-1]
+        self.long_ema = long_ema[-1]
+
+        self.record_vectorized(symbol_data, position, cash, position * prices)
+
+
+def ema(prices, period, prev_ema=None, window_len=0):
+    """
+    Computes the exponential moving average of prices the same way MACD does
+    day by day: the multiplier is 2 / (days in the window + 1), where the
+    window grows by a day until it is period days long, and the first ema is
+    just the first price.
+    The days while the window is still growing are stepped through one at a
+    time (there are at most period of them), and every day after that is a
+    plain first-order recursive filter.
+    :param prices: Numpy array of adjusted closing prices.
+    :param period: Int; the length of the moving average's window.
+    :param prev_ema: The ema from the day before prices[0], or None if
+    prices[0] is the first day of information.
+    :param window_len: Int; how many days were in the window before prices[0].
+    :return: Numpy array of the ema on each day of prices.
+    """
+    n = len(prices)
+    res = np.empty(n, dtype=float)
+    if n == 0:
+        return res
+    if prev_ema is None:
+        prev_ema = prices[0]
+
+    # Days where the window is still growing, so the multiplier changes.
+    i = 0
+    while i < n and window_len < period:
+        window_len += 1
+        mult = 2 / (window_len + 1)
+        prev_ema = ((prices[i] - prev_ema) * mult) + prev_ema
+        res[i] = prev_ema
+        i += 1
+
+    # Constant multiplier from here on: ema = mult * price + (1 - mult) * prev
+    if i < n:
+        mult = 2 / (period + 1)
+        res[i:], _ = lfilter([mult], [1, mult - 1], prices[i:],
+                             zi=[(1 - mult) * prev_ema])
+    return res
 
 
 def backtesters(cash):
@@ -438,6 +927,8 @@ def find_backtester(name, cash):
     """
     Returns initialized class of a backtester when just given a string of the
     backtesters name, instead of returning a list of all available backtesters.
+    Moving average backtesters with periods other than the default ones (e.g.
+    'MACD (5, 40)', as picked by parameter_sweep.py) are built from their name.
     :param name: name of wanted backtester. A string.
     :param cash: cash that is used when initializing this backtester. Int.
     :return: The initialized backtester, or None if that backtester doesn't
@@ -447,19 +938,51 @@ def find_backtester(name, cash):
     for backtester in list_of_backtesters:
         if backtester.name == name:
             return backtester
+
+    match = re.fullmatch(r'(MACD|Simple Moving Avg) \((\d+), (\d+)\)', name)
+    if match is not None:
+        backtester_class = MACD if match.group(1) == 'MACD' else SMA
+        return backtester_class(cash, int(match.group(2)),
+                                int(match.group(3)))
     sys.exit("Couldn't find backtester of name: " + name)
 
 
+def rebuild_backtester(name, cash, symbol_data, position, cash_held,
+                       holdings, state=None):
+    """
+    Recreates a finished backtester out of its results, e.g. when it was run
+    in a different process and only its results were sent back.
+    :param name: String; the name of the backtester that was run.
+    :param cash: The cash the backtester was initialized with.
+    :param symbol_data: The dataframe the backtester was run over.
+    :param position: Numpy array; the position held at each date.
+    :param cash_held: Numpy array; the cash owned at each date.
+    :param holdings: Numpy array; position * price at each date.
+    :param state: The backtester's state on its last day (see
+    Backtester.snapshot), or None. Without it, the rebuilt backtester's model
+    (moving averages, etc.) is empty, so it can't be continued.
+    :return: The backtester, organized the same way as after
+    run_backtesters.examine_backtesters.
+    """
+    bt = find_backtester(name, cash)
+    bt.record_vectorized(symbol_data, position, cash_held, holdings)
+    if state is not None:
+        bt.restore(state)
+    organize_backtester(bt)
+    return bt
+
+
 def organize_backtester(bt):
     """
-    This function organizes the dataframe historical_data present in each
-    backtester class. This organization is not mandatory, but can sometimes
+    This function puts the backtester's results into a dataframe (bt.results)
+    indexed by date, holding its total on each day along with its daily and
+    excess returns. This organization is not mandatory, but can sometimes
     help with computations, so it is left here in case.
     :param bt: The initialized backtester that has already figured out when to
     buy, sell, hold, etc.
     :return: Modifies the backtester in place.
     """
-    bt.historical_data.set_index('Date', inplace=True)  # Change index to date
-    bt.historical_data['Total'] = bt.list_total  # Organize total earnings
-    finlib.excess_returns(bt.historical_data, risk_free_rate=0.05/252,
+    bt.results = pd.DataFrame({'Total': bt.list_total},
+                              index=bt.source_data().index)
+    finlib.excess_returns(bt.results, risk_free_rate=0.05/252,
                           column_name='Total')  # Get excess returns
@@ -0,0 +1,476 @@
+"""
+This file benchmarks the backtest pipeline. It times each stage on its own
+(run_backtester, examine_backtesters, compute_tangency and a full
+setup_backtesters) over made-up prices, so nothing is downloaded from yahoo
+finance or wikipedia and the numbers don't depend on the network.
+The prices come from data_providers.SyntheticProvider, so the same panel size
+and seed always give the same prices. Every path in this project is relative
+to the folder it's run from (e.g. '../symbol_data/store/'), so the benchmark
+runs inside a temporary folder with a made-up s&p500 snapshot in it, and the
+real symbol data, statistics and caches are never touched.
+For each stage the results hold:
+-- how long it took (the best and mean of a few runs, in seconds)
+-- throughput, in symbol-days per second (symbols x days / best time)
+-- the peak and retained memory allocated while it ran (from tracemalloc, in
+a separate run since tracing slows everything down) and how many memory
+blocks it left allocated
+-- the process' resident memory after it ran, and the most it has been
+The results are saved as json, and two of them (e.g. from before and after a
+commit) can be compared with compare_results, from the command line:
+python benchmark.py --symbols 100 --days 504
+python benchmark.py --compare old.json new.json
+"""
+import backtesters
+import finlib
+import obtain_symbols
+import run_backtesters as rb
+import data_providers
+import trading_calendar
+import pandas as pd
+import numpy as np
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+
+# Where results are saved, unless told otherwise.
+BENCHMARK_PATH = '../benchmarks/'
+
+# The first day of made-up data. The in-sample window is the num_days trading
+# days starting here.
+FIRST_DATE = '2005-01-03'
+
+# The version of the made-up s&p500 snapshot (see
+# obtain_symbols.load_constituents).
+CONSTITUENTS_VERSION = '2000-01-01'
+
+# The cash every backtester and portfolio starts with.
+CASH = 1000000
+
+# Every stage, in the order they're run.
+STAGES = ['synthetic_data', 'run_backtester', 'examine_backtesters',
+          'compute_tangency', 'setup_backtesters']
+
+
+class SyntheticPanel:
+    """
+    A class that holds the made-up symbols and sectors that are benchmarked.
+    """
+    def __init__(self, num_symbols, num_days, num_sectors, seed=0):
+        """
+        Initialize the class variables.
+        :param num_symbols: Int; how many symbols there are in total.
+        :param num_days: Int; how many trading days the in-sample window has.
+        :param num_sectors: Int; how many sectors the symbols are split into.
+        :param seed: Int; seeds every symbol's prices.
+        """
+        if num_sectors < 1 or num_symbols < num_sectors:
+            raise ValueError("Every sector needs at least one symbol")
+        days = trading_calendar.nyse_calendar().trading_days(
+            FIRST_DATE, pd.Timestamp.today().strftime('%Y-%m-%d'))
+        if num_days > len(days):
+            raise ValueError("There are only " + str(len(days)) +
+                             " trading days since " + FIRST_DATE)
+
+        self.num_symbols = num_symbols
+        self.num_days = num_days
+        self.num_sectors = num_sectors
+        self.seed = seed
+        # The in-sample window.
+        self.start_date = str(days[0])
+        self.end_date = str(days[num_days - 1])
+        # Made up data, going up to today, since setup_backtesters wants data
+        # past the in-sample window.
+        self.provider = data_providers.SyntheticProvider(
+            seed=seed, first_date=FIRST_DATE)
+        # The symbols, dealt out to the sectors in turn.
+        # {'Sector 1': ['S0000', 'S0011', ...], ...}
+        self.sectors = {}
+        for i in range(num_symbols):
+            sector = 'Sector ' + str(i % num_sectors + 1)
+            self.sectors.setdefault(sector, []).append('S%04d' % i)
+        self.symbols = [symbol for sector in self.sectors
+                        for symbol in self.sectors[sector]]
+
+    def frames(self, end_date=None):
+        """
+        Makes up every symbol's data.
+        :param end_date: String (or None); the last date wanted. None means
+        today.
+        :return: A dictionary {'symbol1': dataframe1, ...}
+        """
+        return {symbol: self.provider.fetch(symbol, self.start_date, end_date)
+                for symbol in self.symbols}
+
+    def write_constituents(self, path):
+        """
+        Saves the symbols as an s&p500 snapshot, so that
+        obtain_symbols.organize_symbols picks them.
+        :param path: String; the folder to save the snapshot into.
+        :return: Nothing.
+        """
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        rows = [(symbol, sector, '2000-01-01') for sector in self.sectors
+                for symbol in self.sectors[sector]]
+        pd.DataFrame(rows, columns=['Symbol', 'GICS Sector',
+                                    'Date first added']).to_csv(
+            os.path.join(path, 'sp500_' + CONSTITUENTS_VERSION + '.csv'),
+            index=False)
+
+
+def rss_bytes():
+    """
+    :return: A tuple (rss, max_rss) of how much memory this process has
+    resident right now and the most it has ever had, in bytes. rss is None
+    where /proc isn't available.
+    """
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, mac reports bytes.
+    if sys.platform != 'darwin':
+        max_rss *= 1024
+    rss = None
+    try:
+        with open('/proc/self/statm') as f:
+            rss = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        pass
+    return rss, max_rss
+
+
+def measure(func, symbol_days, repeat=3, quiet=True):
+    """
+    Times a stage, then runs it once more while tracing its memory.
+    :param func: The stage; a function that takes no arguments.
+    :param symbol_days: Int; how many symbol-days the stage goes through.
+    :param repeat: Int; how many times the stage is timed.
+    :param quiet: Boolean; whether to hide what the stage prints.
+    :return: A dictionary of the stage's results (see the top of this file).
+    """
+    output = open(os.devnull, 'w') if quiet else sys.stdout
+    try:
+        times = []
+        for _ in range(repeat):
+            with contextlib.redirect_stdout(output):
+                start = time.perf_counter()
+                func()
+                times.append(time.perf_counter() - start)
+
+        blocks = sys.getallocatedblocks()
+        tracemalloc.start()
+        try:
+            with contextlib.redirect_stdout(output):
+                func()
+            retained, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        retained_blocks = sys.getallocatedblocks() - blocks
+    finally:
+        if quiet:
+            output.close()
+
+    rss, max_rss = rss_bytes()
+    best = min(times)
+    return {'times': times,
+            'best_seconds': best,
+            'mean_seconds': sum(times) / len(times),
+            'symbol_days': symbol_days,
+            'symbol_days_per_second': symbol_days / best if best > 0 else None,
+            'peak_traced_bytes': peak,
+            'retained_traced_bytes': retained,
+            'retained_blocks': retained_blocks,
+            'rss_bytes': rss,
+            'max_rss_bytes': max_rss}
+
+
+def git_commit():
+    """
+    :return: String; the commit this file is checked out at, or None if it
+    isn't in a git repository.
+    """
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+            text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(num_symbols=100, num_days=504, num_sectors=11,
+                   portfolio_symbols=5, repeat=3, seed=0, num_workers=1,
+                   stages=None, quiet=True):
+    """
+    Benchmarks every stage of the pipeline over a made-up panel.
+    :param num_symbols: Int; how many symbols the panel has.
+    :param num_days: Int; how many trading days the in-sample window has.
+    :param num_sectors: Int; how many sectors the symbols are split into.
+    :param portfolio_symbols: Int; how many symbols per sector the
+    setup_backtesters stage puts in its portfolio.
+    :param repeat: Int; how many times each stage is timed.
+    :param seed: Int; seeds the prices and the portfolio's symbols.
+    :param num_workers: Int; passed on to setup_backtesters.
+    :param stages: A list of the stages to run (see STAGES). Defaults to all
+    of them.
+    :param quiet: Boolean; whether to hide what each stage prints.
+    :return: A dictionary {'meta': {...}, 'stages': {'stage1': {...}, ...}}
+    of how the benchmark was run and each stage's results (see measure).
+    """
+    if stages is None:
+        stages = STAGES
+    for stage in stages:
+        if stage not in STAGES:
+            raise ValueError("No stage named " + stage)
+
+    panel = SyntheticPanel(num_symbols, num_days, num_sectors, seed=seed)
+    results = {
+        'meta': {'commit': git_commit(),
+                 'date': datetime.datetime.now().isoformat(timespec='seconds'),
+                 'python': platform.python_version(),
+                 'numpy': np.__version__,
+                 'pandas': pd.__version__,
+                 'platform': platform.platform(),
+                 'cpus': os.cpu_count(),
+                 'num_symbols': num_symbols,
+                 'num_days': num_days,
+                 'num_sectors': num_sectors,
+                 'portfolio_symbols': portfolio_symbols,
+                 'repeat': repeat,
+                 'seed': seed,
+                 'num_workers': num_workers,
+                 'start_date': panel.start_date,
+                 'end_date': panel.end_date},
+        'stages': {}}
+    symbol_days = num_symbols * num_days
+
+    # Everything the stages need is made before any of them are timed.
+    in_sample = {symbol: frame.iloc[:num_days]
+                 for symbol, frame in panel.frames().items()}
+    best = {}  # {'symbol': its best backtester}, for compute_tangency
+
+    def synthetic_data():
+        panel.frames(panel.end_date)
+
+    def run_backtester():
+        for symbol in panel.symbols:
+            for bt in backtesters.backtesters(CASH):
+                rb.run_backtester(bt, in_sample[symbol])
+
+    def examine_backtesters():
+        for symbol in panel.symbols:
+            best[symbol] = rb.examine_backtesters(in_sample[symbol], CASH)
+
+    def compute_tangency():
+        finlib.compute_tangencies(excess_returns, diagonalize=False)
+
+    def setup_backtesters():
+        rb.setup_backtesters(CASH, portfolio_symbols, panel.start_date,
+                             panel.end_date, seed=seed,
+                             num_workers=num_workers, provider=panel.provider,
+                             use_cache=False)
+
+    for stage in stages:
+        print("Benchmarking", stage)
+        if stage == 'synthetic_data':
+            res = measure(synthetic_data, symbol_days, repeat, quiet)
+        elif stage == 'run_backtester':
+            res = measure(run_backtester, symbol_days, repeat, quiet)
+            res['strategies'] = [bt.name for bt in
+                                 backtesters.backtesters(CASH)]
+        elif stage == 'examine_backtesters':
+            res = measure(examine_backtesters, symbol_days, repeat, quiet)
+        elif stage == 'compute_tangency':
+            if not best:
+                with open(os.devnull, 'w') as devnull, \
+                        contextlib.redirect_stdout(devnull):
+                    examine_backtesters()
+            excess_returns = {
+                sector: pd.DataFrame({symbol: best[symbol].results[
+                    'Excess Return'] for symbol in panel.sectors[sector]})
+                for sector in panel.sectors}
+            res = measure(compute_tangency, symbol_days, repeat, quiet)
+        else:
+            num_picked = sum(min(portfolio_symbols, len(symbols))
+                             for symbols in panel.sectors.values())
+            res = measure_setup(panel, setup_backtesters,
+                                num_picked * num_days, repeat, quiet)
+        print("  best %.4fs, %.0f symbol-days/s, peak %.1f MB" %
+              (res['best_seconds'], res['symbol_days_per_second'] or 0,
+               res['peak_traced_bytes'] / 1024 ** 2))
+        results['stages'][stage] = res
+    return results
+
+
+def measure_setup(panel, func, symbol_days, repeat, quiet):
+    """
+    Measures the setup_backtesters stage inside a temporary folder that holds
+    the made-up s&p500 snapshot, with every symbol's data (and SPY's)
+    preloaded the way stat_analysis.download_data preloads it.
+    :param panel: The SyntheticPanel.
+    :param func: The stage.
+    :param symbol_days: Int; see measure.
+    :param repeat: Int; see measure.
+    :param quiet: Boolean; see measure.
+    :return: The stage's results (see measure).
+    """
+    cwd = os.getcwd()
+    preloaded = dict(rb.preloaded_data)
+    with tempfile.TemporaryDirectory() as folder:
+        # '../constituents/' (and every other relative path) now points into
+        # the temporary folder.
+        os.makedirs(os.path.join(folder, 'scripts'))
+        panel.write_constituents(os.path.join(folder, 'constituents'))
+        os.chdir(os.path.join(folder, 'scripts'))
+        clear_constituents_caches()
+        try:
+            rb.preloaded_data.update(panel.frames())
+            rb.preloaded_data['SPY'] = panel.provider.fetch('SPY',
+                                                            panel.start_date)
+            return measure(func, symbol_days, repeat, quiet)
+        finally:
+            os.chdir(cwd)
+            clear_constituents_caches()
+            rb.preloaded_data.clear()
+            rb.preloaded_data.update(preloaded)
+
+
+def clear_constituents_caches():
+    """
+    Forgets the s&p500 snapshots loaded by obtain_symbols, since the made-up
+    snapshot is found by the same relative path as the real one.
+    :return: Nothing.
+    """
+    obtain_symbols._constituents_cache.clear()
+    obtain_symbols._sector_index_cache.clear()
+
+
+def save_results(results, file=None):
+    """
+    Saves a benchmark's results as json.
+    :param results: The dictionary returned by run_benchmarks.
+    :param file: String (or None); where to save them. Defaults to a file in
+    BENCHMARK_PATH named after the commit and the time.
+    :return: String; the file they were saved to.
+    """
+    if file is None:
+        meta = results['meta']
+        file = os.path.join(BENCHMARK_PATH, 'benchmark_' +
+                            (meta['commit'] or 'unknown') + '_' +
+                            meta['date'].replace(':', '-') + '.json')
+    folder = os.path.dirname(file)
+    if folder and not os.path.isdir(folder):
+        os.makedirs(folder)
+    with open(file, 'w') as f:
+        json.dump(results, f, indent=2)
+    return file
+
+
+def compare_results(old, new, threshold=0.1):
+    """
+    Prints how each stage changed between two benchmarks, e.g. from before and
+    after a commit.
+    :param old: The results (see run_benchmarks) to compare against.
+    :param new: The results to compare.
+    :param threshold: Float; how much slower (or more memory hungry) a stage
+    can get before it counts as a regression. Default is 0.1, i.e. 10%.
+    :return: A list of strings describing every regression.
+    """
+    for key in ['num_symbols', 'num_days', 'num_sectors', 'portfolio_symbols',
+                'num_workers']:
+        if old['meta'].get(key) != new['meta'].get(key):
+            print("Warning: the benchmarks were run with different " + key +
+                  " (" + str(old['meta'].get(key)) + " vs " +
+                  str(new['meta'].get(key)) + ")")
+
+    print("Comparing", old['meta'].get('commit'), "->",
+          new['meta'].get('commit'))
+    print("%-20s %10s %10s %8s %10s %10s %8s" %
+          ('Stage', 'Old (s)', 'New (s)', 'Change', 'Old MB', 'New MB',
+           'Change'))
+    regressions = []
+    for stage in STAGES:
+        if stage not in old['stages'] or stage not in new['stages']:
+            continue
+        o, n = old['stages'][stage], new['stages'][stage]
+        time_change = n['best_seconds'] / o['best_seconds'] - 1
+        memory_change = n['peak_traced_bytes'] / \
+            max(o['peak_traced_bytes'], 1) - 1
+        print("%-20s %10.4f %10.4f %+7.1f%% %10.1f %10.1f %+7.1f%%" %
+              (stage, o['best_seconds'], n['best_seconds'], 100 * time_change,
+               o['peak_traced_bytes'] / 1024 ** 2,
+               n['peak_traced_bytes'] / 1024 ** 2, 100 * memory_change))
+        if time_change > threshold:
+            regressions.append(stage + " is %.1f%% slower" %
+                               (100 * time_change))
+        if memory_change > threshold:
+            regressions.append(stage + " uses %.1f%% more memory" %
+                               (100 * memory_change))
+
+    for regression in regressions:
+        print("Regression:", regression)
+    return regressions
+
+
+def main(argv=None):
+    """
+    Runs the benchmark (or compares two) from the command line. See
+    python benchmark.py --help.
+    :param argv: A list of the command line's arguments. Defaults to
+    sys.argv[1:].
+    :return: Int; the exit code, which is 1 if a comparison found a
+    regression.
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark the backtest pipeline over made-up prices.")
+    parser.add_argument('--symbols', type=int, default=100,
+                        help="how many symbols the panel has")
+    parser.add_argument('--days', type=int, default=504,
+                        help="how many trading days the in-sample window has")
+    parser.add_argument('--sectors', type=int, default=11,
+                        help="how many sectors the symbols are split into")
+    parser.add_argument('--portfolio-symbols', type=int, default=5,
+                        help="symbols per sector in setup_backtesters")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="how many times each stage is timed")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=1,
+                        help="processes used by setup_backtesters")
+    parser.add_argument('--stages', nargs='+', choices=STAGES,
+                        help="only run these stages")
+    parser.add_argument('--output', help="where to save the json results")
+    parser.add_argument('--verbose', action='store_true',
+                        help="show what each stage prints")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help="compare two saved results instead")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="slowdown that counts as a regression")
+    args = parser.parse_args(argv)
+
+    if args.compare is not None:
+        with open(args.compare[0]) as f:
+            old = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        return 1 if compare_results(old, new, args.threshold) else 0
+
+    results = run_benchmarks(num_symbols=args.symbols, num_days=args.days,
+                             num_sectors=args.sectors,
+                             portfolio_symbols=args.portfolio_symbols,
+                             repeat=args.repeat, seed=args.seed,
+                             num_workers=args.workers, stages=args.stages,
+                             quiet=not args.verbose)
+    print("Saved results to", save_results(results, args.output))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,249 @@
+"""
+This file holds the places historical data can be downloaded from. Every
+provider has the same fetch(symbol, start_date, end_date) method, which
+returns a dataframe that looks like the ones finlib.load_financial_data
+returns, so code that downloads data (e.g. PriceStore.refresh) can be handed
+any of them, including a fake one when testing.
+Providers also have fetch_many(), which downloads a list of symbols at once
+using a few threads (most of the time is spent waiting on the network), tries
+each symbol again a few times if it fails, and reports which symbols couldn't
+be downloaded instead of stopping the whole program.
+"""
+import trading_calendar
+import pandas as pd
+import numpy as np
+import time
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pandas_datareader import data
+
+
+# The columns every provider's dataframes have, in this order.
+COLUMNS = ['High', 'Low', 'Open', 'Close', 'Volume', 'Adj Close']
+
+
+class DataProvider:
+    """
+    The base class of every provider. A provider only needs to override
+    fetch().
+    """
+    # How many symbols fetch_many() downloads at the same time.
+    max_workers = 8
+    # How many times fetch_many() tries a symbol before giving up on it.
+    retries = 3
+    # How long (in seconds) fetch_many() waits before trying a symbol again.
+    # The wait doubles after every failure.
+    backoff = 1.0
+
+    def fetch(self, symbol, start_date=None, end_date=None):
+        """
+        Downloads a symbol's historical data.
+        :param symbol: String; a ticker, e.g. 'GOOG'
+        :param start_date: The first date wanted (a string like '2001-01-01',
+        or a timestamp). None means as far back as there is data.
+        :param end_date: The last date wanted. None means the most recent
+        trading day.
+        :return: A dataframe indexed by date with the columns High, Low, Open,
+        Close, Volume and Adj Close.
+        """
+        raise NotImplementedError
+
+    def fetch_many(self, symbols, start_date=None, end_date=None):
+        """
+        Downloads the historical data of many symbols at once, with up to
+        max_workers downloads running at the same time. A symbol that fails
+        is tried again (up to retries times in total), waiting a little
+        longer each time.
+        :param symbols: A list of tickers.
+        :param start_date: The first date wanted; see fetch().
+        :param end_date: The last date wanted; see fetch().
+        :return: A tuple (frames, errors) where frames is a dictionary
+        {'symbol1': dataframe1, ...} of the symbols that were downloaded, and
+        errors is a dictionary {'symbol2': 'what went wrong', ...} of the ones
+        that couldn't be.
+        """
+        frames = {}
+        errors = {}
+        if not symbols:
+            return frames, errors
+
+        num_workers = max(1, min(self.max_workers, len(symbols)))
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            results = executor.map(
+                lambda symbol: self.fetch_with_retries(symbol, start_date,
+                                                       end_date), symbols)
+            for symbol, (df, error) in zip(symbols, results):
+                if error is None:
+                    frames[symbol] = df
+                else:
+                    errors[symbol] = error
+        return frames, errors
+
+    def fetch_with_retries(self, symbol, start_date=None, end_date=None):
+        """
+        Calls fetch(), trying again if it fails.
+        :param symbol: String; a ticker, e.g. 'GOOG'
+        :param start_date: The first date wanted; see fetch().
+        :param end_date: The last date wanted; see fetch().
+        :return: A tuple (df, error) where df is the symbol's dataframe (or
+        None) and error is a string saying why it couldn't be downloaded (or
+        None if it was).
+        """
+        wait = self.backoff
+        error = None
+        for attempt in range(self.retries):
+            try:
+                df = self.fetch(symbol, start_date, end_date)
+                if df is None or df.empty:
+                    raise ValueError("no data was found")
+                return df, None
+            except Exception as e:
+                error = type(e).__name__ + ': ' + str(e)
+                if attempt + 1 < self.retries:
+                    time.sleep(wait)
+                    wait *= 2
+        return None, error
+
+
+class YahooProvider(DataProvider):
+    """
+    A provider that downloads data from yahoo finance, the way this project
+    always has.
+    """
+    def fetch(self, symbol, start_date=None, end_date=None):
+        """
+        See DataProvider.fetch().
+        """
+        if start_date is None:
+            start_date = '1900-01-01'
+        df = data.DataReader(symbol, 'yahoo', start=start_date, end=end_date)
+        return df.loc[pd.Timestamp(start_date):, :]
+
+
+class LocalFileProvider(DataProvider):
+    """
+    A provider that reads each symbol's data from a file in a folder, e.g.
+    the pickles in symbol_data/, or csv/parquet files exported from somewhere
+    else. Nothing is downloaded, so it works offline.
+    """
+    # File types that can be read, in the order they're looked for.
+    EXTENSIONS = ['.pkl', '.parquet', '.csv']
+
+    # Reading files doesn't need to be retried or waited on.
+    retries = 1
+    backoff = 0
+
+    def __init__(self, path='../symbol_data/', extensions=None):
+        """
+        Initialize the class variables.
+        :param path: String; the folder the files are in. Each file is named
+        after its symbol, e.g. 'GOOG.csv'.
+        :param extensions: A list of the file types to look for (e.g.
+        ['.csv']); defaults to EXTENSIONS.
+        """
+        self.path = path
+        self.extensions = self.EXTENSIONS if extensions is None else extensions
+
+    def symbol_file(self, symbol):
+        """
+        :param symbol: String; a ticker, e.g. 'GOOG'
+        :return: String; the symbol's file, or None if it doesn't have one.
+        """
+        for extension in self.extensions:
+            file = os.path.join(self.path, symbol + extension)
+            if os.path.isfile(file):
+                return file
+        return None
+
+    def fetch(self, symbol, start_date=None, end_date=None):
+        """
+        See DataProvider.fetch(). Raises FileNotFoundError if the symbol
+        doesn't have a file.
+        """
+        file = self.symbol_file(symbol)
+        if file is None:
+            raise FileNotFoundError("No file for " + symbol + " in " +
+                                    self.path)
+        if file.endswith('.pkl'):
+            df = pd.read_pickle(file)
+        elif file.endswith('.parquet'):
+            df = pd.read_parquet(file)
+        else:
+            df = pd.read_csv(file, index_col=0)
+        df.index = pd.DatetimeIndex(df.index, name='Date')
+        df = df.sort_index()
+        return df.loc[start_date:end_date, :]
+
+
+class SyntheticProvider(DataProvider):
+    """
+    A provider that makes up data instead of downloading it: each symbol's
+    price follows a geometric brownian motion over the NYSE trading days.
+    The same symbol (and seed) always gets the same prices, which makes it
+    handy for benchmarks and for trying things out without a connection.
+    """
+    retries = 1
+    backoff = 0
+
+    def __init__(self, seed=0, first_date='2000-01-03', last_date=None,
+                 drift=0.08, volatility=0.25, start_price=100.0):
+        """
+        Initialize the class variables.
+        :param seed: Int; seeds every symbol's prices.
+        :param first_date: String; the first day there is data for.
+        :param last_date: String (or None); the last day there is data for.
+        Defaults to today.
+        :param drift: Float; the annual drift of each price.
+        :param volatility: Float; the annual volatility of each price.
+        :param start_price: Float; each symbol's price on first_date.
+        """
+        self.seed = seed
+        self.first_date = first_date
+        self.last_date = last_date
+        self.drift = drift
+        self.volatility = volatility
+        self.start_price = start_price
+
+    def symbol_rng(self, symbol):
+        """
+        :param symbol: String; a ticker, e.g. 'GOOG'
+        :return: A numpy random generator that only depends on the seed and
+        the symbol.
+        """
+        return np.random.default_rng(np.random.SeedSequence(
+            [self.seed] + [ord(c) for c in symbol]))
+
+    def fetch(self, symbol, start_date=None, end_date=None):
+        """
+        See DataProvider.fetch().
+        """
+        last_date = self.last_date
+        if last_date is None:
+            last_date = pd.Timestamp.today().strftime('%Y-%m-%d')
+        days = trading_calendar.nyse_calendar().trading_days(self.first_date,
+                                                             last_date)
+        num_days = len(days)
+
+        # Every symbol's whole history is generated, and then cut down to the
+        # dates asked for, so the prices don't depend on the dates.
+        rng = self.symbol_rng(symbol)
+        dt = 1 / 252
+        log_returns = (self.drift - self.volatility ** 2 / 2) * dt + \
+            self.volatility * np.sqrt(dt) * rng.standard_normal(num_days)
+        log_returns[0] = 0
+        close = self.start_price * np.exp(np.cumsum(log_returns))
+        open_ = np.empty(num_days)
+        open_[0] = self.start_price
+        open_[1:] = close[:-1]
+        spread = 1 + np.abs(rng.normal(0, self.volatility * np.sqrt(dt) / 2,
+                                       (2, num_days)))
+        high = np.maximum(open_, close) * spread[0]
+        low = np.minimum(open_, close) / spread[1]
+        volume = rng.integers(1000000, 10000000, num_days).astype(float)
+
+        df = pd.DataFrame({'High': high, 'Low': low, 'Open': open_,
+                           'Close': close, 'Volume': volume,
+                           'Adj Close': close},
+                          index=pd.DatetimeIndex(days.astype('M8[ns]'),
+                                                 name='Date'))
+        return df.loc[start_date:end_date, COLUMNS]
@@ -4,13 +4,11 @@ as obtaining data from yahoo finance, calculating sharpe ratios, finding the
 number of nyse trading days between two dates, and more.
 """
 import pandas as pd
-from pandas_datareader import data
 import numpy as np
 import statsmodels.api as sm
 import sys
-from pandas.tseries.offsets import CustomBusinessDay
-from pandas.tseries.holiday import get_calendar, HolidayCalendarFactory, \
-    GoodFriday
+import trading_calendar
+import data_providers
 import datetime
 import os
 from pytz import timezone
@@ -18,7 +16,7 @@ from pytz import timezone
 
 def load_financial_data(symbol, output_file=None,
                         start_date='1900-01-01', end_date=None,
-                        save=False):
+                        save=False, provider=None):
     """
     Returns a dataframe of all of the financial data from a given symbol from
     yahoo. Either obtains it locally or obtains it over the web, and then
@@ -31,11 +29,15 @@ def load_financial_data(symbol, output_file=None,
     :param end_date: Ending date in a string, e.g. '2018-01-01'.
     Defauls to none, where if none, data ends at the most recent trading day.
     :param save: Boolean; Whether to save the file or not. Defaults to False.
+    :param provider: Where the data is downloaded from if it isn't saved
+    locally (see data_providers.py). Defaults to a YahooProvider.
     :return: A dataframe of the financial information.
     """
     if output_file is None:
         # Default location to save files
         output_file = '../symbol_data/' + symbol + '.pkl'
+    if provider is None:
+        provider = data_providers.YahooProvider()
     try:
         # Try to read the file first, see what happens
         df = pd.read_pickle(output_file)
@@ -43,15 +45,12 @@ def load_financial_data(symbol, output_file=None,
     except (FileNotFoundError, ValueError):
         # In this case, we couldn't find the file to read it.
         try:
-            # Try to download the data from yahoo finance
+            # Try to download the data
             print('File not found...downloading the data')
-            df = data.DataReader(symbol, 'yahoo', start=start_date, end=end_date)
+            df = provider.fetch(symbol, start_date=start_date,
+                                end_date=end_date)
             if save:
-                if not os.path.isdir('../symbol_data'):
-                    # Make the folder symbol_data b/c it doesn't exist
-                    os.mkdir('../symbol_data')
-                df.to_pickle(output_file)
-                print('Data saved.')
+                save_financial_data(df, output_file)
         except KeyError as e:
             # In this case, there wasn't data found; there was a problem with
             # yahoo finance.
@@ -60,64 +59,356 @@ def load_financial_data(symbol, output_file=None,
     return df
 
 
-def compute_tangency(excess_return_df, diagonalize=False):
+def load_many_financial_data(symbols, start_date='1900-01-01', end_date=None,
+                             save=False, provider=None):
     """
-    Compute tangency portfolio given a set of excess returns.
-    Also, for convenience, this returns the associated vector of average
-    returns and the variance-covariance matrix.
-    :param excess_return_df: Pandas Dataframe of at least one column of excess
-    returns, but usually 2 or more.
-    It wouldn't make sense to call this function with only one column (one
-    asset), but there's a valid solution: just put 100% of the investment into
-    that asset. As such, no error is raised if there is only one column.
+    The same as load_financial_data, but for many symbols at once. Symbols
+    that are saved locally are read from their files, and the rest are all
+    downloaded together (see DataProvider.fetch_many). Symbols that can't be
+    downloaded are reported, rather than stopping the program.
+    :param symbols: A list of tickers, e.g. ['GOOG', 'AAPL']
+    :param start_date: Starting date in a string, e.g. '2001-01-01'
+    :param end_date: Ending date in a string, or None for the most recent
+    trading day.
+    :param save: Boolean; Whether to save the downloaded files or not.
+    :param provider: Where the data is downloaded from (see
+    data_providers.py). Defaults to a YahooProvider.
+    :return: A tuple (frames, errors) where frames is a dictionary
+    {'symbol1': dataframe1, ...} and errors is a dictionary
+    {'symbol2': 'what went wrong', ...} of the symbols that weren't found.
+    """
+    if provider is None:
+        provider = data_providers.YahooProvider()
+
+    frames = {}
+    to_download = []
+    for symbol in symbols:
+        try:
+            frames[symbol] = pd.read_pickle('../symbol_data/' + symbol + '.pkl')
+        except (FileNotFoundError, ValueError):
+            to_download.append(symbol)
+    print(len(frames), 'symbols found locally,', len(to_download),
+          'to download')
+
+    downloaded, errors = provider.fetch_many(to_download, start_date=start_date,
+                                             end_date=end_date)
+    for symbol in downloaded:
+        if save:
+            save_financial_data(downloaded[symbol],
+                                '../symbol_data/' + symbol + '.pkl')
+        frames[symbol] = downloaded[symbol]
+
+    if errors:
+        print("Couldn't download", len(errors), "symbols:")
+        for symbol in errors:
+            print('   ', symbol + ':', errors[symbol])
+    return frames, errors
+
+
+def save_financial_data(df, output_file):
+    """
+    Saves a symbol's dataframe as a pickle, making the folder it goes in if
+    it doesn't exist yet.
+    :param df: A dataframe of the financial information.
+    :param output_file: Where to save the file.
+    :return: Nothing.
+    """
+    folder = os.path.dirname(output_file)
+    if folder and not os.path.isdir(folder):
+        # Make the folder (e.g. symbol_data) b/c it doesn't exist
+        os.mkdir(folder)
+    df.to_pickle(output_file)
+    print('Data saved.')
+
+
+def pad_excess_returns(excess_returns):
+    """
+    Stacks a list of excess return matrices, which can each have a different
+    number of days and assets, into one 3-D array. The gaps are filled with
+    NaN, which compute_tangency_batch treats as missing data.
+    :param excess_returns: A list of 2-D numpy arrays (days x assets).
+    :return: A 3-D numpy array (portfolios x days x assets).
+    """
+    num_days = max(x.shape[0] for x in excess_returns)
+    num_assets = max(x.shape[1] for x in excess_returns)
+    res = np.full((len(excess_returns), num_days, num_assets), np.nan)
+    for i, x in enumerate(excess_returns):
+        res[i, :x.shape[0], :x.shape[1]] = x
+    return res
+
+
+def compute_tangency_batch(excess_returns, diagonalize=False):
+    """
+    Compute the tangency portfolio for many sets of excess returns at once,
+    e.g. one for every industry. All of the means, covariances and weights are
+    computed with stacked numpy operations, and the weights come from solving
+    Sigma * w = Mu_tilde instead of inverting Sigma.
+    Missing values (NaN) are skipped the same way pandas does: each mean uses
+    every day its asset has data, and each covariance uses every day both of
+    its assets have data. An asset with no data at all is treated as padding;
+    it gets a weight, mean, and covariance of 0.
+    :param excess_returns: Either a 3-D numpy array (portfolios x days x
+    assets), padded with NaN, or a list of 2-D numpy arrays (days x assets)
+    that can each be a different size.
     :param diagonalize: Boolean variable asking whether to diagonalize the
-    covariance matrix. This is defaulted to false.
+    covariance matrices. This is defaulted to false.
     :return:
-    1) Wts_tan: A Series with the index names corresponding to the column names
-    for excess_return_df, and the values corresponding to the optimal weight
-    for the tangency portfolio.
-    2) Mu_tilde: The mean return vector
-    3) Sigma: The Covariance matrix (following the desired diagonalization rule)
+    1) Wts_tan: A (portfolios x assets) array of the tangency weights.
+    2) Mu_tilde: A (portfolios x assets) array of the mean returns.
+    3) Sigma: A (portfolios x assets x assets) array of the covariance matrices
+    (following the desired diagonalization rule).
     """
-
-    Sigma = excess_return_df.cov()  # Covariance matrix.
+    if isinstance(excess_returns, (list, tuple)):
+        excess_returns = pad_excess_returns(excess_returns)
+    excess_returns = np.asarray(excess_returns, dtype=float)
+
+    mask = ~np.isnan(excess_returns)
+    mask_f = mask.astype(float)
+    counts = mask_f.sum(axis=1)  # Days of data for each asset
+    padding = counts == 0
+
+    # Mean return vectors.
+    Mu_tilde = np.where(mask, excess_returns, 0).sum(axis=1) / \
+        np.where(padding, 1, counts)
+
+    # Pairwise covariance matrices. Centering on the means first keeps the
+    # sums small; covariance doesn't depend on that shift.
+    centered = np.where(mask, excess_returns - Mu_tilde[:, None, :], 0)
+    centered_t = centered.transpose(0, 2, 1)
+    pair_counts = mask_f.transpose(0, 2, 1) @ mask_f
+    sum_xy = centered_t @ centered
+    sum_x = centered_t @ mask_f  # sum_x[i, j] = sum of x_i where j has data
+    with np.errstate(divide='ignore', invalid='ignore'):
+        Sigma = (sum_xy - sum_x * sum_x.transpose(0, 2, 1) / pair_counts) / \
+            (pair_counts - 1)
 
     if diagonalize:
         # Diagonalizing the matrix gets rid of information, but because this
         # equation involves a Sigma inverse, having data that is slightly wrong
         # compounds into results that are overfitted to the data. As such,
         # diagonalizing can remove that overfitting problem.
-        Sigma_D = np.diag(np.diag(Sigma))
-        Sigma = Sigma_D
+        Sigma = Sigma * np.eye(Sigma.shape[1])
+
+    return tangency_weights(Mu_tilde, Sigma, padding)
+
+
+def tangency_weights(Mu_tilde, Sigma, padding=None):
+    """
+    Solves for the tangency weights of many portfolios at once, when their
+    mean return vectors and covariance matrices are already known.
+    :param Mu_tilde: A (... x assets) array of the mean returns. Any number of
+    leading dimensions can be used, e.g. (trials x industries x assets).
+    :param Sigma: A (... x assets x assets) array of the covariance matrices.
+    :param padding: A (... x assets) boolean array of which assets are only
+    padding (and so should get a weight of 0), or None if none of them are.
+    :return:
+    1) Wts_tan: A (... x assets) array of the tangency weights.
+    2) Mu_tilde: The mean returns, with the padding set to 0.
+    3) Sigma: The covariance matrices, with the padding set to 0.
+    """
+    if padding is None:
+        padding = np.zeros(Mu_tilde.shape, dtype=bool)
 
-    # n is the number of assets
-    n = Sigma.shape[0]  # Shape returns height and width, so we only want one.
+    # Padded assets get an identity row and column so that Sigma stays
+    # solvable, and a mean of 0 so that their weight comes out as 0.
+    pad_pairs = padding[..., :, None] | padding[..., None, :]
+    Sigma = np.where(pad_pairs, 0, Sigma)
+    Mu_tilde = np.where(padding, 0, Mu_tilde)
+    solvable = Sigma + padding[..., :, None] * np.eye(Sigma.shape[-1])
 
-    Mu_tilde = excess_return_df.mean()  # Mean return vector.
-    sigma_inv = np.linalg.inv(Sigma)  # Inverts the covariance matrix.
-    # Normalize the matrix so that it all adds up to one.
-    weights = sigma_inv @ Mu_tilde / (np.ones(n) @ sigma_inv @ Mu_tilde)
-    # Matrix multiplication with python uses the @ symbol.
-    # For convenience we wrap the solution back into a pandas.Series object.
-    Wts_tan1 = pd.Series(weights, index=Mu_tilde.index)
+    # Normalize the weights so that they all add up to one.
+    weights = np.linalg.solve(solvable, Mu_tilde[..., None])[..., 0]
+    weights = weights / weights.sum(axis=-1, keepdims=True)
 
     # We don't know whether this is the local minimum or local maximum right
-    # now. As such, we need to multiply the tangency weights by -1 and
-    # calculate + compare both sharpe ratios of the tangency weights.
-    # The portfolio with the higher sharpe ratio is the local maximum, and
-    # the portfolio with the lower sharpe ratio is the local minimum.
+    # now. Flipping the sign of the weights flips the sign of the sharpe
+    # ratio, so the local maximum is whichever of the two has a positive
+    # mean return.
+    flip = ~((weights * Mu_tilde).sum(axis=-1) > 0)
+    weights[flip] *= -1
+
+    return weights, Mu_tilde, Sigma
 
-    Wts_tan2 = Wts_tan1 * -1
 
-    sharpe_ratio1 = get_annualized_sharpe_ratio_wts(Wts_tan1, Mu_tilde, Sigma)
-    sharpe_ratio2 = get_annualized_sharpe_ratio_wts(Wts_tan2, Mu_tilde, Sigma)
+def compute_tangencies(excess_return_dfs, diagonalize=False):
+    """
+    Compute the tangency portfolio for each of several dataframes of excess
+    returns (e.g. one per industry) with a single call to
+    compute_tangency_batch.
+    :param excess_return_dfs: A dictionary {'name1': dataframe1, ...} where
+    each dataframe holds a column of excess returns per asset.
+    :param diagonalize: Boolean variable asking whether to diagonalize the
+    covariance matrices. This is defaulted to false.
+    :return: A dictionary {'name1': (Wts_tan, Mu_tilde, Sigma), ...}, where each
+    tuple looks like what compute_tangency returns.
+    """
+    names = list(excess_return_dfs)
+    dfs = [excess_return_dfs[name] for name in names]
+    weights, mu, sigma = compute_tangency_batch(
+        [df.to_numpy(dtype=float) for df in dfs], diagonalize=diagonalize)
+
+    res = {}
+    for i, (name, df) in enumerate(zip(names, dfs)):
+        n = df.shape[1]
+        Wts_tan = pd.Series(weights[i, :n], index=df.columns)
+        Mu_tilde = pd.Series(mu[i, :n], index=df.columns)
+        if diagonalize:
+            Sigma = sigma[i, :n, :n]
+        else:
+            Sigma = pd.DataFrame(sigma[i, :n, :n], index=df.columns,
+                                 columns=df.columns)
+        res[name] = (Wts_tan, Mu_tilde, Sigma)
+    return res
 
-    if sharpe_ratio1 > sharpe_ratio2:
-        Wts_tan = Wts_tan1
-    else:
-        Wts_tan = Wts_tan2
 
-    return Wts_tan, Mu_tilde, Sigma
+def compute_tangency(excess_return_df, diagonalize=False):
+    """
+    Compute tangency portfolio given a set of excess returns.
+    Also, for convenience, this returns the associated vector of average
+    returns and the variance-covariance matrix.
+    This is compute_tangency_batch with a batch of one.
+    :param excess_return_df: Pandas Dataframe of at least one column of excess
+    returns, but usually 2 or more. This can also be a RollingCovariance that
+    the excess returns have been added to, in which case its mean and
+    covariance are used as they are, without going through every day again.
+    It wouldn't make sense to call this function with only one column (one
+    asset), but there's a valid solution: just put 100% of the investment into
+    that asset. As such, no error is raised if there is only one column.
+    :param diagonalize: Boolean variable asking whether to diagonalize the
+    covariance matrix. This is defaulted to false.
+    :return:
+    1) Wts_tan: A Series with the index names corresponding to the column names
+    for excess_return_df, and the values corresponding to the optimal weight
+    for the tangency portfolio.
+    2) Mu_tilde: The mean return vector
+    3) Sigma: The Covariance matrix (following the desired diagonalization rule)
+    """
+    if isinstance(excess_return_df, RollingCovariance):
+        moments = excess_return_df
+        Sigma = moments.covariance
+        if diagonalize:
+            Sigma = np.diag(np.diag(Sigma))
+        weights, mu, sigma = tangency_weights(moments.mean, Sigma)
+        Wts_tan = pd.Series(weights, index=moments.names)
+        Mu_tilde = pd.Series(mu, index=moments.names)
+        if not diagonalize:
+            sigma = pd.DataFrame(sigma, index=moments.names,
+                                 columns=moments.names)
+        return Wts_tan, Mu_tilde, sigma
+    return compute_tangencies({0: excess_return_df}, diagonalize=diagonalize)[0]
+
+
+class RollingCovariance:
+    """
+    Keeps the mean and covariance of a stream of excess return vectors (one
+    per day) up to date as days are added to or removed from the window,
+    instead of recomputing them from every day in the window. Adding or
+    removing a day is a rank-one (Welford) update of the covariance, so it
+    costs O(assets^2) no matter how long the window is. Several days can also
+    be added or removed at once, by merging their own mean and covariance in.
+    It can also weigh days exponentially (give it a halflife), in which case
+    every day added makes the older ones count for less, the same as pandas'
+    ewm(halflife=...).mean() and .cov(). Days can't be removed in that mode.
+    Days can't have missing values (NaN).
+    compute_tangency accepts one of these in place of a dataframe.
+    """
+    def __init__(self, num_assets, names=None, halflife=None):
+        """
+        Initialize the class variables
+        :param num_assets: Int; the number of assets in each return vector.
+        :param names: A list of the assets' names (e.g. symbols), used to
+        label the results of compute_tangency. Defaults to 0, 1, 2, ...
+        :param halflife: Float (or None); if given, the number of days it
+        takes for a day's weight to halve. None weighs every day the same.
+        """
+        self.num_assets = num_assets
+        self.names = list(range(num_assets)) if names is None else list(names)
+        self.halflife = halflife
+        # How much the older days' weight shrinks each time a day is added.
+        self.decay = 1.0 if halflife is None else 0.5 ** (1 / halflife)
+        self.count = 0  # How many days are in the window
+        self.weight = 0.0  # Sum of the days' weights (count if not ewm)
+        self.weight_sq = 0.0  # Sum of the days' squared weights
+        self.mean = np.zeros(num_assets)  # Mean return of each asset
+        # Weighted sum of the outer products of each day's deviation from the
+        # mean; see covariance.
+        self.m2 = np.zeros((num_assets, num_assets))
+
+    def add(self, returns):
+        """
+        Adds days to the window.
+        :param returns: A numpy array of one day's returns (assets), or of
+        several days' returns (days x assets), oldest first.
+        :return: Nothing.
+        """
+        returns = np.atleast_2d(np.asarray(returns, dtype=float))
+        k = returns.shape[0]
+        if k == 0:
+            return
+        if self.halflife is not None:
+            # Each day shrinks the weight of everything before it, so they're
+            # added one at a time.
+            for day in returns:
+                self.weight = self.decay * self.weight + 1
+                self.weight_sq = self.decay ** 2 * self.weight_sq + 1
+                delta = day - self.mean
+                self.mean = self.mean + delta / self.weight
+                self.m2 = self.decay * self.m2 + \
+                    np.outer(delta, day - self.mean)
+            self.count += k
+            return
+
+        block_mean = returns.mean(axis=0)
+        centered = returns - block_mean
+        n = self.count + k
+        delta = block_mean - self.mean
+        self.mean = self.mean + delta * (k / n)
+        self.m2 = self.m2 + centered.T @ centered + \
+            np.outer(delta, delta) * (self.count * k / n)
+        self.count = n
+        self.weight = self.weight_sq = float(n)
+
+    def remove(self, returns):
+        """
+        Removes days that were added before from the window, e.g. the oldest
+        days of a rolling window.
+        :param returns: A numpy array of one day's returns (assets), or of
+        several days' returns (days x assets).
+        :return: Nothing.
+        """
+        if self.halflife is not None:
+            raise ValueError("Days can't be removed from an exponentially "
+                             "weighted RollingCovariance")
+        returns = np.atleast_2d(np.asarray(returns, dtype=float))
+        k = returns.shape[0]
+        if k == 0:
+            return
+        if k >= self.count:
+            # Everything is removed; start over.
+            self.count = 0
+            self.weight = self.weight_sq = 0.0
+            self.mean = np.zeros(self.num_assets)
+            self.m2 = np.zeros((self.num_assets, self.num_assets))
+            return
+        block_mean = returns.mean(axis=0)
+        centered = returns - block_mean
+        n = self.count - k
+        mean = (self.mean * self.count - block_mean * k) / n
+        delta = block_mean - mean
+        self.m2 = self.m2 - centered.T @ centered - \
+            np.outer(delta, delta) * (n * k / self.count)
+        self.mean = mean
+        self.count = n
+        self.weight = self.weight_sq = float(n)
+
+    @property
+    def covariance(self):
+        """
+        :return: The (assets x assets) sample covariance matrix of the days in
+        the window, the same as pandas' cov() (or ewm().cov()) would give.
+        """
+        # With equal weights this is m2 / (count - 1).
+        return self.m2 * self.weight / (self.weight ** 2 - self.weight_sq)
 
 
 def daily_returns(df, column_name):
@@ -255,7 +546,7 @@ def backtester_summary(bt):
     :return: A dictionary containing the annualized sharpe ratio, the initial
     investment amount, and the profit.
     """
-    annualized_sharpe_ratio = get_annualized_sharpe_ratio_df(bt.historical_data)
+    annualized_sharpe_ratio = get_annualized_sharpe_ratio_df(bt.results)
     initial_investment = round(bt.list_total[0], 2)
     profit = bt.list_total[-1] - initial_investment
 
@@ -266,32 +557,75 @@ def backtester_summary(bt):
     return summary
 
 
-def regression_analysis(regressand_df, regressor_df):
+def regression_analysis(regressand_df, regressor_df, method='numpy'):
     """
-    Computes a regression analysis.
+    Computes a regression analysis of every regressand (e.g. the excess
+    returns of many portfolios) against the regressor's excess returns.
+    By default every regression is solved at once with the closed-form least
+    squares formulas, using masks to skip the days where either side is
+    missing (NaN), which is what statsmodels does with missing='drop'.
     :param regressand_df: A dataframe holding all regressands for the
     desired regression analysis
     :param regressor_df: A dataframe holding all regressors for the desired
     regression analysis
+    :param method: String; 'numpy' for the batched closed-form regressions, or
+    'statsmodels' to fit a statsmodels OLS for each regressand, which is much
+    slower but handy for checking the results against its full diagnostics.
+    Default is 'numpy'.
     :return: A pandas dataframe holding the summary of each regression analysis.
     The summary contains the alpha, beta, r-squared, treynor's ratio, and
     information ratio.
     """
     regressand = regressand_df.columns
-    X = sm.add_constant(regressor_df['Excess Return'])
-    stats = []
-    for y in regressand:
-        y = regressand_df[y]
-        res = sm.OLS(y, X, missing='drop').fit()
-        alpha, beta = res.params
-        r_squared = res.rsquared
-        treynor_ratio = y.mean() / beta
-        information_ratio = alpha / res.resid.std()
-        stats.append([alpha, beta, r_squared, treynor_ratio, information_ratio])
-    summary = pd.DataFrame(stats, index=regressand,
-                           columns=['Alpha', 'Beta', 'R-Squared',
-                                    "Treynor's Ratio", 'Information Ratio'])
-    return summary
+    columns = ['Alpha', 'Beta', 'R-Squared', "Treynor's Ratio",
+               'Information Ratio']
+
+    if method == 'statsmodels':
+        X = sm.add_constant(regressor_df['Excess Return'])
+        stats = []
+        for y in regressand:
+            y = regressand_df[y]
+            res = sm.OLS(y, X, missing='drop').fit()
+            alpha, beta = res.params
+            r_squared = res.rsquared
+            treynor_ratio = y.mean() / beta
+            information_ratio = alpha / res.resid.std()
+            stats.append([alpha, beta, r_squared, treynor_ratio,
+                          information_ratio])
+        return pd.DataFrame(stats, index=regressand, columns=columns)
+
+    # (days x regressands) matrix Y, and the regressor x lined up with it.
+    Y = regressand_df.to_numpy(dtype=float)
+    x = regressor_df['Excess Return'].reindex(regressand_df.index).to_numpy(
+        dtype=float)[:, None]
+
+    # Only the days where both sides have data are used in each regression.
+    mask = ~np.isnan(Y) & ~np.isnan(x)
+    counts = mask.sum(axis=0)
+    Y_masked = np.where(mask, Y, 0)
+    x_masked = np.where(mask, x, 0)
+    x_mean = x_masked.sum(axis=0) / counts
+    y_mean = Y_masked.sum(axis=0) / counts
+    x_centered = np.where(mask, x - x_mean, 0)
+    y_centered = np.where(mask, Y - y_mean, 0)
+
+    beta = (x_centered * y_centered).sum(axis=0) / \
+        (x_centered ** 2).sum(axis=0)
+    alpha = y_mean - beta * x_mean
+
+    resid = np.where(mask, y_centered - beta * x_centered, 0)
+    ssr = (resid ** 2).sum(axis=0)  # Sum of squared residuals
+    sst = (y_centered ** 2).sum(axis=0)  # Total sum of squares
+    r_squared = 1 - ssr / sst
+
+    # Like pandas' mean() and std(), the treynor's ratio uses every day the
+    # regressand has data, and the residuals' std divides by (days - 1).
+    treynor_ratio = np.nanmean(Y, axis=0) / beta
+    information_ratio = alpha / np.sqrt(ssr / (counts - 1))
+
+    return pd.DataFrame(np.column_stack([alpha, beta, r_squared,
+                                         treynor_ratio, information_ratio]),
+                        index=regressand, columns=columns)
 
 
 def num_nyse_trading_days(start_date, end_date):
@@ -305,17 +639,8 @@ def num_nyse_trading_days(start_date, end_date):
     :return: Int; the number of trading days between the two dates.
     """
     """
-    Solution for number of trading days found on two stackoverflow posts:
-    https://stackoverflow.com/questions/44822697/business-days-between-two-dates-excluding-holidays-in-python
-    https://stackoverflow.com/questions/33094297/create-trading-holiday-calendar-with-pandas
-    This code isn't perfect because it is directly modifying the USFederal...
-    calendar. As in, if I wanted to use it again, I'd have to add back in
-    Veteran's Day and Columbus day (that's why I only remove them once).
-    To be honest I spent an obnoxious amount of time on this function, trying
-    to figure out how to calculate the number of nyse trading days between
-    two dates (not just business days, as that's a different question), and
-    ultimately I just wanted a solution that would work, even if it was a
-    solution that is modifying code I shouldn't be editing. 
+    The NYSE calendar (see trading_calendar.py) is only built the first time
+    it's needed, after which each call is a pair of binary searches.
     """
 
     if end_date is None:
@@ -332,29 +657,8 @@ def num_nyse_trading_days(start_date, end_date):
             # Else the difference is the current date minus the start date.
             end_date = datetime.datetime.now(tz).strftime("%Y-%m-%d")
 
-    cal = get_calendar('USFederalHolidayCalendar')  # Create calendar
-    if len(cal.rules) == 10:
-        # If there are 10 rules, then we know we haven't modified this calendar
-        # yet.
-        # We need to modify this calendar because Veteran's Day and Columbus
-        # Day are both trading days.
-        cal.rules.pop(7)  # Remove Veteran's Day rule
-        cal.rules.pop(6)  # Remove Columbus Day rule
-    # Create the calendar from the rules we have.
-    tradingCal = HolidayCalendarFactory('TradingCalendar', cal, GoodFriday)
-    trading_days = CustomBusinessDay(calendar=tradingCal())
-    calendar = pd.date_range(start=start_date, end=end_date,
-                             freq=trading_days).to_pydatetime()
-
-    res = len(calendar)
-    if datetime.datetime(2018, 12, 5) in calendar:
-        # In this case, we need to subtract one because the nyse closed
-        # on december 5th, 2018, to mourn George H.W. Bush's death.
-        res -= 1
-        # Not an elegant solution, but I wasn't sure how else to do it and
-        # it seems pretty effective for the days that I'm working with.
-
-    return res
+    return trading_calendar.nyse_calendar().num_trading_days(start_date,
+                                                             end_date)
 
 
 # if __name__ == '__main__':
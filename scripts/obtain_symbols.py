@@ -5,52 +5,157 @@ wikipedia), randomizing which symbols to pick for the portfolio, downloading
 symbol data locally, etc.
 """
 import pandas as pd
-import random
+import numpy as np
 import sys
 import os
+import datetime
 import finlib
+import price_store
 
 pd.set_option('display.max_columns', 500)
 
 
-def organize_symbols(testing=False):
+# Where the snapshots of the S&P 500's constituents are saved. Each snapshot is
+# a csv named after the date it was taken, e.g. 'sp500_2020-08-01.csv'.
+CONSTITUENTS_PATH = '../constituents/'
+
+# The end of the version of a snapshot that wasn't downloaded from wikipedia,
+# but pieced back together from the symbols earlier trials used (see
+# constituents/README.md). Those don't know when each symbol was added.
+RECONSTRUCTED_SUFFIX = '-reconstructed'
+WIKIPEDIA_URL = 'https://en.wikipedia.org/wiki/List_of_S%26P_500_companies'
+
+# These stocks don't have full info on yahoo finance, so let's get rid of them
+# now so that we don't think we can use them.
+BAD_STOCKS = ['FOX', 'FOXA', 'TT']
+
+# Snapshots and sector indexes that have already been loaded in this process,
+# keyed by the snapshot's version (and, for sector indexes, keep_undated).
+_constituents_cache = {}
+_sector_index_cache = {}
+
+
+def save_constituents_snapshot(path=CONSTITUENTS_PATH):
+    """
+    Downloads the current list of S&P 500 constituents from wikipedia and saves
+    the columns this project uses (symbol, GICS sector, and the date it was
+    first added) as a new snapshot.
+    :param path: String; the folder to save the snapshot into.
+    :return: String; the version (date) of the new snapshot.
+    """
+    print("Reading wikipedia")
+    table = pd.read_html(WIKIPEDIA_URL)
+    df = table[0][['Symbol', 'GICS Sector', 'Date first added']]
+
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    version = datetime.date.today().strftime('%Y-%m-%d')
+    df.to_csv(os.path.join(path, 'sp500_' + version + '.csv'), index=False)
+    return version
+
+
+def constituents_versions(path=CONSTITUENTS_PATH):
+    """
+    :param path: String; the folder the snapshots are saved in.
+    :return: A sorted list of the versions (dates) of every saved snapshot.
+    """
+    if not os.path.isdir(path):
+        return []
+    return sorted(file[len('sp500_'):-len('.csv')] for file in os.listdir(path)
+                  if file.startswith('sp500_') and file.endswith('.csv'))
+
+
+def latest_constituents_version(path=CONSTITUENTS_PATH):
+    """
+    :param path: String; the folder the snapshots are saved in.
+    :return: String; the version of the latest snapshot. If there aren't any
+    snapshots yet, a new one is downloaded from wikipedia first.
+    """
+    versions = constituents_versions(path)
+    return versions[-1] if versions else save_constituents_snapshot(path)
+
+
+def load_constituents(version=None, path=CONSTITUENTS_PATH):
+    """
+    Loads a snapshot of the S&P 500's constituents. Each snapshot is only read
+    from disk once per process. If there aren't any snapshots yet, a new one is
+    downloaded from wikipedia first.
+    :param version: String; the date of the snapshot to load, e.g.
+    '2020-08-01'. If None, the latest snapshot is used.
+    :param path: String; the folder the snapshots are saved in.
+    :return: A dataframe with the columns 'Symbol', 'GICS Sector' and
+    'Date first added'.
+    """
+    if version is None:
+        version = latest_constituents_version(path)
+
+    key = (path, version)
+    if key not in _constituents_cache:
+        file_path = os.path.join(path, 'sp500_' + version + '.csv')
+        if not os.path.exists(file_path):
+            sys.exit("No S&P 500 snapshot found for version " + version)
+        _constituents_cache[key] = pd.read_csv(file_path)
+    return _constituents_cache[key]
+
+
+def sector_index(version=None, path=CONSTITUENTS_PATH, keep_undated=None):
+    """
+    Organizes a snapshot of the S&P 500 by GICS sector. This is only worked out
+    once per snapshot per process.
+    :param version: String; the snapshot to use (see load_constituents).
+    :param path: String; the folder the snapshots are saved in.
+    :param keep_undated: Boolean; whether stocks without a date added are
+    kept. If None, they're only kept for reconstructed snapshots (see
+    RECONSTRUCTED_SUFFIX), whose stocks all had a date before 2016 when they
+    were picked but don't have it saved.
+    :return: A dictionary {'sector1': ['sym1', 'sym2', ...], ...}, with each
+    sector's symbols in the order of the snapshot.
+    """
+    if version is None:
+        version = latest_constituents_version(path)
+    if keep_undated is None:
+        keep_undated = version.endswith(RECONSTRUCTED_SUFFIX)
+
+    key = (path, version, keep_undated)
+    if key not in _sector_index_cache:
+        df = load_constituents(version, path)
+        symbols = df['Symbol'].str.replace('.', '-', regex=False)  # Yahoo
+        # finance uses dashes
+
+        # Only want stocks that at least have info past 2016. While this does
+        # get rid of some stocks that have info past 2016 (this is their date
+        # added into the s&p 500), this is good enough for this project.
+        # Stocks without a date added are also left out, unless told to keep
+        # them.
+        year_added = pd.to_numeric(
+            df['Date first added'].astype(str).str[:4], errors='coerce')
+        keep = ~symbols.isin(BAD_STOCKS) & (
+            (year_added < 2016) | (keep_undated & year_added.isna()))
+
+        stock_sectors = {}
+        for sector, group in symbols[keep].groupby(df['GICS Sector'][keep],
+                                                   sort=False):
+            stock_sectors[sector] = group.tolist()
+        _sector_index_cache[key] = stock_sectors
+    return _sector_index_cache[key]
+
+
+def organize_symbols(testing=False, version=None):
     """
     Gets all stocks in the s&p500, and organizes them by GICS sector.
     :param testing: A boolean variable that, if true, cuts the number of
     industries gathered from 11 to 2. This greatly speeds up testing so that
     latter parts of the code can be reached sooner.
+    :param version: String; the snapshot of the s&p500 to use (see
+    load_constituents). If None, the latest snapshot is used.
     :return: Dictionary where the key is the sector, and the value is a
     list of all symbols in that industry in the s&p500.
     """
-    print("Reading wikipedia")  # Vann: Make this local.
-    table = pd.read_html(
-        'https://en.wikipedia.org/wiki/List_of_S%26P_500_companies')
-    df = table[0]
-
-    stock_sectors = {}  # Holds stocks split up by GICS sectors
-    for index, row in df.iterrows():
-        # These stocks don't have full info on yahoo finance, so let's get rid
-        # of them now so that we don't think we can use them.
-        bad_stocks = ['FOX', 'FOXA', 'TT']
-        symbol = row['Symbol'].replace('.', '-')  # Yahoo finance uses dashes
-        if symbol in bad_stocks:
-            continue
-
-        date_added = row['Date first added']
-
-        # Only have information on date if it is a string.
-        if isinstance(date_added, str) and int(date_added[:4]) < 2016:
-            # Only want stocks that at least have info past 2016. While this
-            # does get rid of some stocks that have info past 2016 (this is
-            # their date added into the s&p 500), this is good enough for this
-            # project.
-
-            sector = row['GICS Sector']
+    stock_sectors = sector_index(version)
 
-            if sector not in stock_sectors:
-                stock_sectors[sector] = [symbol]
-            else:
-                stock_sectors[sector].append(symbol)
+    # Copies of the lists, so that changing them doesn't change the index.
+    stock_sectors = {sector: list(stock_sectors[sector])
+                     for sector in stock_sectors}
 
     if testing is True:
         # In this case, we cut out 9 of the GICS sectors because we want to
@@ -62,32 +167,106 @@ def organize_symbols(testing=False):
     return stock_sectors
 
 
-def get_random_symbols(dict_of_symbols, num_symbols):
+def sample_portfolios(dict_of_symbols, num_symbols, num_trials=1,
+                      seed=None):
+    """
+    Randomly picks num_symbols symbols in each GICS industry for many
+    portfolios at once. Each portfolio is a row of indexes into the lists in
+    dict_of_symbols.
+    :param dict_of_symbols: Dictionary where the key is the sector, and the
+    value is a list of all symbols in that industry in the s&p500.
+    This is the result of organize_symbols().
+    :param num_symbols: Number of symbols to get per industry.
+    :param num_trials: Number of portfolios to pick.
+    :param seed: What the random picks come from. This can be:
+    -- A list of ints, one per portfolio. Each portfolio only depends on its
+    own seed, so any one of them can be picked again on its own later by
+    passing [its seed] (this is what get_random_symbols does).
+    -- An int or a numpy Generator, which all of the portfolios are picked
+    from together.
+    -- None, in which case the picks aren't reproducible.
+    :return: A numpy int array shaped (num_trials x sectors x num_symbols),
+    where sectors are in the order of dict_of_symbols. Industries with
+    fewer than num_symbols symbols use all of them, and the rest of their row
+    is filled with -1.
+    """
+    sectors = list(dict_of_symbols)
+    sizes = np.array([len(dict_of_symbols[sector]) for sector in sectors])
+    max_size = int(sizes.max()) if len(sizes) else 0
+    shape = (len(sectors), max_size)
+
+    # Every symbol gets a random key, and the symbols with the smallest keys
+    # are the ones picked.
+    if isinstance(seed, (list, tuple, np.ndarray)):
+        if len(seed) != num_trials:
+            sys.exit("Need one seed per portfolio: got " + str(len(seed)) +
+                     " seeds for " + str(num_trials) + " portfolios")
+        keys = np.stack([np.random.default_rng(trial_seed).random(shape)
+                         for trial_seed in seed]) if num_trials else \
+            np.empty((0,) + shape)
+    else:
+        rng = seed if isinstance(seed, np.random.Generator) else \
+            np.random.default_rng(seed)
+        keys = rng.random((num_trials,) + shape)
+
+    # Spots past the end of a sector's list are never picked, and sectors
+    # that don't have more than num_symbols symbols use all of them in order.
+    position = np.arange(max_size)
+    keys[:, position[None, :] >= sizes[:, None]] = np.inf
+    keys[:, sizes <= num_symbols, :] = position
+    picks = np.argsort(keys, axis=2, kind='stable')[:, :, :num_symbols]
+    picks = picks.astype(np.int64)
+    picks[picks >= sizes[None, :, None]] = -1
+    if picks.shape[2] < num_symbols:
+        # Every sector has fewer than num_symbols symbols.
+        padding = np.full(picks.shape[:2] + (num_symbols - picks.shape[2],),
+                          -1, dtype=np.int64)
+        picks = np.concatenate([picks, padding], axis=2)
+    return picks
+
+
+def portfolio_symbols(dict_of_symbols, picks):
+    """
+    Turns one portfolio picked by sample_portfolios back into symbols.
+    :param dict_of_symbols: The same dictionary given to sample_portfolios.
+    :param picks: A (sectors x num_symbols) numpy array; one row of the
+    result of sample_portfolios.
+    :return: A dictionary where the key is the sector, and the value is a list
+    of the symbols picked in that sector.
+    """
+    res = {}
+    for sector, sector_picks in zip(dict_of_symbols, picks):
+        symbols = dict_of_symbols[sector]
+        res[sector] = [symbols[i] for i in sector_picks if i >= 0]
+    return res
+
+
+def get_random_symbols(dict_of_symbols, num_symbols, seed=None):
     """
     Randomly picks num_symbols symbols from the s&p 500 in each GICS industry.
     :param dict_of_symbols: Dictionary where the key is the sector, and the
     value is a list of all symbols in that industry in the s&p500.
     This is the result of organize_symbols().
     :param num_symbols: Number of symbols to get per industry.
+    :param seed: Int (or None); seeds the random picks so that the same
+    symbols are picked every time with the same seed. This is the same as
+    the portfolio picked with this seed by sample_portfolios. If None, the
+    picks aren't reproducible.
     :return: A dictionary where the key is the sector, and the value is a list
     of 10 randomly chosen symbols from the list in dict_of_symbols.
     """
-    res = {}
-    for industry in dict_of_symbols:
-        symbols = dict_of_symbols[industry]
-        try:
-            num_symbols_per_industry = num_symbols
-            res[industry] = random.sample(symbols, num_symbols_per_industry)
-        except ValueError:
-            # There were less than 10 symbols in the list. Just set the result
-            # as the full list.
-            res[industry] = symbols
+    if seed is not None and not isinstance(seed, np.random.Generator):
+        seed = [seed]
+    picks = sample_portfolios(dict_of_symbols, num_symbols, num_trials=1,
+                              seed=seed)
+    res = portfolio_symbols(dict_of_symbols, picks[0])
+    for industry in res:
         print(industry + ":", res[industry])
 
     return res
 
 
-def new_symbol(bad_symbol, industry, symbol_list):
+def new_symbol(bad_symbol, industry, symbol_list, version=None):
     """
     Finds a new symbol that follows the following parameters:
     1) Is not 'bad_symbol'
@@ -99,15 +278,22 @@ def new_symbol(bad_symbol, industry, symbol_list):
     used to indent into the dictionary 'stock_sectors'
     :param symbol_list: List of strings; lists all symbols that should not
     be obtained from the total list of symbols in the above industry.
-    :return: String; the name of the new symbol
+    :param version: String; the snapshot of the s&p500 to use (see
+    load_constituents). If None, the latest snapshot is used.
+    :return: String; the name of the new symbol, or None if every symbol in
+    the industry is already being used.
     """
-    stock_sectors = organize_symbols()
-    for symbol in stock_sectors[industry]:
-        if symbol != bad_symbol and (symbol not in symbol_list):
+    used = set(symbol_list)
+    used.add(bad_symbol)
+    # The first one in the sector's list, same as always. The list is only
+    # looked at up to there, which is rarely past len(symbol_list) symbols.
+    for symbol in sector_index(version)[industry]:
+        if symbol not in used:
             return symbol
+    return None
 
 
-def obtain_symbols(num_symbols, testing=False):
+def obtain_symbols(num_symbols, testing=False, seed=None, version=None):
     """
     Organizational function; obtains a list of 10 symbols for each GICS industry
     from the S&P 500.
@@ -115,40 +301,55 @@ def obtain_symbols(num_symbols, testing=False):
     :param testing: A boolean variable that, if true, cuts the number of
     industries gathered from 11 to 2. This greatly speeds up testing so that
     latter parts of the code can be reached sooner.
+    :param seed: Int (or None); seeds the random picks (see
+    get_random_symbols).
+    :param version: String; the snapshot of the s&p500 to pick from (see
+    load_constituents). If None, the latest snapshot is used.
     :return: A dictionary where the key is the sector, and the value is a list
     of 10 randomly chosen symbols.
     """
-    dict_of_symbols = organize_symbols(testing=testing)
-    symbols = get_random_symbols(dict_of_symbols, num_symbols)
+    dict_of_symbols = organize_symbols(testing=testing, version=version)
+    symbols = get_random_symbols(dict_of_symbols, num_symbols, seed=seed)
     return symbols
 
 
-def download_sp500_symbols(delete=False):
+def download_sp500_symbols(delete=False, build_store=True, provider=None):
     """
     A helper function that is used to download historical symbol data pertaining
     to the S&P 500 from 2015 until now. Saves all files as a .pkl file.
     Doesn't download files that are already saved locally.
     :param delete: Boolean; whether or not to delete all symbol data files
     that are currently saved locally. Defaults to false.
-    :return: Nothing.
+    :param build_store: Boolean; whether to also save every symbol's data into
+    the columnar price store (see price_store.py) in one go. Defaults to True.
+    :param provider: Where the data is downloaded from (see
+    data_providers.py). Defaults to a YahooProvider.
+    :return: A dictionary {'symbol1': 'what went wrong', ...} of the symbols
+    that couldn't be downloaded.
     """
     if delete:
         # We want to delete all files in the path's folder, maybe because
         # something messed up so we just want to start over again.
         path = '../symbol_data/'
         for file in os.listdir(path):
-            os.remove(path + file)
+            if os.path.isfile(path + file):
+                os.remove(path + file)
 
-    # Let's now download all symbols that we don't have yet.
+    # Let's now download all symbols that we don't have yet, all at once.
     stock_sectors = organize_symbols()
-    for industry in stock_sectors:
-        for symbol in stock_sectors[industry]:
-            print('Downloading', symbol)
-            finlib.load_financial_data(symbol, start_date='2015-01-01',
-                                       end_date=None, save=True)
-    print('Downloading SPY')
-    finlib.load_financial_data('SPY', start_date='2015-01-01', end_date=None,
-                               save=True)
+    symbols = [symbol for industry in stock_sectors
+               for symbol in stock_sectors[industry]] + ['SPY']
+    print('Downloading', len(symbols), 'symbols')
+    frames, errors = finlib.load_many_financial_data(
+        symbols, start_date='2015-01-01', end_date=None, save=True,
+        provider=provider)
+
+    if build_store:
+        # The store is rebuilt from scratch so that every symbol shares the
+        # same date axis.
+        print('Building price store')
+        price_store.PriceStore().write(frames)
+    return errors
 
 
 if __name__ == '__main__':
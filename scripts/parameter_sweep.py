@@ -0,0 +1,207 @@
+"""
+This file sweeps the moving average backtesters (MACD and SMA) over a grid of
+(short period, long period) pairs for a symbol, all in one pass. Every moving
+average the grid needs is computed once as a row of a 2-D array, every pair's
+buy/sell signal comes from subtracting two of those rows, and every pair's
+daily returns and sharpe ratio are computed together.
+The sharpe ratio is the same measure finlib.tangency_summary uses. Like MACD
+and SMA, every pair buys as many whole shares as its cash allows, so a pair's
+sharpe ratio and profit are the ones its backtester would get.
+"""
+import backtesters
+import pandas as pd
+import numpy as np
+
+
+# Default grid: every pair of these where short < long is swept.
+SHORT_PERIODS = range(2, 31, 2)
+LONG_PERIODS = range(10, 201, 10)
+
+# How each strategy is named, matching the backtesters in backtesters.py.
+STRATEGY_NAMES = {'MACD': 'MACD (%d, %d)',
+                  'SMA': 'Simple Moving Avg (%d, %d)'}
+
+
+def ema_matrix(prices, periods):
+    """
+    Computes the exponential moving average of prices for several periods,
+    exactly the way the MACD backtester does.
+    :param prices: Numpy array of adjusted closing prices.
+    :param periods: A list of ints; the periods to compute.
+    :return: A (periods x days) numpy array.
+    """
+    return np.vstack([backtesters.ema(prices, period) for period in periods])
+
+
+def sma_matrix(prices, periods):
+    """
+    Computes the simple moving average of prices for several periods, the way
+    the SMA backtester does (the window holds every price so far until it is
+    period days long).
+    :param prices: Numpy array of adjusted closing prices.
+    :param periods: A list of ints; the periods to compute.
+    :return: A (periods x days) numpy array.
+    """
+    periods = np.asarray(periods)[:, None]
+    cumsum = np.concatenate([[0], np.cumsum(prices)])
+    ends = np.arange(1, len(prices) + 1)[None, :]
+    starts = np.maximum(ends - periods, 0)
+    return (cumsum[ends] - cumsum[starts]) / (ends - starts)
+
+
+def signals(short_avg, long_avg, start):
+    """
+    Finds whether each pair of moving averages is holding the stock at the end
+    of each day. A pair starts out of the stock, and from the day given by
+    start onwards it is in the stock while the short average is above the long
+    average and out of it while it's below. Ties keep the previous signal.
+    :param short_avg: A (pairs x days) numpy array of the short averages.
+    :param long_avg: A (pairs x days) numpy array of the long averages.
+    :param start: A numpy array of ints; the first day (0-indexed) each pair
+    can trade on.
+    :return: A (pairs x days) boolean numpy array.
+    """
+    num_pairs, num_days = short_avg.shape
+    active = np.arange(num_days)[None, :] >= np.asarray(start)[:, None]
+
+    signal = np.full((num_pairs, num_days + 1), -1, dtype=np.int8)
+    signal[:, 0] = 0
+    signal[:, 1:][active & (short_avg > long_avg)] = 1
+    signal[:, 1:][active & (short_avg < long_avg)] = 0
+
+    # Forward fill the days where the signal didn't change.
+    last_set = np.where(signal >= 0, np.arange(num_days + 1)[None, :], 0)
+    last_set = np.maximum.accumulate(last_set, axis=1)
+    signal = np.take_along_axis(signal, last_set, axis=1)
+    return signal[:, 1:].astype(bool)
+
+
+def whole_share_totals(held, prices, cash):
+    """
+    Works out how much each pair's account is worth on each day, buying as
+    many whole shares as it can when it gets into the stock and selling all of
+    them when it gets out, the same way MACD and SMA trade. Pairs are stepped
+    through one round trip (buy, then sell) at a time, all together, so the
+    only loop is over the most round trips any pair makes.
+    :param held: A (pairs x days) boolean numpy array; see signals().
+    :param prices: Numpy array of adjusted closing prices.
+    :param cash: The amount of starting capital of each pair.
+    :return: A (pairs x days) numpy array of cash + holdings.
+    """
+    num_pairs, num_days = held.shape
+    before = np.zeros(held.shape, dtype=bool)
+    before[:, 1:] = held[:, :-1]
+    buys = held & ~before
+    sells = before & ~held
+
+    # The day of each pair's k-th buy and sell. Pairs that make fewer trips
+    # are padded with the last day, which is never used.
+    num_trips = int(buys.sum(axis=1).max()) if num_days else 0
+    days = np.arange(num_days)
+    buy_days = np.sort(np.where(buys, days, num_days - 1),
+                       axis=1)[:, :num_trips]
+    sell_days = np.sort(np.where(sells, days, num_days - 1),
+                        axis=1)[:, :num_trips]
+
+    # Column k is the account during (or after) the k-th round trip; column 0
+    # is before the first buy.
+    position = np.zeros((num_pairs, num_trips + 1))
+    left_over = np.full((num_pairs, num_trips + 1), float(cash))
+    value = np.full((num_pairs, num_trips + 1), float(cash))
+    for trip in range(1, num_trips + 1):
+        buy_price = prices[buy_days[:, trip - 1]]
+        position[:, trip] = np.floor(value[:, trip - 1] / buy_price)
+        left_over[:, trip] = value[:, trip - 1] - \
+            position[:, trip] * buy_price
+        value[:, trip] = left_over[:, trip] + \
+            position[:, trip] * prices[sell_days[:, trip - 1]]
+
+    trip = np.cumsum(buys, axis=1)
+    return np.where(held,
+                    np.take_along_axis(left_over, trip, axis=1) +
+                    np.take_along_axis(position, trip, axis=1) *
+                    prices[None, :],
+                    np.take_along_axis(value, trip, axis=1))
+
+
+def sweep_symbol(symbol_data, cash, short_periods=SHORT_PERIODS,
+                 long_periods=LONG_PERIODS, strategies=('MACD', 'SMA'),
+                 risk_free_rate=0.05/252):
+    """
+    Sweeps every (short, long) pair of the grid for each strategy over a
+    symbol's data and ranks them by annualized sharpe ratio.
+    :param symbol_data: A dataframe obtained from yahoo finance containing
+    information on a stock's historical trade data
+    :param cash: The amount of starting capital assumed for each pair.
+    :param short_periods: A list of ints; the short periods to try.
+    :param long_periods: A list of ints; the long periods to try. Only pairs
+    where the short period is less than the long period are swept.
+    :param strategies: A list containing 'MACD' and/or 'SMA'.
+    :param risk_free_rate: The daily risk free rate used for excess returns.
+    :return: A dataframe with one row per (strategy, short, long), sorted with
+    the highest sharpe ratio first. Its columns are the backtester's name, the
+    strategy, both periods, the annualized sharpe ratio, the profit, and the
+    number of trades.
+    """
+    prices = symbol_data['Adj Close'].to_numpy(dtype=float)
+    pairs = [(short, long) for short in short_periods
+             for long in long_periods if short < long]
+    short_col = np.array([pair[0] for pair in pairs])
+    long_col = np.array([pair[1] for pair in pairs])
+
+    periods = sorted(set(short_col) | set(long_col))
+    row = {period: i for i, period in enumerate(periods)}
+    short_rows = [row[short] for short in short_col]
+    long_rows = [row[long] for long in long_col]
+
+    tables = []
+    for strategy in strategies:
+        if strategy == 'MACD':
+            averages = ema_matrix(prices, periods)
+            start = long_col  # MACD trades once it has more than long days
+        else:
+            averages = sma_matrix(prices, periods)
+            start = long_col - 1  # SMA trades once it has long days
+        held = signals(averages[short_rows], averages[long_rows], start)
+
+        # The first day has no return, just like pct_change.
+        totals = whole_share_totals(held, prices, cash)
+        excess = totals[:, 1:] / totals[:, :-1] - 1 - risk_free_rate
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sharpe = excess.mean(axis=1) * 252 / \
+                (excess.std(axis=1, ddof=1) * np.sqrt(252))
+        profit = totals[:, -1] - cash
+        trades = np.count_nonzero(held[:, 1:] != held[:, :-1], axis=1) + \
+            held[:, 0]
+
+        tables.append(pd.DataFrame({
+            'Name': [STRATEGY_NAMES[strategy] % pair for pair in pairs],
+            'Strategy': strategy,
+            'Short Period': short_col,
+            'Long Period': long_col,
+            'Annualized Sharpe Ratio': sharpe,
+            'Profit': profit,
+            'Trades': trades}))
+
+    table = pd.concat(tables, ignore_index=True)
+    return table.sort_values('Annualized Sharpe Ratio', ascending=False,
+                             kind='mergesort').reset_index(drop=True)
+
+
+def sweep_symbols(symbol_data_dict, cash, start_date=None, end_date=None,
+                  **kwargs):
+    """
+    Runs sweep_symbol over many symbols, e.g. all of the ones in a
+    SymbolsHelper's symbol_data_dict.
+    :param symbol_data_dict: A dictionary {'symbol1': dataframe1, ...}
+    :param cash: The amount of starting capital assumed for each pair.
+    :param start_date: String (or None); the first date of data to sweep over.
+    :param end_date: String (or None); the last date of data to sweep over.
+    :param kwargs: Passed along to sweep_symbol.
+    :return: A dictionary {'symbol1': results table 1, ...}
+    """
+    res = {}
+    for symbol in symbol_data_dict:
+        symbol_data = symbol_data_dict[symbol].loc[start_date:end_date, :]
+        res[symbol] = sweep_symbol(symbol_data, cash, **kwargs)
+    return res
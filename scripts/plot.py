@@ -5,7 +5,8 @@ stat_analysis.py.
 import run_backtesters as rb
 import matplotlib.pyplot as plt
 import stat_analysis
-import pandas as pd
+import results_store
+import universe
 import numpy as np
 import sys
 
@@ -26,15 +27,15 @@ def profit_scatterplot(start_date_in, end_date_in, start_date_out, end_date_out,
     :param file_name: String; the name of the file when saved.
     :return:
     """
-    # Getting data
-    stats = pd.read_csv('../statistics/summary_stats.csv')
-
-    # Organizing stats by rows that meet correct sample requirements
-    stats = stats[(stats.num_symbols == num_symbols) &
-                  (stats.start_date_insample == start_date_in) &
-                  (stats.end_date_insample == end_date_in) &
-                  (stats.start_date_outsample == start_date_out) &
-                  (stats.end_date_outsample == end_date_out)]
+    # Getting data, only keeping rows that meet correct sample requirements
+    stats = results_store.ResultsStore().read(
+        columns=['profit_insample', 'profit_outsample',
+                 'spy_profits_insample', 'spy_profits_outsample'],
+        filters={'num_symbols': num_symbols,
+                 'start_date_insample': start_date_in,
+                 'end_date_insample': end_date_in,
+                 'start_date_outsample': start_date_out,
+                 'end_date_outsample': end_date_out})
     sample_size_orig = stats.shape[0]
     print("Sample size:", sample_size_orig)
 
@@ -122,7 +123,7 @@ def plot_data(data, labels, file_name, xlabel='', ylabel='', title=''):
 def compare_multiple_runs_of_program(cash, num_runs, start_date_in, end_date_in,
                                      start_date_out, end_date_out, num_symbols,
                                      file_name_in, file_name_out,
-                                     testing=False):
+                                     testing=False, use_universe=True):
     """
     This function plots in-sample and out of sample profits for multiple runs
     of the portfolio created in run_backtesters.py against SPY profits.
@@ -140,6 +141,10 @@ def compare_multiple_runs_of_program(cash, num_runs, start_date_in, end_date_in,
     :param file_name_out: String, name of to-be-made-graph for out-sample data
     :param testing: Bool; Whether to use all 11 GICS industries (True), or
     whether to only use 2, speeding up the calculations (False).
+    :param use_universe: Bool; whether to build the portfolios out of the
+    universe of the in-sample dates (see universe.py), which is only built
+    the first time, instead of running every portfolio's backtesters.
+    Default is True.
     :return: Two plots are put on SciView.
     """
 
@@ -151,12 +156,20 @@ def compare_multiple_runs_of_program(cash, num_runs, start_date_in, end_date_in,
     insample_data = []
     symbol_helper_list = []
     spy_data = None
+    symbol_universe = None
+    if use_universe:
+        symbol_universe = universe.get_universe(start_date_in, end_date_in,
+                                                cash, testing=testing)
 
     # Getting information from portfolios in sample
     for x in range(0, num_runs):
-        p, i, t, s, s_h, _ = rb.setup_backtesters(
-            cash=cash, num_symbols=num_symbols, start_date=start_date_in,
-            end_date=end_date_in, testing=testing)
+        if symbol_universe is not None:
+            p, i, t, s, s_h, _ = symbol_universe.setup_portfolio(
+                cash=cash, num_symbols=num_symbols)
+        else:
+            p, i, t, s, s_h, _ = rb.setup_backtesters(
+                cash=cash, num_symbols=num_symbols, start_date=start_date_in,
+                end_date=end_date_in, testing=testing)
         portfolio_wts_list.append(p)
         industry_wts_list.append(i)
         symbol_helper_list.append(s_h)
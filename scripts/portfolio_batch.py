@@ -0,0 +1,208 @@
+"""
+This file simulates many random portfolios at once. setup_backtesters builds
+one portfolio at a time: it picks symbols, runs every symbol's backtesters,
+finds each industry's tangency portfolio, then the tangency portfolio of the
+industries, and finally runs the whole thing to get its daily totals. Here the
+backtesters are only run once per symbol, and their results are kept as a
+matrix of how one dollar grows under each symbol's chosen backtester. Every
+portfolio's industry weights, main weights, daily totals and sharpe ratio then
+come out of batched numpy operations on that matrix.
+Like run_tangency_portfolio (when it isn't exact), each symbol's results are
+assumed to scale with the cash it's given.
+"""
+import finlib
+import run_backtesters as rb
+import pandas as pd
+import numpy as np
+
+
+# The daily risk free rate used everywhere else in this project.
+RISK_FREE_RATE = 0.05 / 252
+
+
+def growth_matrix(symbol_backtesters_dict):
+    """
+    Builds the growth matrix out of backtesters that have already been run,
+    e.g. a SymbolsHelper's symbol_backtesters_dict.
+    :param symbol_backtesters_dict: A dictionary {'symbol1': backtester1, ...};
+    every backtester has to have been run over the same dates.
+    :return: A (dates x symbols) dataframe of each backtester's total on each
+    day, divided by the cash it started with.
+    """
+    growth = {}
+    index = None
+    for symbol in symbol_backtesters_dict:
+        bt = symbol_backtesters_dict[symbol]
+        growth[symbol] = np.asarray(bt.list_total, dtype=float) / \
+            bt.initial_cash
+        index = bt.results.index
+    return pd.DataFrame(growth, index=index)
+
+
+def build_growth_matrix(symbol_data_dict, cash, start_date, end_date,
+                        num_trading_days=None):
+    """
+    Picks and runs the best backtester for every symbol (see
+    run_backtesters.examine_backtesters) and builds the growth matrix out of
+    them. Symbols without data on every day between the two dates are left
+    out, the same way get_symbol_data tosses them.
+    :param symbol_data_dict: A dictionary {'symbol1': dataframe1, ...}
+    :param cash: The amount of cash each backtester starts with.
+    :param start_date: String; the first date to backtest. YYYY-mm-dd.
+    :param end_date: String; the last date to backtest. YYYY-mm-dd.
+    :param num_trading_days: Int (or None); the number of days every symbol
+    needs to have. Defaults to the number of NYSE trading days between the
+    two dates.
+    :return: A (dates x symbols) dataframe; see growth_matrix.
+    """
+    if num_trading_days is None:
+        num_trading_days = finlib.num_nyse_trading_days(start_date, end_date)
+
+    symbol_backtesters_dict = {}
+    for symbol in symbol_data_dict:
+        symbol_data = symbol_data_dict[symbol].loc[start_date:end_date, :]
+        if symbol_data.shape[0] < num_trading_days:
+            print(symbol + " doesn't have full info, leaving it out")
+            continue
+        print("Running backtesters for", symbol)
+        symbol_backtesters_dict[symbol] = rb.examine_backtesters(symbol_data,
+                                                                 cash=cash)
+    return growth_matrix(symbol_backtesters_dict)
+
+
+def available_symbols(dict_of_symbols, growth):
+    """
+    Trims a dictionary of symbols (e.g. the result of
+    obtain_symbols.organize_symbols) down to the symbols in the growth matrix.
+    Portfolios should be sampled from this, so every symbol picked has data.
+    :param dict_of_symbols: Dictionary where the key is the sector, and the
+    value is a list of symbols in that industry.
+    :param growth: A (dates x symbols) dataframe; see growth_matrix.
+    :return: The same dictionary, without the symbols that aren't in growth.
+    """
+    columns = set(growth.columns)
+    return {sector: [symbol for symbol in dict_of_symbols[sector]
+                     if symbol in columns] for sector in dict_of_symbols}
+
+
+def picks_to_columns(dict_of_symbols, picks, growth):
+    """
+    Turns the portfolios picked by obtain_symbols.sample_portfolios (indexes
+    into each sector's list of symbols) into columns of the growth matrix.
+    :param dict_of_symbols: The dictionary the portfolios were sampled from.
+    :param picks: A (trials x sectors x num_symbols) int array; the result of
+    sample_portfolios.
+    :param growth: A (dates x symbols) dataframe; see growth_matrix.
+    :return: A (trials x sectors x num_symbols) int array of column numbers
+    in growth, where -1 is padding.
+    """
+    column_index = {symbol: i for i, symbol in enumerate(growth.columns)}
+    columns = np.full(picks.shape, -1, dtype=np.int64)
+    for j, sector in enumerate(dict_of_symbols):
+        lookup = np.array([column_index[symbol]
+                           for symbol in dict_of_symbols[sector]] + [-1],
+                          dtype=np.int64)
+        # Padding (-1) looks up the -1 on the end of the lookup.
+        columns[:, j, :] = lookup[picks[:, j, :]]
+    return columns
+
+
+def simulate_portfolios(growth, columns, cash, risk_free_rate=RISK_FREE_RATE,
+                        diagonalize=False, chunk_size=1000):
+    """
+    Finds the tangency portfolios (industry and main) of many portfolios at
+    once and works out how each one would have done.
+    :param growth: A (dates x symbols) dataframe; see growth_matrix.
+    :param columns: A (trials x sectors x num_symbols) int array of which
+    columns of growth make up each industry of each portfolio, where -1 is
+    padding; see picks_to_columns.
+    :param cash: The amount of cash invested in each portfolio.
+    :param risk_free_rate: The daily risk free rate used for excess returns.
+    :param diagonalize: Boolean; whether to diagonalize the covariance
+    matrices (see finlib.compute_tangency).
+    :param chunk_size: Int; how many portfolios are worked on at a time. This
+    only changes how much memory is used at once.
+    :return:
+    1) industry_wts: A (trials x sectors x num_symbols) array of the weight
+    of each symbol in its industry.
+    2) main_wts: A (trials x sectors) array of the weight of each industry in
+    the main portfolio.
+    3) totals: A (trials x dates) array of each portfolio's cash + holdings
+    per day.
+    4) sharpe: A (trials) array of each portfolio's annualized sharpe ratio.
+    """
+    values = growth.to_numpy(dtype=float)
+    num_days, num_columns = values.shape
+    if np.isnan(values).any():
+        raise ValueError("The growth matrix can't have missing values")
+
+    # Every symbol's mean excess return and the covariance between every pair
+    # of symbols, computed once. Each industry's mean vector and covariance
+    # matrix are just pieces of these.
+    symbol_excess = values[1:] / values[:-1] - 1 - risk_free_rate
+    symbol_mu = symbol_excess.mean(axis=0)
+    symbol_sigma = np.atleast_2d(np.cov(symbol_excess, rowvar=False))
+    if diagonalize:
+        symbol_sigma = np.diag(np.diag(symbol_sigma))
+
+    num_trials, num_sectors, num_symbols = columns.shape
+    industry_wts = np.zeros(columns.shape)
+    main_wts = np.zeros((num_trials, num_sectors))
+    totals = np.zeros((num_trials, num_days))
+
+    for lo in range(0, num_trials, chunk_size):
+        hi = min(lo + chunk_size, num_trials)
+        cols = columns[lo:hi]
+        padding = cols < 0
+        safe_cols = np.where(padding, 0, cols)
+
+        # Industry tangency portfolios.
+        mu = symbol_mu[safe_cols]
+        sigma = symbol_sigma[safe_cols[..., :, None], safe_cols[..., None, :]]
+        wts, _, _ = finlib.tangency_weights(mu, sigma, padding)
+        industry_wts[lo:hi] = wts
+
+        # How one dollar grows in each industry: a (portfolios x sectors) by
+        # symbols matrix of weights, times the growth matrix.
+        rows = np.repeat(np.arange((hi - lo) * num_sectors), num_symbols)
+        weight_matrix = np.zeros(((hi - lo) * num_sectors, num_columns))
+        np.add.at(weight_matrix, (rows, safe_cols.ravel()),
+                  np.where(padding, 0, wts).ravel())
+        industry_growth = (weight_matrix @ values.T).reshape(
+            hi - lo, num_sectors, num_days)
+
+        # Main tangency portfolios, from the industries' excess returns.
+        industry_excess = industry_growth[..., 1:] / \
+            industry_growth[..., :-1] - 1 - risk_free_rate
+        wts, _, _ = finlib.compute_tangency_batch(
+            industry_excess.transpose(0, 2, 1), diagonalize=diagonalize)
+        main_wts[lo:hi] = wts
+        totals[lo:hi] = cash * np.einsum('ts,tsd->td', wts, industry_growth)
+
+    excess = totals[:, 1:] / totals[:, :-1] - 1 - risk_free_rate
+    sharpe = excess.mean(axis=1) * 252 / \
+        (excess.std(axis=1, ddof=1) * np.sqrt(252))
+    return industry_wts, main_wts, totals, sharpe
+
+
+def portfolio_weights(dict_of_symbols, picks, industry_wts, main_wts, trial):
+    """
+    Turns one simulated portfolio's weights back into the same shape that
+    setup_backtesters returns them in, so it can be run out of sample with
+    run_backtesters.run_out_of_sample like any other portfolio.
+    :param dict_of_symbols: The dictionary the portfolios were sampled from.
+    :param picks: The result of obtain_symbols.sample_portfolios.
+    :param industry_wts: The industry weights from simulate_portfolios.
+    :param main_wts: The main weights from simulate_portfolios.
+    :param trial: Int; which portfolio to get.
+    :return: A tuple (wts_tangency, industry_wts) where wts_tangency is a
+    pandas series of each industry's weight and industry_wts is a dictionary
+    {'industry1': pandas series of each symbol's weight, ...}.
+    """
+    sectors = list(dict_of_symbols)
+    res = {}
+    for j, sector in enumerate(sectors):
+        keep = picks[trial, j] >= 0
+        symbols = [dict_of_symbols[sector][i] for i in picks[trial, j][keep]]
+        res[sector] = pd.Series(industry_wts[trial, j][keep], index=symbols)
+    return pd.Series(main_wts[trial], index=sectors), res
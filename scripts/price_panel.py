@@ -0,0 +1,287 @@
+"""
+This file holds the price panel, which keeps the historical data for a whole
+universe of symbols in shared memory so that worker processes can read it
+without each loading (or being sent) their own copy. The data is one float64
+block shaped (dates x symbols x fields), next to an int64 block holding the
+shared date axis. A process that has the panel's descriptor can attach to both
+blocks by name, and every symbol's dataframe it hands out is a view into the
+shared block instead of a copy.
+"""
+import price_store
+import pandas as pd
+import numpy as np
+from multiprocessing import shared_memory
+
+
+# The fields kept for each symbol; the same ones as the price store.
+FIELDS = price_store.FIELDS
+
+# Panels this process has created or attached to, so that each one is only
+# attached once per process. Processes forked after a panel was created
+# inherit it from here instead of attaching again.
+# {'data block name': PricePanel, ...}
+_attached_panels = {}
+
+
+class PricePanel:
+    """
+    A class that holds OHLCV data for many symbols in shared memory. Use
+    from_frames() or from_store() to create one, and attach() (with the
+    descriptor() of one that already exists) from other processes.
+    """
+    def __init__(self, data_block, dates_block, symbols, fields, num_dates,
+                 ranges, owner):
+        """
+        Initialize the class variables. This isn't called directly; see
+        from_frames(), from_store() and attach().
+        :param data_block: SharedMemory holding the (dates x symbols x fields)
+        float64 data.
+        :param dates_block: SharedMemory holding the int64 date axis, in
+        nanoseconds since the epoch.
+        :param symbols: A list of the symbols, in the order of the data block.
+        :param fields: A list of the fields, in the order of the data block.
+        :param num_dates: Int; the number of dates in the date axis.
+        :param ranges: A dictionary {'symbol1': [first, last, rows], ...} of
+        the first and last row each symbol has data on, and how many rows
+        in between have data.
+        :param owner: Boolean; whether this process created the blocks (and
+        so is in charge of freeing them with unlink()).
+        """
+        self.data_block = data_block
+        self.dates_block = dates_block
+        self.symbols = list(symbols)
+        self.symbol_index = {symbol: i for i, symbol in enumerate(symbols)}
+        self.fields = list(fields)
+        self.num_dates = num_dates
+        self.ranges = ranges
+        self.owner = owner
+
+        self.data = np.ndarray((num_dates, len(self.symbols), len(self.fields)),
+                               dtype=np.float64, buffer=data_block.buf)
+        self.dates = np.ndarray((num_dates,), dtype=np.int64,
+                                buffer=dates_block.buf)
+        if not owner:
+            # Processes that attach only read from the panel.
+            self.data.flags.writeable = False
+            self.dates.flags.writeable = False
+
+    @classmethod
+    def from_frames(cls, frames, fields=FIELDS):
+        """
+        Creates a panel out of a dictionary of dataframes.
+        :param frames: A dictionary {'symbol1': dataframe1, ...} where each
+        dataframe looks like the ones finlib.load_financial_data returns.
+        :param fields: A list of the fields to keep.
+        :return: An initialized PricePanel that owns its shared memory.
+        """
+        symbols = list(frames)
+        index = pd.DatetimeIndex([])
+        for df in frames.values():
+            index = index.union(df.index)
+        dates = index.values.astype('M8[ns]').astype(np.int64)
+
+        panel = cls.allocate(symbols, fields, len(dates))
+        panel.dates[:] = dates
+        for col, symbol in enumerate(symbols):
+            df = frames[symbol]
+            rows = np.searchsorted(
+                dates, df.index.values.astype('M8[ns]').astype(np.int64))
+            panel.data[rows, col, :] = df[fields].to_numpy(dtype=float)
+            if len(rows) == 0:
+                panel.ranges[symbol] = [0, -1, 0]
+            else:
+                panel.ranges[symbol] = [int(rows[0]), int(rows[-1]), len(rows)]
+        return panel
+
+    @classmethod
+    def from_store(cls, store=None, symbols=None, start_date=None,
+                   end_date=None):
+        """
+        Creates a panel out of the columnar price store (see price_store.py),
+        copying the store's matrices straight into shared memory.
+        :param store: An initialized PriceStore; defaults to the one at
+        price_store.STORE_PATH.
+        :param symbols: A list of symbols to keep; defaults to all of them.
+        Symbols that aren't in the store are left out.
+        :param start_date: String (or None); the first date to keep.
+        :param end_date: String (or None); the last date to keep.
+        :return: An initialized PricePanel that owns its shared memory.
+        """
+        if store is None:
+            store = price_store.PriceStore()
+        if symbols is None:
+            symbols = store.symbols
+        symbols = [symbol for symbol in symbols if store.has_symbol(symbol)]
+        cols = [store.symbol_index[symbol] for symbol in symbols]
+        lo, hi = store.date_slice(start_date, end_date)
+
+        panel = cls.allocate(symbols, FIELDS, hi - lo)
+        panel.dates[:] = store.date_array()[lo:hi]
+        for i, field in enumerate(FIELDS):
+            panel.data[:, :, i] = store.matrix(field)[lo:hi, cols]
+        for symbol in symbols:
+            first, last, _ = store.manifest['ranges'][symbol]
+            first, last = max(first, lo) - lo, min(last, hi - 1) - lo
+            if last < first:
+                panel.ranges[symbol] = [0, -1, 0]
+            else:
+                col = panel.symbol_index[symbol]
+                rows = int(np.count_nonzero(
+                    ~np.isnan(panel.data[first:last + 1, col,
+                                         FIELDS.index('Adj Close')])))
+                panel.ranges[symbol] = [first, last, rows]
+        return panel
+
+    @classmethod
+    def allocate(cls, symbols, fields, num_dates):
+        """
+        Creates the shared memory blocks for a new, empty panel (every value
+        is NaN).
+        :param symbols: A list of the symbols.
+        :param fields: A list of the fields.
+        :param num_dates: Int; the number of dates.
+        :return: An initialized PricePanel that owns its shared memory.
+        """
+        # Shared memory blocks can't be empty, so they're always at least one
+        # byte long.
+        data_size = num_dates * len(symbols) * len(fields) * 8
+        data_block = shared_memory.SharedMemory(create=True,
+                                                size=max(data_size, 1))
+        dates_block = shared_memory.SharedMemory(create=True,
+                                                 size=max(num_dates * 8, 1))
+        panel = cls(data_block, dates_block, symbols, fields, num_dates, {},
+                    owner=True)
+        panel.data[:] = np.nan
+        _attached_panels[data_block.name] = panel
+        return panel
+
+    def descriptor(self):
+        """
+        :return: A small dictionary with everything needed to attach to this
+        panel from another process (see attach()). It can be pickled and sent
+        to worker processes.
+        """
+        return {'data_name': self.data_block.name,
+                'dates_name': self.dates_block.name,
+                'symbols': self.symbols, 'fields': self.fields,
+                'num_dates': self.num_dates, 'ranges': self.ranges}
+
+    @classmethod
+    def attach(cls, descriptor):
+        """
+        Attaches to a panel that was created by another process, without
+        copying any of its data. Each panel is only attached once per process,
+        and not at all in the process that created it (or ones forked from
+        it).
+        :param descriptor: The dictionary returned by that panel's
+        descriptor().
+        :return: An initialized PricePanel that reads from the shared memory.
+        """
+        name = descriptor['data_name']
+        if name not in _attached_panels:
+            _attached_panels[name] = cls(
+                attach_block(name), attach_block(descriptor['dates_name']),
+                descriptor['symbols'], descriptor['fields'],
+                descriptor['num_dates'], descriptor['ranges'], owner=False)
+        return _attached_panels[name]
+
+    def has_symbol(self, symbol):
+        """
+        :param symbol: String; a ticker, e.g. 'GOOG'
+        :return: Boolean; whether the panel has data for this symbol.
+        """
+        return symbol in self.symbol_index
+
+    def symbol_slice(self, symbol, start_date=None, end_date=None):
+        """
+        Finds the rows of the date axis that are between two dates, inclusive,
+        trimmed to the rows where the symbol has data.
+        :param symbol: String; a ticker in the panel.
+        :param start_date: String (or None); the first date wanted.
+        :param end_date: String (or None); the last date wanted.
+        :return: A tuple (lo, hi) such that rows lo:hi are within the dates.
+        """
+        lo, hi = 0, self.num_dates
+        if start_date is not None:
+            lo = int(np.searchsorted(self.dates, pd.Timestamp(start_date).value,
+                                     side='left'))
+        if end_date is not None:
+            hi = int(np.searchsorted(self.dates, pd.Timestamp(end_date).value,
+                                     side='right'))
+        first, last, _ = self.ranges[symbol]
+        lo, hi = max(lo, first), min(hi, last + 1)
+        return lo, max(lo, hi)
+
+    def frame(self, symbol, start_date=None, end_date=None):
+        """
+        Returns a dataframe of a symbol's historical data between two dates,
+        looking the same as the ones finlib.load_financial_data returns. When
+        the symbol has data on every date in its range (the usual case), the
+        dataframe's values are a view into the shared memory; otherwise the
+        days it has no data for are dropped, which makes a copy.
+        :param symbol: String; a ticker in the panel.
+        :param start_date: String (or None); the first date wanted.
+        :param end_date: String (or None); the last date wanted.
+        :return: A dataframe indexed by date.
+        """
+        lo, hi = self.symbol_slice(symbol, start_date, end_date)
+        values = self.data[lo:hi, self.symbol_index[symbol], :]
+        index = pd.DatetimeIndex(self.dates[lo:hi].astype('M8[ns]'),
+                                 name='Date')
+        df = pd.DataFrame(values, index=index, columns=self.fields,
+                          copy=False)
+
+        first, last, rows = self.ranges[symbol]
+        if rows != last - first + 1:
+            # There are gaps in the symbol's data.
+            df = df[~np.isnan(values[:, self.fields.index('Adj Close')])]
+        return df
+
+    def is_view(self, df):
+        """
+        :param df: A dataframe, e.g. one handed out by frame().
+        :return: Boolean; whether the dataframe's values are in this panel's
+        shared memory (as opposed to a copy of them, or other data).
+        """
+        if self.data is None or 'Adj Close' not in df.columns:
+            return False
+        return np.may_share_memory(df['Adj Close'].to_numpy(), self.data)
+
+    def close(self):
+        """
+        Lets go of this process's access to the shared memory. Dataframes
+        handed out by frame() can't be used afterwards.
+        :return: Nothing.
+        """
+        self.data = None
+        self.dates = None
+        self.data_block.close()
+        self.dates_block.close()
+        _attached_panels.pop(self.data_block.name, None)
+
+    def unlink(self):
+        """
+        Frees the shared memory. Only the process that created the panel
+        should do this, once every process is done with it.
+        :return: Nothing.
+        """
+        self.close()
+        if self.owner:
+            self.data_block.unlink()
+            self.dates_block.unlink()
+
+
+def attach_block(name):
+    """
+    Attaches to an existing shared memory block without letting this process
+    free it; only the process that created the block does that.
+    :param name: String; the block's name.
+    :return: A SharedMemory.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before python 3.13 every block that's attached to is tracked. Worker
+        # processes share the tracker of the process that started them, so the
+        # block is still only freed once, by whoever created it.
+        return shared_memory.SharedMemory(name=name)
@@ -0,0 +1,538 @@
+"""
+This file holds the columnar price store, which keeps the historical data for
+every symbol in a single place instead of one pickle per symbol. Each field
+(Adj Close, High, ...) is one float64 matrix on disk, with a row for every date
+and a column for every symbol. All symbols share one date axis, and a small
+manifest keeps track of which column belongs to which symbol.
+The matrices are memory-mapped, so reading a symbol's prices for a window of
+dates only touches those bytes instead of unpickling its whole dataframe.
+"""
+import pandas as pd
+import numpy as np
+import contextlib
+import functools
+import json
+import os
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
+
+
+# Default location of the store, next to the per-symbol pickles.
+STORE_PATH = '../symbol_data/store/'
+
+# The fields saved for each symbol, in the same order yahoo finance uses.
+FIELDS = ['High', 'Low', 'Open', 'Close', 'Volume', 'Adj Close']
+
+
+def field_file_name(field):
+    """
+    Returns the file name that a field's matrix is saved under.
+    :param field: String; e.g. 'Adj Close'
+    :return: String; e.g. 'adj_close.f64'
+    """
+    return field.lower().replace(' ', '_') + '.f64'
+
+
+def _locked(method):
+    """
+    Decorator for the PriceStore methods that write to the store, so that
+    they hold its lock (see PriceStore.lock) while they run.
+    :param method: A PriceStore method.
+    :return: The wrapped method.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class PriceStore:
+    """
+    A class that reads (and writes) the columnar price store found at path.
+    The layout of the folder is:
+    -- manifest.json: the symbols (in column order), the number of dates, the
+    number of columns allocated, and each symbol's first/last row + row count.
+    -- dates.i8: int64 nanoseconds since the epoch, sorted, one per row.
+    -- <field>.f64: a (dates x columns) float64 matrix for each field. Days
+    where a symbol has no data are NaN.
+    -- lock: an empty file that writers lock, so that only one process
+    writes to the store at a time (e.g. the workers of stat_analysis.py that
+    download missing symbols).
+    """
+    def __init__(self, path=STORE_PATH):
+        """
+        Initialize the class variables, reading the manifest if there is one.
+        :param path: String; the folder holding the store.
+        """
+        self.path = path
+        self.manifest = None  # Dict read from manifest.json
+        self.symbol_index = {}  # {'symbol1': column1, 'symbol2': column2, ...}
+        self._dates = None  # Memory-mapped int64 date axis
+        self._matrices = {}  # {'field1': memmap1, 'field2': memmap2, ...}
+        self._lock_depth = 0  # How many writers in this process hold the lock
+        self.reload()
+
+    def reload(self):
+        """
+        (Re)reads the manifest, e.g. after the store has been written to.
+        Memory-mapped files are reopened the next time they're needed.
+        :return: Nothing.
+        """
+        self.manifest = None
+        self.symbol_index = {}
+        self._dates = None
+        self._matrices = {}
+
+        manifest_path = os.path.join(self.path, 'manifest.json')
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                self.manifest = json.load(f)
+            self.symbol_index = {symbol: i for i, symbol in
+                                 enumerate(self.manifest['symbols'])}
+
+    @contextlib.contextmanager
+    def lock(self):
+        """
+        Holds an exclusive lock on the store, waiting for any other process
+        that's writing to it. Once it has the lock the manifest is read again,
+        since another process may have changed the store since it was last
+        read. The lock can be taken again by a method that already holds it
+        (e.g. put() calling grow()), in which case nothing is reread.
+        :return: Nothing; used in a with statement.
+        """
+        if self._lock_depth > 0:
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+            return
+
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, 'lock'), 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            self._lock_depth = 1
+            try:
+                self.reload()
+                yield
+            finally:
+                self._lock_depth = 0
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def exists(self):
+        """
+        :return: Boolean; whether there is a store saved at self.path.
+        """
+        return self.manifest is not None
+
+    def has_symbol(self, symbol):
+        """
+        :param symbol: String; a ticker, e.g. 'GOOG'
+        :return: Boolean; whether the store has data for this symbol.
+        """
+        return symbol in self.symbol_index
+
+    @property
+    def symbols(self):
+        """
+        :return: A list of every symbol in the store, in column order.
+        """
+        return list(self.symbol_index)
+
+    @property
+    def num_dates(self):
+        """
+        :return: Int; the number of rows in the shared date axis.
+        """
+        return self.manifest['num_dates'] if self.exists() else 0
+
+    def date_array(self):
+        """
+        :return: Numpy int64 array (memory-mapped) of the shared date axis, in
+        nanoseconds since the epoch.
+        """
+        if self._dates is None:
+            if self.num_dates == 0:
+                self._dates = np.empty(0, dtype=np.int64)
+            else:
+                self._dates = np.memmap(os.path.join(self.path, 'dates.i8'),
+                                        dtype=np.int64, mode='r',
+                                        shape=(self.num_dates,))
+        return self._dates
+
+    def dates(self, start_date=None, end_date=None):
+        """
+        :param start_date: String (or None); the first date wanted, inclusive.
+        :param end_date: String (or None); the last date wanted, inclusive.
+        :return: A DatetimeIndex of the shared date axis between the two dates.
+        """
+        lo, hi = self.date_slice(start_date, end_date)
+        return pd.DatetimeIndex(self.date_array()[lo:hi].astype('M8[ns]'),
+                                name='Date')
+
+    def matrix(self, field):
+        """
+        :param field: String; one of FIELDS.
+        :return: The memory-mapped (dates x columns) matrix for that field.
+        """
+        if field not in self._matrices:
+            self._matrices[field] = np.memmap(
+                os.path.join(self.path, field_file_name(field)),
+                dtype=np.float64, mode='r',
+                shape=(self.num_dates, self.manifest['capacity']))
+        return self._matrices[field]
+
+    def date_slice(self, start_date=None, end_date=None):
+        """
+        Finds the rows of the date axis that are between two dates, inclusive,
+        with a binary search.
+        :param start_date: String (or None); the first date wanted.
+        :param end_date: String (or None); the last date wanted.
+        :return: A tuple (lo, hi) such that rows lo:hi are within the dates.
+        """
+        dates = self.date_array()
+        lo, hi = 0, len(dates)
+        if start_date is not None:
+            lo = int(np.searchsorted(dates, pd.Timestamp(start_date).value,
+                                     side='left'))
+        if end_date is not None:
+            hi = int(np.searchsorted(dates, pd.Timestamp(end_date).value,
+                                     side='right'))
+        return lo, max(lo, hi)
+
+    def symbol_slice(self, symbol, start_date=None, end_date=None):
+        """
+        Same as date_slice, but also trimmed to the rows where the symbol has
+        data, so that NaN days before the symbol's history starts (or after it
+        ends) aren't included.
+        :param symbol: String; a ticker in the store.
+        :param start_date: String (or None); the first date wanted.
+        :param end_date: String (or None); the last date wanted.
+        :return: A tuple (lo, hi).
+        """
+        lo, hi = self.date_slice(start_date, end_date)
+        first, last, _ = self.manifest['ranges'][symbol]
+        lo, hi = max(lo, first), min(hi, last + 1)
+        return lo, max(lo, hi)
+
+    def column(self, symbol, field, start_date=None, end_date=None):
+        """
+        Returns one field of one symbol between two dates. This is a view into
+        the memory-mapped matrix; nothing is copied.
+        :param symbol: String; a ticker in the store.
+        :param field: String; one of FIELDS.
+        :param start_date: String (or None); the first date wanted.
+        :param end_date: String (or None); the last date wanted.
+        :return: A numpy array view.
+        """
+        lo, hi = self.symbol_slice(symbol, start_date, end_date)
+        return self.matrix(field)[lo:hi, self.symbol_index[symbol]]
+
+    def columns(self, symbol, start_date=None, end_date=None, fields=None):
+        """
+        Same as column(), for several fields at once.
+        :param symbol: String; a ticker in the store.
+        :param start_date: String (or None); the first date wanted.
+        :param end_date: String (or None); the last date wanted.
+        :param fields: A list of fields; defaults to all of FIELDS.
+        :return: A tuple (dates, columns) where dates is a DatetimeIndex and
+        columns is a dictionary {'field1': view1, 'field2': view2, ...}.
+        """
+        if fields is None:
+            fields = FIELDS
+        lo, hi = self.symbol_slice(symbol, start_date, end_date)
+        col = self.symbol_index[symbol]
+        dates = pd.DatetimeIndex(self.date_array()[lo:hi].astype('M8[ns]'),
+                                 name='Date')
+        return dates, {field: self.matrix(field)[lo:hi, col]
+                       for field in fields}
+
+    def load_frame(self, symbol, start_date=None, end_date=None):
+        """
+        Returns a dataframe of a symbol's historical data between two dates,
+        looking the same as the ones load_financial_data returns. Unlike
+        column(), this copies the data out of the store.
+        :param symbol: String; a ticker in the store.
+        :param start_date: String (or None); the first date wanted.
+        :param end_date: String (or None); the last date wanted.
+        :return: A dataframe indexed by date, without the days that the symbol
+        has no data for.
+        """
+        dates, columns = self.columns(symbol, start_date, end_date)
+        df = pd.DataFrame(columns, index=dates)
+        return df[~np.isnan(columns['Adj Close'])]
+
+    @_locked
+    def write(self, frames):
+        """
+        Builds the store from scratch out of a dictionary of dataframes,
+        overwriting whatever was saved at self.path before.
+        :param frames: A dictionary {'symbol1': dataframe1, ...} where each
+        dataframe looks like the ones load_financial_data returns.
+        :return: Nothing; the files are saved into self.path and this class
+        is pointed at them.
+        """
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+        symbols = list(frames)
+        index = pd.DatetimeIndex([])
+        for df in frames.values():
+            index = index.union(df.index)
+        dates = index.values.astype('M8[ns]').astype(np.int64)
+
+        ranges = {}
+        for field in FIELDS:
+            matrix = np.full((len(dates), len(symbols)), np.nan)
+            for col, symbol in enumerate(symbols):
+                df = frames[symbol]
+                rows = np.searchsorted(
+                    dates, df.index.values.astype('M8[ns]').astype(np.int64))
+                matrix[rows, col] = df[field].to_numpy(dtype=float)
+                if field == 'Adj Close':
+                    if len(rows) == 0:
+                        ranges[symbol] = [0, -1, 0]
+                    else:
+                        ranges[symbol] = [int(rows[0]), int(rows[-1]),
+                                          len(rows)]
+            self.save_file(field_file_name(field), matrix)
+        self.save_file('dates.i8', dates)
+
+        manifest = {'fields': FIELDS, 'symbols': symbols,
+                    'capacity': len(symbols), 'num_dates': len(dates),
+                    'ranges': ranges}
+        self.save_file('manifest.json', manifest)
+        self.reload()
+
+    def symbol_rows(self, symbol, start_date=None, end_date=None):
+        """
+        Counts the days between two dates that a symbol has data for. This only
+        uses the manifest (the symbol's first/last row and row count) unless
+        the symbol has gaps in its data, so nothing is loaded to check whether
+        a symbol is up to date.
+        :param symbol: String; a ticker in the store.
+        :param start_date: String (or None); the first date wanted.
+        :param end_date: String (or None); the last date wanted.
+        :return: Int; the number of days.
+        """
+        lo, hi = self.symbol_slice(symbol, start_date, end_date)
+        first, last, rows = self.manifest['ranges'][symbol]
+        if rows == last - first + 1:
+            return hi - lo
+        # There are gaps, so count the days in the window that have data.
+        return int(np.count_nonzero(~np.isnan(
+            self.column(symbol, 'Adj Close', start_date, end_date))))
+
+    def last_date(self, symbol):
+        """
+        :param symbol: String; a ticker in the store.
+        :return: A pandas timestamp of the last date the symbol has data for,
+        or None if it doesn't have any.
+        """
+        first, last, rows = self.manifest['ranges'][symbol]
+        if rows == 0:
+            return None
+        return pd.Timestamp(int(self.date_array()[last]))
+
+    @_locked
+    def put(self, symbol, frame):
+        """
+        Saves a symbol's data into the store, without rewriting the rest of it.
+        Dates after the end of the shared date axis are appended to the end of
+        every file, dates already in the axis are written in place, and a new
+        symbol gets one of the spare columns (the matrices are widened first if
+        there aren't any). Only when the data has a date that falls inside the
+        axis but isn't in it is the whole store rebuilt.
+        Other processes writing to the store wait until this is done.
+        :param symbol: String; a ticker.
+        :param frame: A dataframe that looks like the ones load_financial_data
+        returns. Days that are already saved for the symbol are overwritten.
+        :return: Nothing.
+        """
+        if not self.exists():
+            self.write({symbol: frame})
+            return
+
+        axis = np.array(self.date_array())
+        frame_dates = frame.index.values.astype('M8[ns]').astype(np.int64)
+        inside = frame_dates <= axis[-1] if len(axis) else \
+            np.zeros(len(frame_dates), dtype=bool)
+        rows = np.searchsorted(axis, frame_dates[inside])
+        if np.any(rows >= len(axis)) or \
+                np.any(axis[np.minimum(rows, len(axis) - 1)] !=
+                       frame_dates[inside]):
+            # A date in the middle of the axis is missing; rebuild everything.
+            print("Rebuilding price store to add " + symbol + "'s dates")
+            frames = {s: self.load_frame(s) for s in self.symbols}
+            if symbol in frames:
+                frame = pd.concat([frames[symbol][~frames[symbol].index.isin(
+                    frame.index)], frame]).sort_index()
+            frames[symbol] = frame
+            self.write(frames)
+            return
+
+        if symbol not in self.symbol_index and \
+                len(self.manifest['symbols']) == self.manifest['capacity']:
+            self.grow(max(2 * self.manifest['capacity'], 1))
+        manifest = dict(self.manifest, ranges=dict(self.manifest['ranges']))
+        if symbol not in self.symbol_index:
+            manifest['symbols'] = manifest['symbols'] + [symbol]
+        col = manifest['symbols'].index(symbol)
+        capacity = manifest['capacity']
+
+        # New dates go on the end of every file. The manifest is saved last, so
+        # anyone reading the store until then still sees the old number of
+        # dates.
+        tail_dates = frame_dates[~inside]
+        tail = frame[~inside]
+        for field in FIELDS:
+            block = np.full((len(tail_dates), capacity), np.nan)
+            block[:, col] = tail[field].to_numpy(dtype=float)
+            with open(os.path.join(self.path, field_file_name(field)),
+                      'ab') as f:
+                block.tofile(f)
+        with open(os.path.join(self.path, 'dates.i8'), 'ab') as f:
+            tail_dates.astype(np.int64).tofile(f)
+        num_dates = len(axis) + len(tail_dates)
+
+        # Dates already in the axis are written in place.
+        head = frame[inside]
+        for field in FIELDS:
+            matrix = np.memmap(os.path.join(self.path, field_file_name(field)),
+                               dtype=np.float64, mode='r+',
+                               shape=(num_dates, capacity))
+            matrix[rows, col] = head[field].to_numpy(dtype=float)
+            if field == 'Adj Close':
+                have_data = np.flatnonzero(~np.isnan(matrix[:, col]))
+            matrix.flush()
+            del matrix
+
+        if len(have_data) == 0:
+            manifest['ranges'][symbol] = [0, -1, 0]
+        else:
+            manifest['ranges'][symbol] = [int(have_data[0]),
+                                          int(have_data[-1]), len(have_data)]
+        manifest['num_dates'] = num_dates
+        self.save_file('manifest.json', manifest)
+        self.reload()
+
+    @_locked
+    def clear(self, symbol):
+        """
+        Blanks out all of a symbol's data (it keeps its column), e.g. before
+        saving its whole history again after a split.
+        :param symbol: String; a ticker in the store.
+        :return: Nothing.
+        """
+        col = self.symbol_index[symbol]
+        for field in FIELDS:
+            matrix = np.memmap(os.path.join(self.path, field_file_name(field)),
+                               dtype=np.float64, mode='r+',
+                               shape=(self.num_dates,
+                                      self.manifest['capacity']))
+            matrix[:, col] = np.nan
+            matrix.flush()
+            del matrix
+        manifest = dict(self.manifest, ranges=dict(self.manifest['ranges']))
+        manifest['ranges'][symbol] = [0, -1, 0]
+        self.save_file('manifest.json', manifest)
+        self.reload()
+
+    @_locked
+    def grow(self, capacity):
+        """
+        Widens every matrix to have room for more symbols. This rewrites every
+        file, so the capacity is usually doubled to not do it often.
+        :param capacity: Int; the new number of columns.
+        :return: Nothing.
+        """
+        old_capacity = self.manifest['capacity']
+        for field in FIELDS:
+            matrix = np.full((self.num_dates, capacity), np.nan)
+            matrix[:, :old_capacity] = self.matrix(field)
+            self._matrices.pop(field)
+            self.save_file(field_file_name(field), matrix)
+        manifest = dict(self.manifest)
+        manifest['capacity'] = capacity
+        self.save_file('manifest.json', manifest)
+        self.reload()
+
+    def refresh(self, symbol, provider, end_date=None, overlap=5,
+                tolerance=1e-6):
+        """
+        Brings a symbol's data up to date by only downloading the days after
+        the last one saved. A few of the days already saved are downloaded
+        again to check that they haven't changed: yahoo finance adjusts the
+        whole history after a split or dividend, in which case the symbol's
+        whole history is downloaded and saved again instead.
+        :param symbol: String; a ticker in the store.
+        :param provider: Where the data comes from; anything with a
+        fetch(symbol, start_date, end_date) method (see data_providers.py).
+        :param end_date: String (or None); the last date wanted. None means the
+        most recent trading day.
+        :param overlap: Int; the number of saved days downloaded again.
+        :param tolerance: Float; how much (relatively) prices on those days
+        can differ before they count as changed.
+        :return: Int; the number of days added to the store.
+        """
+        first, last, rows = self.manifest['ranges'][symbol]
+        if rows == 0:
+            # Nothing is saved (e.g. it was cleared and then its download
+            # failed), so there's nothing to check; download everything.
+            print("No saved data for " + symbol + ", downloading all of it")
+            history = provider.fetch(symbol, None, end_date)
+            if history.shape[0] > 0:
+                self.put(symbol, history)
+            return history.shape[0]
+
+        dates = self.date_array()
+        overlap_start = pd.Timestamp(
+            int(dates[max(first, last - overlap + 1)]))
+        last_date = pd.Timestamp(int(dates[last]))
+
+        fresh = provider.fetch(symbol, overlap_start, end_date)
+        saved = self.load_frame(symbol, start_date=overlap_start)
+        common = saved.index.intersection(fresh.index)
+        same = len(common) > 0
+        for field in ['Adj Close', 'Close']:
+            same = same and np.allclose(saved.loc[common, field],
+                                        fresh.loc[common, field],
+                                        rtol=tolerance, atol=0)
+        if not same:
+            print(symbol + "'s saved prices have changed (split or dividend), "
+                           "downloading all of its data again")
+            history = provider.fetch(symbol, pd.Timestamp(int(dates[first])),
+                                     end_date)
+            self.clear(symbol)
+            self.put(symbol, history)
+            return history.shape[0] - rows
+
+        tail = fresh[fresh.index > last_date]
+        if tail.shape[0] > 0:
+            print("Adding", tail.shape[0], "new days for", symbol)
+            self.put(symbol, tail)
+        return tail.shape[0]
+
+    def save_file(self, name, data):
+        """
+        Saves either a numpy array (as raw bytes) or a dictionary (as json)
+        into the store. It's written to a temporary file first and then
+        renamed, so readers never see a half-written file.
+        :param name: String; the file name inside self.path.
+        :param data: A numpy array or a dictionary.
+        :return: Nothing.
+        """
+        file_path = os.path.join(self.path, name)
+        tmp_path = file_path + '.tmp'
+        if isinstance(data, dict):
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+        else:
+            np.ascontiguousarray(data).tofile(tmp_path)
+        os.replace(tmp_path, file_path)
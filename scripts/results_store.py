@@ -0,0 +1,189 @@
+"""
+This file holds the results store, which is where stat_analysis.py saves the
+stats of every backtest it runs ('statistics/summary_stats.csv'). Rows are only
+ever appended to the end of the csv, so saving a run takes the same amount of
+time no matter how big the file has gotten, instead of reading and rewriting
+the whole thing each time.
+Several processes can save into the same store at once: every write happens
+while holding a lock on a file next to the csv, and is flushed to disk before
+the lock is let go. Reading only parses the columns that are asked for, and
+filters the rows a chunk at a time so the whole csv is never in memory at once.
+"""
+import pandas as pd
+import numpy as np
+import contextlib
+import csv
+import os
+
+try:
+    import fcntl
+except ImportError:
+    # Windows doesn't have fcntl; there the store still works, but it's not
+    # safe to have several processes saving into it at the same time.
+    fcntl = None
+
+
+# Default location of the store.
+STATS_PATH = '../statistics/summary_stats.csv'
+
+
+class ResultsStore:
+    """
+    A class that appends rows to (and reads rows from) a csv of results.
+    """
+    def __init__(self, path=STATS_PATH):
+        """
+        Initialize the class variables.
+        :param path: String; the csv file holding the results.
+        """
+        self.path = path
+        self.lock_path = path + '.lock'  # File locked while using the csv
+
+    @contextlib.contextmanager
+    def lock(self, exclusive=True):
+        """
+        Locks the store for as long as the with block runs. Writers get an
+        exclusive lock, while readers share theirs so they only wait on
+        writers.
+        :param exclusive: Boolean; whether this is a writer.
+        :return: Nothing; used as 'with store.lock():'
+        """
+        with open(self.lock_path, 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def columns(self):
+        """
+        Reads only the header of the csv.
+        :return: A list of the column names, or an empty list if nothing has
+        been saved yet.
+        """
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, newline='') as f:
+            return next(csv.reader(f), [])
+
+    def append(self, row):
+        """
+        Saves a row to the end of the csv. The first row saved also writes the
+        header. If the row has columns that the csv doesn't have yet, the
+        header is extended once (which is the one time the whole file gets
+        rewritten), and the older rows are left blank in the new columns.
+        :param row: A dictionary {'column1': value1, 'column2': value2, ...}
+        :return: Nothing.
+        """
+        with self.lock():
+            header = self.columns()
+            new_columns = [column for column in row if column not in header]
+            if not header:
+                header = list(row)
+                self.write_rows(header, [], mode='w')
+            elif new_columns:
+                header = self.extend_header(header, new_columns)
+            self.write_rows(header, [row], mode='a')
+
+    def extend_header(self, header, new_columns):
+        """
+        Rewrites the csv with extra columns on the end of the header. Only
+        called while holding the store's lock.
+        :param header: A list of the csv's current column names.
+        :param new_columns: A list of the column names to add.
+        :return: A list of the new column names.
+        """
+        print("Adding columns to " + self.path + ":", new_columns)
+        header = header + new_columns
+        tmp_path = self.path + '.tmp'
+        with open(self.path, newline='') as f_old, \
+                open(tmp_path, 'w', newline='') as f_new:
+            reader = csv.reader(f_old)
+            writer = csv.writer(f_new, lineterminator='\n')
+            next(reader)
+            writer.writerow(header)
+            for old_row in reader:
+                writer.writerow(old_row + [''] * len(new_columns))
+            f_new.flush()
+            os.fsync(f_new.fileno())
+        os.replace(tmp_path, self.path)
+        return header
+
+    def write_rows(self, header, rows, mode):
+        """
+        Writes rows to the csv in the header's column order and flushes them
+        to disk. Only called while holding the store's lock.
+        :param header: A list of the csv's column names.
+        :param rows: A list of dictionaries; columns that a row doesn't have
+        are left blank.
+        :param mode: 'w' to start a new csv (writing the header), or 'a' to
+        append to the end of it.
+        :return: Nothing.
+        """
+        with open(self.path, mode, newline='') as f:
+            if mode == 'a' and f.tell() > 0:
+                # Make sure that the last row saved ended its line.
+                with open(self.path, 'rb') as f_end:
+                    f_end.seek(-1, os.SEEK_END)
+                    if f_end.read(1) != b'\n':
+                        f.write('\n')
+            writer = csv.writer(f, lineterminator='\n')
+            if mode == 'w':
+                writer.writerow(header)
+            for row in rows:
+                writer.writerow([row.get(column, '') for column in header])
+            f.flush()
+            os.fsync(f.fileno())
+
+    def read(self, columns=None, filters=None, chunksize=10000):
+        """
+        Reads rows from the csv.
+        :param columns: A list of the columns wanted (or None for all of them).
+        Only these columns (plus the ones being filtered on) are parsed.
+        :param filters: A dictionary {'column1': value1, ...}; only rows where
+        every column equals its value are returned. A value can also be a list,
+        in which case the column has to equal one of the values in it.
+        :param chunksize: Int; the number of rows parsed at a time.
+        :return: A dataframe of the matching rows.
+        """
+        if filters is None:
+            filters = {}
+        if not os.path.exists(self.path):
+            return pd.DataFrame(columns=columns)
+
+        with self.lock(exclusive=False):
+            # Columns that haven't been saved yet are read as blank, the same
+            # as older rows are once a column gets added.
+            header = self.columns()
+            if not header:
+                return pd.DataFrame(columns=columns)
+            use_cols = header
+            if columns is not None:
+                use_cols = [column for column in header if column in columns
+                            or column in filters]
+            missing = [column for column in list(columns or []) +
+                       list(filters) if column not in header]
+
+            chunks = []
+            for chunk in pd.read_csv(self.path, usecols=use_cols,
+                                     chunksize=chunksize):
+                for column in missing:
+                    chunk[column] = np.nan
+                mask = pd.Series(True, index=chunk.index)
+                for column in filters:
+                    value = filters[column]
+                    if isinstance(value, (list, tuple, set)):
+                        mask &= chunk[column].isin(value)
+                    else:
+                        mask &= chunk[column] == value
+                chunks.append(chunk[mask])
+
+        if not chunks:
+            return pd.DataFrame(columns=columns if columns is not None
+                                else header)
+        res = pd.concat(chunks, ignore_index=True)
+        if columns is not None:
+            res = res[list(columns)]
+        return res
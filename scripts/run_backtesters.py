@@ -1,10 +1,15 @@
 import obtain_symbols
 import finlib
 import backtesters
+import price_store
+import price_panel
+import data_providers
+import parameter_sweep
+import backtest_cache
 import pandas as pd
+import numpy as np
 import sys
-import os
-from pandas_datareader import data
+from concurrent.futures import ProcessPoolExecutor
 
 
 class SymbolsHelper:
@@ -13,12 +18,19 @@ class SymbolsHelper:
     or that holds information so that it doesn't need to be redownloaded and
     thus increasing function speeds.
     """
-    def __init__(self):
+    def __init__(self, price_panel=None):
         # This dictionary holds a dataframe of historical information for
         # each symbol that needs it. This dict looks like this:
         # {'symbol1': dataframe1, 'symbol2': dataframe2, ...}
         self.symbol_data_dict = {}
 
+        # An optional PricePanel (see price_panel.py) holding the historical
+        # information for many symbols in shared memory. When a symbol is in
+        # it, the dataframe in symbol_data_dict is a view into the panel
+        # instead of its own copy, and worker processes read from the panel
+        # instead of being sent the data.
+        self.price_panel = price_panel
+
         # This dictionary holds the relevant backtesters that have last been
         # used for each symbol. This is in part necessary because it helps
         # the program realize what type of backtester (Hodl, MACD, SMA, etc)
@@ -34,7 +46,35 @@ class SymbolsHelper:
         self.obtained_symbols_dict = None
 
 
-def run_backtester(backtester, symbol_data):
+# Dataframes loaded ahead of time by preload_symbol_data(). Processes that are
+# forked after they're loaded share them with the parent (copy-on-write)
+# instead of each loading their own copy.
+# {'symbol1': dataframe1, 'symbol2': dataframe2, ...}
+preloaded_data = {}
+
+
+def preload_symbol_data(symbols, start_date):
+    """
+    Loads the historical data for many symbols into preloaded_data, so that
+    get_symbol_data and compare_against_spy don't need to load it again. This
+    is meant to be called once before forking worker processes that each run
+    setup_backtesters (see stat_analysis.download_data).
+    :param symbols: A list of symbols to load, e.g. every symbol in the s&p500.
+    :param start_date: String; the earliest date that will be needed.
+    YYYY-mm-dd.
+    :return: Nothing; the data is saved into preloaded_data.
+    """
+    store = price_store.PriceStore()
+    for symbol in symbols:
+        if store.has_symbol(symbol):
+            preloaded_data[symbol] = store.load_frame(symbol,
+                                                      start_date=start_date)
+        else:
+            preloaded_data[symbol] = finlib.load_financial_data(
+                symbol, start_date=start_date, end_date=None, save=True)
+
+
+def run_backtester(backtester, symbol_data, engine=None):
     """
     This function uses the data in symbol_data, as well as the buying/selling/
     holding conditions in backtester, to run through historical data on a symbol
@@ -43,33 +83,43 @@ def run_backtester(backtester, symbol_data):
     :param backtester: An initialized backtester class from backtesters.py
     :param symbol_data: A dataframe obtained from yahoo finance containing
     information on a stock's historical trade data
+    :param engine: String; either 'event' to feed the backtester one day at a
+    time, or 'vectorized' to have it compute everything over whole arrays at
+    once. If None, the backtester's own engine attribute is used.
     :return: The backtester in the input stores all of the information, so this
     function does not need to return anything.
     """
-    for i in range(len(symbol_data)):  # Read in symbol data
-        # Daily information, consolidated into a dictionary.
-        price_info = {'Date': symbol_data.index[i],
-                      'Adj Close': float(symbol_data['Adj Close'][i]),
-                      'High': float(symbol_data['High'][i]),
-                      'Low': float(symbol_data['Low'][i]),
-                      'Open': float(symbol_data['Open'][i]),
-                      'Close': float(symbol_data['Close'][i]),
-                      'Volume': float(symbol_data['Volume'][i])}
-
-        # The action that the backtester decides to do, given the price
-        # information. This can be 'buy', 'sell', or 'hold'.
-        action = backtester.on_market_data_received(price_info)
-        # Running this action back into the backtester to simulate market
-        # actions.
-        backtester.buy_sell_or_hold(price_info, action)
-
-    # Create the dataframe that will hold all the symbol's and trading
-    # data.
-    backtester.create_dataframe()
+    if engine is None:
+        engine = backtester.engine
+
+    if engine == 'vectorized':
+        # The backtester works through every day of symbol_data at once.
+        backtester.run_vectorized(symbol_data)
+    else:
+        # Make room in the backtester's ledger for every day up front.
+        backtester.ledger.reserve(len(symbol_data))
+        backtester.record_source(symbol_data)
+        for i in range(len(symbol_data)):  # Read in symbol data
+            # Daily information, consolidated into a dictionary.
+            price_info = {'Date': symbol_data.index[i],
+                          'Adj Close': float(symbol_data['Adj Close'][i]),
+                          'High': float(symbol_data['High'][i]),
+                          'Low': float(symbol_data['Low'][i]),
+                          'Open': float(symbol_data['Open'][i]),
+                          'Close': float(symbol_data['Close'][i]),
+                          'Volume': float(symbol_data['Volume'][i])}
+
+            # The action that the backtester decides to do, given the price
+            # information. This can be 'buy', 'sell', or 'hold'.
+            action = backtester.on_market_data_received(price_info)
+            # Running this action back into the backtester to simulate market
+            # actions.
+            backtester.buy_sell_or_hold(price_info, action)
     return
 
 
-def examine_backtesters(symbol_data, cash, backtester_names=None):
+def examine_backtesters(symbol_data, cash, backtester_names=None,
+                        sweep=False):
     """
     This function initializes and runs (through the helper function
     run_backtester) one/multiple backtesters, and returns the backtester with
@@ -81,6 +131,9 @@ def examine_backtesters(symbol_data, cash, backtester_names=None):
     backtesters that the programmer wants to initialize to test. If None,
     this function initializes a preset list of backtesters (see
     backtesters.backtesters(cash))
+    :param sweep: Bool; if True, the MACD grid in parameter_sweep.py is swept
+    over symbol_data first, and the MACD with the best periods is examined
+    along with the other backtesters. Default is False.
     :return: The backtester that obtained the higehst sharpe ratio over
     the symbol_data.
     """
@@ -92,13 +145,21 @@ def examine_backtesters(symbol_data, cash, backtester_names=None):
     else:
         list_of_backtesters = backtesters.backtesters(cash)
 
+    if sweep:
+        table = parameter_sweep.sweep_symbol(symbol_data, cash,
+                                             strategies=['MACD'])
+        best_name = table['Name'].iloc[0]
+        if best_name not in [bt.name for bt in list_of_backtesters]:
+            list_of_backtesters.append(
+                backtesters.find_backtester(best_name, cash))
+
     # Return the best backtester, where best = highest sharpe ratio
     res_backtester = None
     res_backtester_sharpe = None
     for backtester in list_of_backtesters:
         run_backtester(backtester, symbol_data)
         backtesters.organize_backtester(backtester)
-        sharpe_ratio = finlib.tangency_summary(backtester.historical_data)
+        sharpe_ratio = finlib.tangency_summary(backtester.results)
         if res_backtester_sharpe is None or \
                 res_backtester_sharpe < sharpe_ratio:
             res_backtester = backtester
@@ -108,11 +169,17 @@ def examine_backtesters(symbol_data, cash, backtester_names=None):
     return res_backtester
 
 
-def run_tangency_portfolio(wts_tangency, cash, symb_help):
+def run_tangency_portfolio(wts_tangency, cash, symb_help, exact=False,
+                           use_cache=True):
     """
     This function calculates the excess returns of a single-industry tangency
-    portfolio by running previously chosen backtesters with updated cash
-    allotments.
+    portfolio from the results of each symbol's previously chosen backtester,
+    with updated cash allotments.
+    Every symbol has already been backtested in examine_backtesters, so by
+    default its totals are just rescaled to its new allotment instead of being
+    run again. That is exact for backtesters like Hodl whose results scale
+    with cash, and very close for the rest, which only differ because of the
+    rounding down to whole shares.
     :param wts_tangency: A pandas series that contains the respective weight
     for each symbol inside of an industry. The symbol's weight * cash =
     the amount of money allocated to that symbol.
@@ -120,29 +187,52 @@ def run_tangency_portfolio(wts_tangency, cash, symb_help):
     distributed in different weights to each symbol.
     :param symb_help: Initialized SymbolHelper class that contains information
     on the symbols being used + their backtesters.
+    :param exact: Bool; if True, the backtesters whose results don't scale
+    with cash (see Backtester.scales_with_cash) are run again with their new
+    allotment so that their whole-share rounding is exact. Default is False.
+    :param use_cache: Bool; whether to look those re-runs up in the backtest
+    cache (see backtest_cache.py) before running them. Default is True.
     :return: tangency_res, a dataframe that holds net cash + holdings per day
     for the industry as a total, after weighing each symbol.
     """
-    tangency_res = None  # A dataframe holding cash + holdings per day
+    cache = backtest_cache.open_cache() if use_cache else None
+    daily_total = None  # Numpy array holding cash + holdings per day
+    index = None  # The dates of daily_total
 
-    # Let's loop through all symbols in the tangency portfolio we found, run
-    # their respective backtester, and append to tangency_res their cash +
-    # holdings per day.
+    # Let's loop through all symbols in the tangency portfolio we found, get
+    # the results of their respective backtester, and add their cash +
+    # holdings per day into daily_total.
     for symbol, weight in wts_tangency.iteritems():
         allocation = cash * weight
-        bt_name = symb_help.symbol_backtesters_dict[symbol].name
-        bt = backtesters.find_backtester(bt_name, allocation)
-        symbol_data = symb_help.symbol_backtesters_dict[symbol].historical_data
-        run_backtester(bt, symbol_data)
-        backtesters.organize_backtester(bt)
-
-        if tangency_res is None:
-            tangency_res = pd.DataFrame(data=bt.list_total,
-                                        index=bt.historical_data.index,
-                                        columns=['Total'])
+        symbol_bt = symb_help.symbol_backtesters_dict[symbol]
+        index = symbol_bt.results.index
+
+        if exact and not symbol_bt.scales_with_cash:
+            symbol_data = symbol_bt.source_data()
+            entry = None
+            if cache is not None:
+                key = cache.key(symbol_data, allocation, [symbol_bt.name])
+                entry = cache.get(key)
+            if entry is not None:
+                _, _, cash_held, holdings, _ = entry
+                symbol_total = cash_held + holdings
+            else:
+                bt = backtesters.find_backtester(symbol_bt.name, allocation)
+                run_backtester(bt, symbol_data)
+                symbol_total = bt.list_total
+                if cache is not None:
+                    cache.put(key, bt.name, bt.list_position, bt.list_cash,
+                              bt.list_holdings, bt.snapshot())
+        else:
+            symbol_total = symbol_bt.scaled_total(allocation)
+
+        if daily_total is None:
+            daily_total = np.asarray(symbol_total, dtype=float)
         else:
-            tangency_res['Total'] = tangency_res['Total'] + \
-                                    bt.list_total
+            daily_total = daily_total + symbol_total
+
+    tangency_res = pd.DataFrame(data=daily_total, index=index,
+                                columns=['Total'])
 
     # Calculating excess return
     finlib.excess_returns(tangency_res, risk_free_rate=0.05/252,
@@ -151,11 +241,12 @@ def run_tangency_portfolio(wts_tangency, cash, symb_help):
     return tangency_res
 
 
-def run_final_tangency_portfolio(main_wts, industry_wts, cash, symb_help):
+def run_final_tangency_portfolio(main_wts, industry_wts, cash, symb_help,
+                                 exact=False, use_cache=True):
     """
     This function calculates the excess returns of a multi-industry tangency
-    tangency portfolio by running previously chosen backtesters with updated
-    cash allotments.
+    tangency portfolio from the results of previously chosen backtesters with
+    updated cash allotments.
     :param main_wts: A pandas series that contains the respective weight for
     each industry inside of the main portfolio. The industry's weight * cash =
     the amount of money allocated to that industry
@@ -167,6 +258,10 @@ def run_final_tangency_portfolio(main_wts, industry_wts, cash, symb_help):
     distributed in different weights to each symbol.
     :param symb_help: initialized SymbolHelper class that contains information
     on the symbols being used + their backtesters.
+    :param exact: Bool; whether to re-run backtesters whose results don't
+    scale with cash (see run_tangency_portfolio). Default is False.
+    :param use_cache: Bool; whether those re-runs are looked up in the
+    backtest cache first (see run_tangency_portfolio). Default is True.
     :return: daily_total, a dataframe that holds net cash + holdings per day
     for the portfolio as a total, after weighing each industry and symbol.
     """
@@ -182,7 +277,8 @@ def run_final_tangency_portfolio(main_wts, industry_wts, cash, symb_help):
         print("Running tangency portfolio for (" + industry + ") with $" +
               str(industry_cash))
         tangency_res = run_tangency_portfolio(industry_wts[industry],
-                                              industry_cash, symb_help)
+                                              industry_cash, symb_help,
+                                              exact=exact, use_cache=use_cache)
 
         if daily_total is None:
             daily_total = pd.DataFrame(data=tangency_res['Total'],
@@ -204,8 +300,25 @@ def run_final_tangency_portfolio(main_wts, industry_wts, cash, symb_help):
     return daily_total
 
 
+def date_offsets(index, start_date=None, end_date=None):
+    """
+    Finds the rows of a sorted date index that are between two dates,
+    inclusive, with a binary search instead of slicing by label.
+    :param index: A sorted pandas DatetimeIndex, e.g. a symbol data's index.
+    :param start_date: String (or None); the first date wanted. YYYY-mm-dd.
+    :param end_date: String (or None); the last date wanted. YYYY-mm-dd.
+    :return: A tuple (lo, hi) such that index[lo:hi] are within the dates.
+    """
+    lo, hi = 0, len(index)
+    if start_date is not None:
+        lo = int(index.searchsorted(pd.Timestamp(start_date), side='left'))
+    if end_date is not None:
+        hi = int(index.searchsorted(pd.Timestamp(end_date), side='right'))
+    return lo, max(lo, hi)
+
+
 def run_out_of_sample(main_wts, industry_wts, cash, start_date, end_date,
-                      symb_help):
+                      symb_help, warm_start=False):
     """
     This function organizes the functions necessary to run a finished portfolio
     out of sample.
@@ -220,12 +333,20 @@ def run_out_of_sample(main_wts, industry_wts, cash, start_date, end_date,
     YYYY-mm-dd.
     :param symb_help: Initialized SymbolHelper class that contains information
     on the symbols being used + their backtesters.
+    :param warm_start: Bool; if False, each symbol's backtester starts over
+    on start_date with an empty model (so e.g. MACD holds for its first
+    long_period days). If True, it picks up where the in-sample backtester
+    left off instead (see Backtester.snapshot): its model is continued through
+    any days between the end of in-sample and start_date, and its account is
+    then scaled to the symbol's cash, keeping whatever position it held.
+    Default is False.
     :return: daily_total, a dataframe holding cash + holdings per day for
     the entire portfolio.
     """
     print("\n\n*** Now running the portfolio on out-of-sample data")
     print("Start date: " + start_date + ", end date: " + end_date)
-    daily_total = None  # A dataframe holding cash + holdings per day
+    daily_total = None  # Numpy array holding cash + holdings per day
+    index = None  # The dates of daily_total
 
     for industry, industry_wt in main_wts.iteritems():
         industry_cash = cash * industry_wt
@@ -237,22 +358,48 @@ def run_out_of_sample(main_wts, industry_wts, cash, start_date, end_date,
             symbol_cash = industry_cash * symbol_wt
             # Initialize new 'backtester' that is acting as out-of-sample data
             # First, find what kind of backtester we used in-sample:
-            bt_name = symb_help.symbol_backtesters_dict[symbol].name
-            bt = backtesters.find_backtester(bt_name, symbol_cash)
+            in_sample_bt = symb_help.symbol_backtesters_dict[symbol]
+            bt = backtesters.find_backtester(in_sample_bt.name, symbol_cash)
+
+            # The out-of-sample days are found by their row numbers, so the
+            # symbol's data is never sliced by date label.
+            symbol_data = symb_help.symbol_data_dict[symbol]
+            lo, hi = date_offsets(symbol_data.index, start_date, end_date)
+
+            if warm_start:
+                state = in_sample_bt.snapshot()
+                if state['date'] is None or \
+                        (lo < len(symbol_data) and
+                         state['date'] >= symbol_data.index[lo]):
+                    # In-sample doesn't end before out-of-sample starts, so
+                    # there's nothing to continue from.
+                    print("Can't warm start " + symbol + ", starting over")
+                else:
+                    bt.restore(state)
+                    # Catch the model up on the days in between (the ones
+                    # after the snapshot's date and before start_date), then
+                    # start the out-of-sample account.
+                    _, gap_lo = date_offsets(symbol_data.index,
+                                             start_date=None,
+                                             end_date=state['date'])
+                    if gap_lo < lo:
+                        print("Catching " + symbol + "'s model up on",
+                              lo - gap_lo, "days")
+                        run_backtester(bt, symbol_data.iloc[gap_lo:lo])
+                    bt.reset_account(symbol_cash)
 
             # Then, run the backtester on out-of-sample data
-            symbol_data = \
-                symb_help.symbol_data_dict[symbol].loc[start_date:end_date, :]
-            run_backtester(bt, symbol_data)
-            backtesters.organize_backtester(bt)
+            run_backtester(bt, symbol_data.iloc[lo:hi])
 
             # Finally, put the info we got into daily_total
             if daily_total is None:
-                daily_total = pd.DataFrame(data=bt.list_total,
-                                           index=bt.historical_data.index,
-                                           columns=['Total'])
+                daily_total = np.asarray(bt.list_total, dtype=float)
+                index = symbol_data.index[lo:hi]
             else:
-                daily_total['Total'] = daily_total['Total'] + bt.list_total
+                daily_total = daily_total + bt.list_total
+
+    daily_total = pd.DataFrame(data=daily_total, index=index,
+                               columns=['Total'])
 
     # Calculating excess returns
     finlib.excess_returns(daily_total, risk_free_rate=0.05 / 252,
@@ -268,7 +415,8 @@ def run_out_of_sample(main_wts, industry_wts, cash, start_date, end_date,
 
 
 def get_symbol_data(start_date, end_date, num_symbols, symb_help,
-                    testing=False):
+                    testing=False, seed=None, provider=None,
+                    symbols_dict=None, constituents_version=None):
     """
     This function gets all of the symbols for the soon-to-be-created portfolio,
     as well as downloading all of the data necessary for each of those symbols.
@@ -282,14 +430,57 @@ def get_symbol_data(start_date, end_date, num_symbols, symb_help,
     :param testing: Bool; a variable that helps speed up the function when
     testing. If True, instead of finding symbols for each industry, only
     the first two industries are used. Default is False.
+    :param seed: Int (or None); seeds which symbols are randomly picked (see
+    obtain_symbols.get_random_symbols). Default is None.
+    :param provider: Where missing days are downloaded from (see
+    data_providers.py). Defaults to a YahooProvider.
+    :param symbols_dict: A dictionary {'industry1': ['sym1', ...], ...} of the
+    symbols to use, instead of picking them randomly (e.g. every symbol in
+    the s&p500; see universe.py). num_symbols, testing and seed are then
+    ignored. Default is None.
+    :param constituents_version: String; the snapshot of the s&p500 that
+    symbols (and the ones replacing tossed symbols) are picked from (see
+    obtain_symbols.load_constituents). If None, the latest snapshot is used.
     :return: Nothing; all information needed is saved into symb_help
     """
     print("\n*** Getting relevant data for every symbol used.")
 
     # Getting symbols from each GICS industry.
     # It looks like such: {'industry1': ['sym1', 'sym2'], 'industry2': ['sym3']}
-    symb_help.obtained_symbols_dict = obtain_symbols.obtain_symbols(
-        num_symbols=num_symbols, testing=testing)
+    if symbols_dict is not None:
+        symb_help.obtained_symbols_dict = {
+            industry: list(symbols_dict[industry])
+            for industry in symbols_dict}
+    else:
+        symb_help.obtained_symbols_dict = obtain_symbols.obtain_symbols(
+            num_symbols=num_symbols, testing=testing, seed=seed,
+            version=constituents_version)
+
+    # Data in symb_help's price panel, or that was preloaded (see
+    # preload_symbol_data), is used first. Otherwise the data comes from the
+    # columnar store (see price_store.py): symbols that aren't in it yet are
+    # added from their pickle (or yahoo finance), and symbols whose data in it
+    # is out of date only have their missing days downloaded.
+    store = price_store.PriceStore()
+    if provider is None:
+        provider = data_providers.YahooProvider()
+
+    # Symbols that aren't anywhere yet are all downloaded at once, rather
+    # than one at a time in the loop below. The ones that can't be downloaded
+    # are left out of the store, so they get tossed like any other symbol
+    # without enough data.
+    missing_symbols = [
+        symbol for industry in symb_help.obtained_symbols_dict
+        for symbol in symb_help.obtained_symbols_dict[industry]
+        if not (symb_help.price_panel is not None and
+                symb_help.price_panel.has_symbol(symbol)) and
+        symbol not in preloaded_data and not store.has_symbol(symbol)]
+    if missing_symbols:
+        frames, _ = finlib.load_many_financial_data(
+            missing_symbols, start_date=start_date, end_date=end_date,
+            save=True, provider=provider)
+        for symbol in frames:
+            store.put(symbol, frames[symbol])
 
     # Get data for each symbol
     print("\nDownloading financial data from yahoo for each symbol")
@@ -300,37 +491,55 @@ def get_symbol_data(start_date, end_date, num_symbols, symb_help,
 
         for symbol in symb_help.obtained_symbols_dict[industry]:
             print("Working with:", symbol)
-            symbol_data = finlib.load_financial_data(symbol=symbol,
-                                                     start_date=start_date,
-                                                     end_date=end_date,
-                                                     save=True)
-
             # Correct number of trading days, to check if dataframe has all info
             num_trading_days = finlib.num_nyse_trading_days(start_date,
                                                             end_date)
-            # Collected number of trading days
-            symbol_days = symbol_data.loc[start_date:end_date, :].shape[0]
 
-            if symbol_days < num_trading_days:
-                # It's possible the symbol data isn't lining up because the
-                # downloaded data we have is not up to date. As such, let's
-                # check if downloading the data online fixes that.
-                test_df = data.DataReader(symbol, 'yahoo', start=start_date,
-                                          end=end_date)
-                if test_df.loc[start_date:end_date, :].shape[0] == \
+            symbol_data = None
+            if symb_help.price_panel is not None and \
+                    symb_help.price_panel.has_symbol(symbol):
+                symbol_data = symb_help.price_panel.frame(symbol,
+                                                          start_date=start_date)
+            if symbol_data is None:
+                symbol_data = preloaded_data.get(symbol)
+            if symbol_data is not None:
+                if symbol_data.loc[start_date:end_date, :].shape[0] < \
                         num_trading_days:
-                    print("The data we downloaded is not up to date, so "
-                          "it should be redownloaded.")
-                    # In this case it's because the downloaded data we have is
-                    # not up to date. As such, let's redownload all of it and
-                    # redo our info that we got.
-                    file_path = '../symbol_data/' + symbol + '.pkl'
-                    os.remove(file_path)
-                    symbol_data = finlib.load_financial_data(symbol, file_path,
-                                                             start_date,  None,
-                                                             True)
-
-                    symbol_days = symbol_data.loc[start_date:end_date, :].shape[0]
+                    print("The preloaded data is not up to date.")
+                    symbol_data = None
+
+            if symbol_data is None:
+                if not store.has_symbol(symbol):
+                    # Only symbols that replaced a tossed one (or whose
+                    # preloaded data was out of date) get here.
+                    frames, _ = finlib.load_many_financial_data(
+                        [symbol], start_date=start_date, end_date=end_date,
+                        save=True, provider=provider)
+                    if symbol in frames:
+                        store.put(symbol, frames[symbol])
+
+                # Checking if the data is up to date only looks at the store's
+                # manifest, so nothing is loaded until we know it's needed.
+                if not store.has_symbol(symbol):
+                    # It couldn't be downloaded, so it has no data at all.
+                    symbol_data = pd.DataFrame(
+                        columns=price_store.FIELDS,
+                        index=pd.DatetimeIndex([], name='Date'))
+                else:
+                    if store.symbol_rows(symbol, start_date, end_date) < \
+                            num_trading_days:
+                        print("The data in the price store is not up to date, "
+                              "so the missing days will be downloaded.")
+                        try:
+                            store.refresh(symbol, provider, end_date=end_date)
+                        except Exception as e:
+                            print("Couldn't download " + symbol +
+                                  "'s missing days:", e)
+                    symbol_data = store.load_frame(symbol,
+                                                   start_date=start_date)
+
+            # Collected number of trading days
+            symbol_days = symbol_data.loc[start_date:end_date, :].shape[0]
 
             if symbol_days < num_trading_days:
                 # We couldn't find all of the required data for that symbol
@@ -340,7 +549,9 @@ def get_symbol_data(start_date, end_date, num_symbols, symb_help,
                 print(symbol + " doesn't have full yahoo finance info, toss and"
                                " get new symbol")
                 new_symbol = obtain_symbols.new_symbol(
-                    symbol, industry, symb_help.obtained_symbols_dict[industry])
+                    symbol, industry,
+                    symb_help.obtained_symbols_dict[industry],
+                    version=constituents_version)
                 if new_symbol is None:
                     # This happens when the program tries to find a new symbol,
                     # but there aren't new symbols in the S&P500 to use (aka all
@@ -363,7 +574,43 @@ def get_symbol_data(start_date, end_date, num_symbols, symb_help,
             symb_help.obtained_symbols_dict[industry].remove(symbol)
 
 
-def get_backtester_data(start_date, end_date, cash, symb_help):
+def examine_symbol(job):
+    """
+    Runs examine_backtesters for a single symbol. This is what each worker
+    process does when get_backtester_data is run with more than one worker,
+    so it only takes and returns plain arrays instead of whole dataframes
+    and backtesters.
+    :param job: A tuple (symbol, dates, columns, cash, sweep, panel), where
+    dates is a numpy array of the symbol data's index and columns is a
+    dictionary {'column1': numpy array, ...} of its columns, and sweep is
+    passed to examine_backtesters. If the symbol's data is in a price panel
+    (see price_panel.py), panel is a tuple (descriptor, start_date, end_date)
+    and the data is read straight out of the panel's shared memory instead,
+    with dates and columns being None. Otherwise panel is None.
+    :return: A tuple (symbol, name, position, cash, holdings, state) of the
+    symbol, the name of the best backtester, that backtester's position, cash
+    and holdings on each date, and its state on the last date (see
+    Backtester.snapshot).
+    """
+    symbol, dates, columns, cash, sweep, panel = job
+    if panel is not None:
+        descriptor, start_date, end_date = panel
+        symbol_data = price_panel.PricePanel.attach(descriptor).frame(
+            symbol, start_date=start_date, end_date=end_date)
+    else:
+        symbol_data = pd.DataFrame(columns,
+                                   index=pd.DatetimeIndex(dates, name='Date'))
+    print("Running backtesters for", symbol)
+    best_backtester = examine_backtesters(symbol_data, cash=cash, sweep=sweep)
+    return symbol, best_backtester.name, \
+        np.asarray(best_backtester.list_position, dtype=float), \
+        np.asarray(best_backtester.list_cash, dtype=float), \
+        np.asarray(best_backtester.list_holdings, dtype=float), \
+        best_backtester.snapshot()
+
+
+def get_backtester_data(start_date, end_date, cash, symb_help, num_workers=1,
+                        sweep=False, use_cache=True):
     """
     This function loops through all symbols listed in symb_help in order to
     initialize their backtesters and run them as well.
@@ -372,16 +619,114 @@ def get_backtester_data(start_date, end_date, cash, symb_help):
     :param cash: Int; the amount of cash to use in the backtester.
     :param symb_help: Initialized SymbolHelper class that contains information
     on the symbols being used + their backtesters.
+    :param num_workers: Int; the number of processes to spread the symbols
+    across. Each symbol is independent of the others, so with more than one
+    worker the symbols are examined in parallel and only the winning
+    backtester's results are sent back. Defaults to 1, which runs every
+    symbol in this process. None uses one worker per cpu.
+    :param sweep: Bool; whether to sweep MACD periods for each symbol (see
+    examine_backtesters). Default is False.
+    :param use_cache: Bool; whether to look each symbol up in the backtest
+    cache (see backtest_cache.py) first, and only run the backtesters of the
+    symbols that aren't in it. Default is True.
     :return: Nothing; all relevant information is saved into symb_help.
     """
 
     print("\n*** Initializing and running backtesters for each symbol")
+    cache = backtest_cache.open_cache() if use_cache else None
+    keys = {}  # {'symbol': its key in the cache}
+    # {'symbol': its best backtester}, filled in from the cache first
+    found = {}
+    if cache is not None:
+        for symbol in symb_help.symbol_data_dict:
+            symbol_data = \
+                symb_help.symbol_data_dict[symbol].loc[start_date:end_date, :]
+            keys[symbol] = cache.key(symbol_data, cash, sweep=sweep)
+            entry = cache.get(keys[symbol])
+            if entry is not None:
+                print("Found", symbol + "'s backtester in the cache")
+                name, position, cash_held, holdings, state = entry
+                found[symbol] = \
+                    backtesters.rebuild_backtester(name, cash, symbol_data,
+                                                   position, cash_held,
+                                                   holdings, state=state)
+    # The symbols that still need to be run.
+    symbols = [symbol for symbol in symb_help.symbol_data_dict
+               if symbol not in found]
+
+    if num_workers == 1:
+        for symbol in symbols:
+            symbol_data = \
+                symb_help.symbol_data_dict[symbol].loc[start_date:end_date, :]
+            print("Running backtesters for", symbol)
+            best_backtester = examine_backtesters(symbol_data, cash=cash,
+                                                  sweep=sweep)
+            found[symbol] = best_backtester
+            if cache is not None:
+                cache.put(keys[symbol], best_backtester.name,
+                          best_backtester.list_position,
+                          best_backtester.list_cash,
+                          best_backtester.list_holdings,
+                          best_backtester.snapshot())
+    else:
+        run_symbols_in_parallel(symbols, start_date, end_date, cash, symb_help,
+                                num_workers, sweep, cache, keys, found)
+
+    # Saved in the same order as symbol_data_dict, no matter which symbols
+    # were found in the cache.
     for symbol in symb_help.symbol_data_dict:
+        symb_help.symbol_backtesters_dict[symbol] = found[symbol]
+
+
+def run_symbols_in_parallel(symbols, start_date, end_date, cash, symb_help,
+                            num_workers, sweep, cache, keys, found):
+    """
+    The part of get_backtester_data that examines symbols in worker processes.
+    :param symbols: A list of the symbols to examine.
+    :param start_date: String; the starting date for the backtester's data.
+    :param end_date: String; the ending date for the backtester's data.
+    :param cash: Int; the amount of cash to use in the backtester.
+    :param symb_help: Initialized SymbolHelper class that contains information
+    on the symbols being used + their backtesters.
+    :param num_workers: Int; the number of processes (see get_backtester_data).
+    :param sweep: Bool; whether to sweep MACD periods for each symbol.
+    :param cache: The BacktestCache the results are saved to, or None.
+    :param keys: A dictionary {'symbol': its key in the cache}.
+    :param found: A dictionary {'symbol': its best backtester} that the
+    results are added to.
+    :return: Nothing.
+    """
+    panel = symb_help.price_panel
+    if panel is not None:
+        descriptor = panel.descriptor()
+    jobs = []
+    for symbol in symbols:
         symbol_data = \
             symb_help.symbol_data_dict[symbol].loc[start_date:end_date, :]
-        print("Running backtesters for", symbol)
-        best_backtester = examine_backtesters(symbol_data, cash=cash)
-        symb_help.symbol_backtesters_dict[symbol] = best_backtester
+        if panel is not None and panel.is_view(symbol_data):
+            # The workers read the data out of shared memory themselves.
+            jobs.append((symbol, None, None, cash, sweep,
+                         (descriptor, start_date, end_date)))
+            continue
+        columns = {column: symbol_data[column].to_numpy()
+                   for column in symbol_data.columns}
+        jobs.append((symbol, symbol_data.index.values, columns, cash, sweep,
+                     None))
+
+    if not jobs:
+        return
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        for symbol, name, position, cash_held, holdings, state in \
+                executor.map(examine_symbol, jobs):
+            symbol_data = \
+                symb_help.symbol_data_dict[symbol].loc[start_date:end_date, :]
+            found[symbol] = \
+                backtesters.rebuild_backtester(name, cash, symbol_data,
+                                               position, cash_held, holdings,
+                                               state=state)
+            if cache is not None:
+                cache.put(keys[symbol], name, position, cash_held, holdings,
+                          state)
 
 
 def compare_against_spy(tangency_res, cash, start_date, end_date):
@@ -406,9 +751,12 @@ def compare_against_spy(tangency_res, cash, start_date, end_date):
 
     # Download the data for the regressor
     print("Working with: SPY")
-    spy = finlib.load_financial_data('SPY', start_date=start_date,
-                                     end_date=end_date)
-    spy = spy.loc[start_date:end_date, :]
+    if 'SPY' in preloaded_data:
+        spy = preloaded_data['SPY'].loc[start_date:end_date, :].copy()
+    else:
+        spy = finlib.load_financial_data('SPY', start_date=start_date,
+                                         end_date=end_date)
+        spy = spy.loc[start_date:end_date, :]
     # Now let's compare profits
     spy_backtester = examine_backtesters(spy, cash, backtester_names=['HODL'])
     summary = finlib.backtester_summary(spy_backtester)
@@ -429,7 +777,10 @@ def compare_against_spy(tangency_res, cash, start_date, end_date):
     return spy_backtester, regression_summary
 
 
-def setup_backtesters(cash, num_symbols, start_date, end_date, testing=False):
+def setup_backtesters(cash, num_symbols, start_date, end_date, testing=False,
+                      num_workers=1, exact=False, sweep=False, seed=None,
+                      panel=None, provider=None, use_cache=True,
+                      constituents_version=None):
     """
     The main function that helps create and analyze the randomly generated
     portfolio. All functions above are used in this function.
@@ -440,6 +791,24 @@ def setup_backtesters(cash, num_symbols, start_date, end_date, testing=False):
     :param testing: Bool; a variable that helps speed up the function when
     testing. If True, instead of finding symbols for each industry, only
     the first two industries are used. Default is False.
+    :param num_workers: Int; the number of processes used to pick each
+    symbol's backtester (see get_backtester_data). Default is 1.
+    :param exact: Bool; whether the tangency portfolios re-run backtesters
+    whose results don't scale with cash, instead of rescaling their results
+    (see run_tangency_portfolio). Default is False.
+    :param sweep: Bool; whether to sweep MACD periods for each symbol before
+    picking its backtester (see examine_backtesters). Default is False.
+    :param seed: Int (or None); seeds which symbols are randomly picked, so
+    that the same portfolio can be built again. Default is None.
+    :param panel: A PricePanel (see price_panel.py) to read symbols' data from
+    before anywhere else, or None. Default is None.
+    :param provider: Where missing days of data are downloaded from (see
+    data_providers.py). Defaults to a YahooProvider.
+    :param use_cache: Bool; whether backtester results are looked up in (and
+    saved to) the backtest cache, see backtest_cache.py. Default is True.
+    :param constituents_version: String; the snapshot of the s&p500 that
+    symbols are picked from (see get_symbol_data). If None, the latest
+    snapshot is used.
     :return:
     1) wts_tangency_final: A dataframe holding the weights of each industry
     for the final portfolio.
@@ -455,39 +824,41 @@ def setup_backtesters(cash, num_symbols, start_date, end_date, testing=False):
     regression computed between SPY and the portfolio's results.
     """
 
-    symbol_helper = SymbolsHelper()
+    symbol_helper = SymbolsHelper(price_panel=panel)
 
     # Getting relevant data for every symbol used
     # End date is none because we want to download all data available
     get_symbol_data(start_date=start_date, end_date=None,
                     num_symbols=num_symbols, testing=testing,
-                    symb_help=symbol_helper)
+                    symb_help=symbol_helper, seed=seed, provider=provider,
+                    constituents_version=constituents_version)
 
     # Initializing and running backtesters for each symbol
     get_backtester_data(start_date=start_date, end_date=end_date, cash=cash,
-                        symb_help=symbol_helper)
+                        symb_help=symbol_helper, num_workers=num_workers,
+                        sweep=sweep, use_cache=use_cache)
 
     print("\n*** Computing tangency portfolios for each industry")
-    industry_wts = {}  # {industry: industry_weight (% of cash to allocate)}
+    # {industry: dataframe holding excess returns for each symbol}
+    symbol_excess_returns = {}
     for industry in symbol_helper.obtained_symbols_dict:
         excess_returns = None  # Dataframe holding excess returns for each ind.
-        sharpe_ratio_dict = {}
         for symbol in symbol_helper.obtained_symbols_dict[industry]:
-            # Get historical data from each symbol's backtester
-            hist_data = \
-                symbol_helper.symbol_backtesters_dict[symbol].historical_data
+            # Get the results of each symbol's backtester
+            hist_data = symbol_helper.symbol_backtesters_dict[symbol].results
 
             if excess_returns is None:  # Initializing the dataframe
                 excess_returns = pd.DataFrame(index=hist_data.index)
             excess_returns[symbol] = hist_data['Excess Return']
+        symbol_excess_returns[industry] = excess_returns
 
-            sharpe_ratio_dict[symbol] = \
-                finlib.get_annualized_sharpe_ratio_df(hist_data)
-
-        # Compute tangency portfolio
-        wts_tangency, mu_tilde, sigma = \
-            finlib.compute_tangency(excess_returns, diagonalize=False)
+    # Compute every industry's tangency portfolio at once
+    tangencies = finlib.compute_tangencies(symbol_excess_returns,
+                                           diagonalize=False)
 
+    industry_wts = {}  # {industry: industry_weight (% of cash to allocate)}
+    for industry in tangencies:
+        wts_tangency, mu_tilde, sigma = tangencies[industry]
         sharpe = finlib.get_annualized_sharpe_ratio_wts(wts_tangency, mu_tilde,
                                                         sigma)
         print("Theoretical Sharpe ratio for " + industry + ":",
@@ -501,7 +872,8 @@ def setup_backtesters(cash, num_symbols, start_date, end_date, testing=False):
         print("\nRunning tangency portfolio for (" + industry + ") with $" +
               str(cash))
         tangency_res = run_tangency_portfolio(industry_wts[industry],
-                                              cash, symbol_helper)
+                                              cash, symbol_helper, exact=exact,
+                                              use_cache=use_cache)
         profit = tangency_res.iloc[-1]['Total'] - cash
         annualized_sharpe_ratio = \
             finlib.get_annualized_sharpe_ratio_df(tangency_res)
@@ -530,8 +902,8 @@ def setup_backtesters(cash, num_symbols, start_date, end_date, testing=False):
 
     # Running backtest of main tangency portfolio to see its results
     tangency_res_final = run_final_tangency_portfolio(
-        wts_tangency_final, industry_wts, cash, symbol_helper
-    )
+        wts_tangency_final, industry_wts, cash, symbol_helper, exact=exact,
+        use_cache=use_cache)
 
     # Comparing in-sample results against spy
     spy_res, spy_summary = compare_against_spy(tangency_res_final, cash,
@@ -543,7 +915,7 @@ def setup_backtesters(cash, num_symbols, start_date, end_date, testing=False):
 
 
 def run_backtesters_out_of_sample(port_wts, indust_wts, cash, start_date,
-                                  end_date, symb_help):
+                                  end_date, symb_help, warm_start=False):
     """
     This function runs a created portfolio on data between start_date and
     end_date with those dates typically being out of sample. It also runs
@@ -561,6 +933,8 @@ def run_backtesters_out_of_sample(port_wts, indust_wts, cash, start_date,
     YYYY-mm-dd.
     :param symb_help: Initialized SymbolHelper class that contains information
     on the symbols being used + their backtesters.
+    :param warm_start: Bool; whether each symbol's backtester continues from
+    where it left off in-sample (see run_out_of_sample). Default is False.
     :return:
     1) tangency_res: a dataframe that holds net cash + holdings per day
     for the portfolio as a total, after weighing each industry and symbol.
@@ -569,7 +943,8 @@ def run_backtesters_out_of_sample(port_wts, indust_wts, cash, start_date,
     """
     # Running the portfolio on out of sample data
     tangency_res = run_out_of_sample(port_wts, indust_wts, cash,
-                                     start_date, end_date, symb_help)
+                                     start_date, end_date, symb_help,
+                                     warm_start=warm_start)
 
     # Comparing out of sample results against spy
     spy_res, _ = compare_against_spy(tangency_res, cash, start_date=start_date,
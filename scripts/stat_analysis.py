@@ -6,25 +6,29 @@ in run_backtesters.py. The two functions to begin with are:
 """
 import finlib
 import run_backtesters as rb
+import obtain_symbols
+import results_store
+import universe
 import plot
-import os
+import multiprocessing
 import pandas as pd
 import numpy as np
-import statsmodels.api as sm
 import sys
+import statsmodels.api as sm
 import scipy.stats
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 
-def download_backtest_stats(cash, num_symbols, start_date_insample,
-                            end_date_insample, start_date_outsample,
-                            end_date_outsample, plot_bool=False):
+def compute_backtest_stats(cash, num_symbols, start_date_insample,
+                           end_date_insample, start_date_outsample,
+                           end_date_outsample, plot_bool=False, seed=None,
+                           symbol_universe=None, constituents_version=None):
     """
-    This function's ultimate job is to save all information obtained when
+    This function's ultimate job is to gather all information obtained when
     testing a portfolio through backtesters with in-sample data, and
     the results obtained when running the same portfolio on out-of-sample data.
-    It does so by using the parameters to call functions from run_backtesters.py
-    and save the outputs into the file 'statistics/summary_stats.csv'. Data
-    includes info like backtester profits, sharpe ratios, number of symbols
+    It does so by using the parameters to call functions from run_backtesters.py.
+    Data includes info like backtester profits, sharpe ratios, number of symbols
     used, as well as info from holding SPY during the same time period.
     :param cash: The amount of cash to be used in the portfolio
     :param num_symbols: The number of symbols to be used in each industry.
@@ -38,17 +42,39 @@ def download_backtest_stats(cash, num_symbols, start_date_insample,
     of the profits obtained. Not recommended to be used when running this
     function often (such as overnight), as that will slow the program down
     and take up a lot of memory.
-    :return: Appends all information obtained (as seen in the dictionary
-    'stats') into the file 'statistics/summary_stats.csv'.
+    :param seed: Int (or None); seeds which symbols are randomly picked for
+    the portfolio, so that the same portfolio can be built again. It's saved
+    along with the rest of the stats.
+    :param symbol_universe: The Universe of the in-sample dates (see
+    universe.py), or None. If given, the symbols are picked from it and the
+    portfolio is built straight out of its excess returns, instead of running
+    every symbol's backtesters again (see Universe.setup_portfolio).
+    :param constituents_version: String; the snapshot of the s&p500 that the
+    symbols are picked from (see obtain_symbols.load_constituents). It's
+    saved along with the seed, since the same seed picks different symbols
+    out of a different snapshot. If None, the latest snapshot is used. A
+    universe always uses the snapshot it was built from.
+    :return: A dictionary 'stats' holding all information obtained, with one
+    key per column of 'statistics/summary_stats.csv'.
     """
     # Main dict that we'll use to save all statistics.
     stats = {}
 
     # In-sample information
-    wts_tangency, industry_wts, tangency_res, spy_res, symbol_helper, spy_sum = \
-        rb.setup_backtesters(cash=cash, num_symbols=num_symbols,
-                             start_date=start_date_insample,
-                             end_date=end_date_insample)
+    if symbol_universe is not None:
+        constituents_version = symbol_universe.constituents_version
+        wts_tangency, industry_wts, tangency_res, spy_res, symbol_helper, \
+            spy_sum = symbol_universe.setup_portfolio(
+                cash=cash, num_symbols=num_symbols, seed=seed)
+    else:
+        if constituents_version is None:
+            constituents_version = \
+                obtain_symbols.latest_constituents_version()
+        wts_tangency, industry_wts, tangency_res, spy_res, symbol_helper, \
+            spy_sum = rb.setup_backtesters(
+                cash=cash, num_symbols=num_symbols,
+                start_date=start_date_insample, end_date=end_date_insample,
+                seed=seed, constituents_version=constituents_version)
 
     if plot_bool:
         plot.plot_in_sample_run(
@@ -94,6 +120,9 @@ def download_backtest_stats(cash, num_symbols, start_date_insample,
     stats['r-squared_outsample'] = spy_sum.iloc[0]['R-Squared']
     stats['treynors_ratio_outsample'] = spy_sum.iloc[0]["Treynor's Ratio"]
     stats['information_ratio_outsample'] = spy_sum.iloc[0]["Information Ratio"]
+    stats['seed'] = seed
+    stats['constituents_version'] = constituents_version
+    stats['use_universe'] = symbol_universe is not None
 
     if plot_bool:
         plot.plot_out_of_sample_run(
@@ -103,25 +132,31 @@ def download_backtest_stats(cash, num_symbols, start_date_insample,
             axes=0
         )
 
-    # Now let's save the information to a csv.
+    return stats
+
+
+def download_backtest_stats(cash, num_symbols, start_date_insample,
+                            end_date_insample, start_date_outsample,
+                            end_date_outsample, plot_bool=False, seed=None,
+                            symbol_universe=None, constituents_version=None):
+    """
+    Runs compute_backtest_stats and saves the stats it gathers into the file
+    'statistics/summary_stats.csv'. See compute_backtest_stats for the
+    parameters.
+    :return: Appends all information obtained into the file
+    'statistics/summary_stats.csv'.
+    """
+    stats = compute_backtest_stats(cash, num_symbols, start_date_insample,
+                                   end_date_insample, start_date_outsample,
+                                   end_date_outsample, plot_bool=plot_bool,
+                                   seed=seed, symbol_universe=symbol_universe,
+                                   constituents_version=constituents_version)
+
+    # Now let's save the information to a csv. The row is appended to the end
+    # of the file, so this takes the same amount of time however big the csv
+    # gets.
     print("Saving to csv")
-    df = pd.DataFrame(data=stats, index=[0])
-    path = '../statistics/summary_stats.csv'
-    if os.path.exists(path) is False:
-        # If this somehow is false, let's save the stats to a different file and
-        # quit the program (as this shouldn't happen).
-        df.to_csv('../statistics/summary_stats_new.csv', index=False)
-        sys.exit(path + " does not exist.")
-    else:
-        # I was having problems appending the data to the csv directly. While
-        # this is slower than doing as such, it solve the problem by copying
-        # the entire csv into a dataframe, appending the data to said dataframe,
-        # and then overwriting the old file with that dataframe.
-        # This would be a great place to increase the speed of this function,
-        # especially as 'statistics/summary_stats_
-        df_old = pd.read_csv(path)
-        df_new = df_old.append(df, ignore_index=True)
-        df_new.to_csv(path, index=False)
+    results_store.ResultsStore().append(stats)
     print("Csv saved")
 
 
@@ -192,12 +227,16 @@ def analyze_summary_stats(num_symbols, start_date_insample, end_date_insample,
     print("Number of symbols:", num_symbols)
     print("In-sample:", start_date_insample + " -- " + end_date_insample)
     print("Out-of-sample:", start_date_outsample + " -- " + end_date_outsample)
-    stats = pd.read_csv('../statistics/summary_stats.csv')
-    stats = stats[(stats.num_symbols == num_symbols) &
-                  (stats.start_date_insample == start_date_insample) &
-                  (stats.end_date_insample == end_date_insample) &
-                  (stats.start_date_outsample == start_date_outsample) &
-                  (stats.end_date_outsample == end_date_outsample)]
+    stats = results_store.ResultsStore().read(
+        columns=['annualized_sharpe_ratio_insample',
+                 'annualized_sharpe_ratio_outsample', 'profit_insample',
+                 'profit_outsample', 'spy_profits_insample',
+                 'spy_profits_outsample'],
+        filters={'num_symbols': num_symbols,
+                 'start_date_insample': start_date_insample,
+                 'end_date_insample': end_date_insample,
+                 'start_date_outsample': start_date_outsample,
+                 'end_date_outsample': end_date_outsample})
     print("Sample size:", stats.shape[0])
 
     print("\nLinear regression between in-sample & out of sample sharpe ratios:")
@@ -239,43 +278,233 @@ def analyze_summary_stats(num_symbols, start_date_insample, end_date_insample,
     print(mean_confidence_interval(net_profit_outsample))
 
 
-def download_data(ignore_errors):
+def trial_seed(base_seed, cash, spec, trial):
+    """
+    Works out the seed of one trial of an experiment. The seed only depends on
+    what the experiment is and which trial it is (not on the order experiments
+    are listed in, or which process runs it), so the same trial always builds
+    the same portfolio.
+    :param base_seed: Int; changes every trial's seed at once.
+    :param cash: The amount of cash used in the portfolio.
+    :param spec: A tuple (num_symbols, (start_date_insample, end_date_insample),
+    (start_date_outsample, end_date_outsample), n_trials); see SAMPLES_TO_RUN.
+    :param trial: Int; which trial of the experiment this is.
+    :return: Int; the trial's seed.
+    """
+    num_symbols, insample, outsample, _ = spec
+    dates = [int(date.replace('-', '')) for date in insample + outsample]
+    seed_seq = np.random.SeedSequence([base_seed, int(cash), num_symbols] +
+                                      dates + [trial])
+    return int(seed_seq.generate_state(1)[0])
+
+
+def run_trial(job):
     """
-    This function is a wrapper used to help download data; it helps organize
-    whether the program should stop completely when it sees an error, or keep
-    running (a trait that is useful overnight when you'd want to download
-    multiple hours worth of data and you know the program generally works).
+    Runs a single trial of an experiment. This is what each worker process does
+    in download_data.
+    :param job: A tuple (cash, num_symbols, insample, outsample, seed,
+    ignore_errors, use_universe, constituents_version), where insample and
+    outsample are (start date, end date) tuples.
+    :return: The dictionary of stats from compute_backtest_stats, or None if
+    the trial failed and errors are being ignored.
+    """
+    cash, num_symbols, insample, outsample, seed, ignore_errors, \
+        use_universe, constituents_version = job
+    try:
+        symbol_universe = None
+        if use_universe:
+            # Already built (or loaded) before the processes were forked, so
+            # this doesn't build it again.
+            symbol_universe = universe.get_universe(
+                insample[0], insample[1], cash,
+                constituents_version=constituents_version)
+        return compute_backtest_stats(
+            cash, num_symbols, insample[0], insample[1], outsample[0],
+            outsample[1], seed=seed, symbol_universe=symbol_universe,
+            constituents_version=constituents_version)
+    except Exception as e:
+        if not ignore_errors:
+            raise
+        print(e)
+        return None
+
+
+def replay_trial(seed, plot_bool=False, use_universe=None):
+    """
+    Runs a trial that was saved in 'statistics/summary_stats.csv' again, on its
+    own, by looking up its row by seed. The same symbols are picked as the
+    first time (out of the s&p500 snapshot saved in its row; see
+    obtain_symbols.load_constituents), so its stats can be checked or plotted
+    without re-running any other trial.
+    :param seed: Int; the trial's seed, from the 'seed' column.
+    :param plot_bool: Boolean; passed on to compute_backtest_stats.
+    :param use_universe: Boolean (or None); only needed when the seed was
+    saved both with and without a universe (see download_data), to pick
+    which one to replay. Otherwise it's run the same way it was saved.
+    Default is None.
+    :return: The dictionary of stats from compute_backtest_stats.
+    """
+    filters = {'seed': seed}
+    if use_universe is not None:
+        filters['use_universe'] = use_universe
+    rows = results_store.ResultsStore().read(
+        columns=['initial_investment', 'num_symbols', 'start_date_insample',
+                 'end_date_insample', 'start_date_outsample',
+                 'end_date_outsample', 'constituents_version',
+                 'use_universe'],
+        filters=filters)
+    if rows.shape[0] == 0:
+        sys.exit("No trial with seed " + str(seed) + " has been saved.")
+    if rows['use_universe'].nunique(dropna=False) > 1:
+        sys.exit("The trial with seed " + str(seed) + " was saved both with "
+                 "and without a universe; pass use_universe to pick one.")
+    row = rows.iloc[0]
+    if pd.isna(row['constituents_version']) or pd.isna(row['use_universe']):
+        # Saved before these were saved with each trial, so there's no
+        # telling which symbols it picked or how its portfolio was built.
+        sys.exit("The trial with seed " + str(seed) + " was saved without "
+                 "its s&p500 snapshot, so it can't be replayed.")
+    constituents_version = str(row['constituents_version'])
+    use_universe = bool(row['use_universe'])
+    symbol_universe = None
+    if use_universe:
+        symbol_universe = universe.get_universe(
+            row['start_date_insample'], row['end_date_insample'],
+            row['initial_investment'],
+            constituents_version=constituents_version)
+    return compute_backtest_stats(row['initial_investment'],
+                                  int(row['num_symbols']),
+                                  row['start_date_insample'],
+                                  row['end_date_insample'],
+                                  row['start_date_outsample'],
+                                  row['end_date_outsample'],
+                                  plot_bool=plot_bool, seed=seed,
+                                  symbol_universe=symbol_universe,
+                                  constituents_version=constituents_version)
+
+
+# The experiments that download_data runs. Each one is a tuple:
+# (num_symbols, (start_date_insample, end_date_insample),
+# (start_date_outsample, end_date_outsample), n_trials)
+# If the user wants to record different data, it should be done directly here.
+SAMPLES_TO_RUN = [
+    (5, ('2017-01-01', '2019-01-01'), ('2019-01-01', '2020-01-01'), 500),
+    (10, ('2017-01-01', '2019-01-01'), ('2019-01-01', '2020-01-01'), 500),
+    (20, ('2017-01-01', '2019-01-01'), ('2019-01-01', '2020-01-01'), 500),
+    (5, ('2018-01-01', '2020-01-01'), ('2020-01-01', '2020-07-01'), 500),
+]
+
+
+def download_data(ignore_errors, specs=None, cash=1000000, num_workers=None,
+                  base_seed=0, use_universe=True):
+    """
+    This function runs many trials of the experiments in specs, spread across
+    processes, and saves each one's stats into 'statistics/summary_stats.csv'
+    as soon as it finishes. It also helps organize whether the program should
+    stop completely when it sees an error, or keep running (a trait that is
+    useful overnight when you'd want to download multiple hours worth of data
+    and you know the program generally works).
+    Every trial has its own seed (see trial_seed) that is saved with its stats,
+    so running this again only runs the trials that haven't been saved yet.
     :param ignore_errors: A boolean variable; true if you want the program to
     keep going when it receives an error, false if you want the program to stop
     when it receives an error.
+    :param specs: A list of experiments to run, laid out like SAMPLES_TO_RUN
+    (which is the default).
+    :param cash: The amount of cash used in each portfolio.
+    :param num_workers: Int; the number of processes to run trials in. None
+    uses one process per cpu, and 1 runs every trial in this process.
+    :param base_seed: Int; changes the seeds of every trial (see trial_seed).
+    :param use_universe: Boolean; if True, the universe of each in-sample
+    window (see universe.py) is built once before any trial is run, and every
+    trial picks its symbols and builds its portfolio out of it. If False,
+    each trial runs its own symbols' backtesters (see
+    run_backtesters.setup_backtesters). The symbols a seed picks can differ
+    between the two, since the universe leaves out symbols without data
+    instead of replacing them, so trials that were saved one way are run
+    again the other way. Default is True.
     :return: Ultimately saves data to the file 'statistics/summary_stats.csv'
     """
-    def samples_to_run():
-        """
-        Collects and saves data using the function download_backtest_stats().
-        If the user wants to record different data, it should be done directly
-        here.
-        :return: Ultimately saves data to the file
-        'statistics/summary_stats.csv'
-        """
-        download_backtest_stats(1000000, 5, '2017-01-01', '2019-01-01',
-                                '2019-01-01', '2020-01-01')
-        download_backtest_stats(1000000, 10, '2017-01-01', '2019-01-01',
-                                '2019-01-01', '2020-01-01')
-        download_backtest_stats(1000000, 20, '2017-01-01', '2019-01-01',
-                                '2019-01-01', '2020-01-01')
-        download_backtest_stats(1000000, 5, '2018-01-01', '2020-01-01',
-                                '2020-01-01', '2020-07-01')
-    if ignore_errors:
-        while True:
-            try:
-                samples_to_run()
-            except Exception as e:
-                print(e)
-                continue
-    else:
-        while True:
-            samples_to_run()
+    if specs is None:
+        specs = SAMPLES_TO_RUN
+    store = results_store.ResultsStore()
+    # Every trial picks its symbols out of the same snapshot of the s&p500,
+    # even if a newer one is saved while they're running.
+    constituents_version = obtain_symbols.latest_constituents_version()
+
+    # Figure out which trials still need to be run.
+    jobs = []
+    for spec in specs:
+        num_symbols, insample, outsample, n_trials = spec
+        seeds = [trial_seed(base_seed, cash, spec, trial)
+                 for trial in range(n_trials)]
+        done = store.read(columns=['seed'],
+                          filters={'num_symbols': num_symbols,
+                                   'initial_investment': cash,
+                                   'start_date_insample': insample[0],
+                                   'end_date_insample': insample[1],
+                                   'start_date_outsample': outsample[0],
+                                   'end_date_outsample': outsample[1],
+                                   'use_universe': use_universe,
+                                   'seed': seeds})
+        done = set(done['seed'])
+        print("Symbols:", num_symbols, "| In:", ' -- '.join(insample),
+              "| Out:", ' -- '.join(outsample), "|",
+              len(done), "of", n_trials, "trials already saved")
+        jobs += [(cash, num_symbols, insample, outsample, seed, ignore_errors,
+                  use_universe, constituents_version)
+                 for seed in seeds if seed not in done]
+
+    if not jobs:
+        print("Every trial has already been saved.")
+        return
+
+    # Load all of the price data once, before any processes are forked, so
+    # that every process shares it instead of loading its own.
+    symbols = [symbol for symbol_list in
+               obtain_symbols.organize_symbols(
+                   version=constituents_version).values()
+               for symbol in symbol_list] + ['SPY']
+    rb.preload_symbol_data(symbols,
+                           min(spec[1][0] for spec in specs))
+    if use_universe:
+        # Built here, so that every process shares the same universes.
+        for insample in sorted(set(job[2] for job in jobs)):
+            universe.get_universe(insample[0], insample[1], cash,
+                                  constituents_version=constituents_version)
+
+    num_saved = 0
+    if num_workers == 1:
+        for i, job in enumerate(jobs):
+            stats = run_trial(job)
+            if stats is not None:
+                store.append(stats)
+                num_saved += 1
+            print("\n*** Finished trial", i + 1, "of", len(jobs), "(" +
+                  str(num_saved), "saved)")
+        return
+
+    # Forked processes share the preloaded data with this one (copy-on-write).
+    mp_context = None
+    if 'fork' in multiprocessing.get_all_start_methods():
+        mp_context = multiprocessing.get_context('fork')
+    with ProcessPoolExecutor(max_workers=num_workers,
+                             mp_context=mp_context) as executor:
+        futures = [executor.submit(run_trial, job) for job in jobs]
+        try:
+            # Each trial's stats are saved as soon as it's done, so that
+            # stopping the program part way through doesn't lose any.
+            for i, future in enumerate(as_completed(futures)):
+                stats = future.result()
+                if stats is not None:
+                    store.append(stats)
+                    num_saved += 1
+                print("\n*** Finished trial", i + 1, "of", len(jobs), "(" +
+                      str(num_saved), "saved)")
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
 
 
 if __name__ == '__main__':
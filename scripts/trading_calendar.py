@@ -0,0 +1,218 @@
+"""
+This file holds the NYSE trading calendar. Every session date between two
+years is worked out once (weekdays, minus the NYSE holidays and the days the
+exchange closed unexpectedly) and kept as a sorted int64 array, so questions
+like "how many trading days are between these two dates" are answered with a
+binary search instead of rebuilding a pandas holiday calendar every time.
+Nothing in here touches pandas' global holiday calendars.
+"""
+import numpy as np
+import datetime
+import functools
+
+
+# Days the NYSE closed outside of its regular holidays.
+SPECIAL_CLOSURES = [
+    '1994-04-27',  # Richard Nixon's funeral
+    '2001-09-11', '2001-09-12', '2001-09-13', '2001-09-14',  # September 11th
+    '2004-06-11',  # Ronald Reagan's funeral
+    '2007-01-02',  # Gerald Ford's funeral
+    '2012-10-29', '2012-10-30',  # Hurricane Sandy
+    '2018-12-05',  # George H.W. Bush's funeral
+    '2025-01-09',  # Jimmy Carter's funeral
+]
+
+
+def easter(year):
+    """
+    Finds the date of (western) Easter Sunday, using the anonymous Gregorian
+    algorithm.
+    :param year: Int; the year.
+    :return: A datetime.date of Easter Sunday.
+    """
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return datetime.date(year, month, day + 1)
+
+
+def nth_weekday(year, month, weekday, n):
+    """
+    Finds the nth given weekday of a month, e.g. the third monday of January.
+    :param year: Int; the year.
+    :param month: Int; the month.
+    :param weekday: Int; monday is 0 and sunday is 6.
+    :param n: Int; which occurrence to find. -1 finds the last one.
+    :return: A datetime.date.
+    """
+    if n > 0:
+        first = datetime.date(year, month, 1)
+        return first + datetime.timedelta(
+            days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    # Counting backwards from the last day of the month.
+    if month == 12:
+        last = datetime.date(year, 12, 31)
+    else:
+        last = datetime.date(year, month + 1, 1) - datetime.timedelta(days=1)
+    return last - datetime.timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def observed(date):
+    """
+    Moves a holiday that lands on a weekend to the closest weekday, which is
+    how the NYSE observes fixed-date holidays.
+    :param date: A datetime.date.
+    :return: A datetime.date.
+    """
+    if date.weekday() == 5:
+        return date - datetime.timedelta(days=1)
+    if date.weekday() == 6:
+        return date + datetime.timedelta(days=1)
+    return date
+
+
+def nyse_holidays(year):
+    """
+    Lists the NYSE's regular holidays in a year.
+    :param year: Int; the year.
+    :return: A list of datetime.date objects.
+    """
+    holidays = []
+
+    # New Year's Day is observed on monday when it's a sunday, but the NYSE
+    # doesn't close on the friday before when it's a saturday.
+    new_years = datetime.date(year, 1, 1)
+    if new_years.weekday() != 5:
+        holidays.append(observed(new_years))
+    if year >= 1998:
+        holidays.append(nth_weekday(year, 1, 0, 3))  # Martin Luther King Day
+    holidays.append(nth_weekday(year, 2, 0, 3))  # Washington's Birthday
+    holidays.append(easter(year) - datetime.timedelta(days=2))  # Good Friday
+    holidays.append(nth_weekday(year, 5, 0, -1))  # Memorial Day
+    if year >= 2022:
+        holidays.append(observed(datetime.date(year, 6, 19)))  # Juneteenth
+    holidays.append(observed(datetime.date(year, 7, 4)))  # Independence Day
+    holidays.append(nth_weekday(year, 9, 0, 1))  # Labor Day
+    holidays.append(nth_weekday(year, 11, 3, 4))  # Thanksgiving
+    holidays.append(observed(datetime.date(year, 12, 25)))  # Christmas
+    return holidays
+
+
+def to_day(date):
+    """
+    Converts a date into the number of days since 1970-01-01, which is how
+    dates are kept in TradingCalendar.
+    :param date: A string ('YYYY-mm-dd'), a datetime/date, or a pandas
+    timestamp.
+    :return: Int.
+    """
+    if isinstance(date, str):
+        date = date[:10]
+    return int(np.datetime64(date, 'D').astype(np.int64))
+
+
+class TradingCalendar:
+    """
+    A class that holds every NYSE session date between two years, as a sorted
+    int64 array of days since 1970-01-01.
+    """
+    def __init__(self, start_year=1990, end_year=2035):
+        """
+        Initialize the class variables and precompute the sessions.
+        :param start_year: Int; the first year of the calendar.
+        :param end_year: Int; the last year of the calendar, inclusive.
+        """
+        self.start_year = start_year
+        self.end_year = end_year
+        self.first_day = to_day(datetime.date(start_year, 1, 1))
+        self.last_day = to_day(datetime.date(end_year, 12, 31))
+
+        # Start with every weekday...
+        days = np.arange(self.first_day, self.last_day + 1, dtype=np.int64)
+        days = days[np.is_busday(days.astype('M8[D]'))]
+
+        # ...and take out the holidays and special closures.
+        closed = [to_day(holiday) for year in range(start_year, end_year + 1)
+                  for holiday in nyse_holidays(year)]
+        closed += [to_day(date) for date in SPECIAL_CLOSURES]
+        self.sessions = days[~np.isin(days, closed)]
+
+    def check_range(self, day):
+        """
+        Makes sure that a day is inside of the years this calendar covers.
+        :param day: Int; days since 1970-01-01.
+        :return: Nothing; raises a ValueError if the day isn't covered.
+        """
+        if not self.first_day <= day <= self.last_day:
+            raise ValueError(str(np.datetime64(day, 'D')) +
+                             ' is outside of the trading calendar (' +
+                             str(self.start_year) + ' -- ' +
+                             str(self.end_year) + ')')
+
+    def num_trading_days(self, start_date, end_date):
+        """
+        Calculates the number of trading days, inclusive, between two dates.
+        :param start_date: The starting date (see to_day for the formats).
+        :param end_date: The ending date (see to_day for the formats).
+        :return: Int; the number of trading days between the two dates.
+        """
+        start, end = to_day(start_date), to_day(end_date)
+        self.check_range(start)
+        self.check_range(end)
+        lo = np.searchsorted(self.sessions, start, side='left')
+        hi = np.searchsorted(self.sessions, end, side='right')
+        return int(max(hi - lo, 0))
+
+    def is_trading_day(self, date):
+        """
+        :param date: The date to check (see to_day for the formats).
+        :return: Boolean; whether the NYSE was open on that date.
+        """
+        day = to_day(date)
+        self.check_range(day)
+        i = np.searchsorted(self.sessions, day)
+        return bool(i < len(self.sessions) and self.sessions[i] == day)
+
+    def session_index(self, date):
+        """
+        Finds where a date falls in the list of sessions. If the date isn't a
+        trading day, the index of the next trading day is returned.
+        :param date: The date to look up (see to_day for the formats).
+        :return: Int; an index into self.sessions.
+        """
+        day = to_day(date)
+        self.check_range(day)
+        return int(np.searchsorted(self.sessions, day, side='left'))
+
+    def trading_days(self, start_date, end_date):
+        """
+        Lists every trading day, inclusive, between two dates.
+        :param start_date: The starting date (see to_day for the formats).
+        :param end_date: The ending date (see to_day for the formats).
+        :return: A numpy array of datetime64 days.
+        """
+        start, end = to_day(start_date), to_day(end_date)
+        self.check_range(start)
+        self.check_range(end)
+        lo = np.searchsorted(self.sessions, start, side='left')
+        hi = np.searchsorted(self.sessions, end, side='right')
+        return self.sessions[lo:hi].astype('M8[D]')
+
+
+@functools.lru_cache(maxsize=None)
+def nyse_calendar(start_year=1990, end_year=2035):
+    """
+    Returns a TradingCalendar, only building it the first time it's asked for
+    with a given range of years.
+    :param start_year: Int; the first year of the calendar.
+    :param end_year: Int; the last year of the calendar, inclusive.
+    :return: An initialized TradingCalendar.
+    """
+    return TradingCalendar(start_year, end_year)
@@ -0,0 +1,353 @@
+"""
+This file builds the universe: every s&p500 symbol's chosen backtester and
+excess returns over an in-sample window, worked out once and saved to disk.
+Every random portfolio in stat_analysis.py (and plot.py) picks its symbols
+from the same ~500 constituents over the same in-sample dates, so which
+backtester each symbol gets, and the excess returns it makes, are the same in
+every trial. With the universe built, a trial only has to pick its columns
+out of the excess return matrix and go straight to the tangency portfolios,
+instead of loading and backtesting its symbols all over again.
+Like run_tangency_portfolio (when it isn't exact), each symbol's results are
+assumed to scale with the cash it's given.
+"""
+import finlib
+import run_backtesters as rb
+import obtain_symbols
+import backtesters
+import backtest_cache
+import portfolio_batch
+import pandas as pd
+import numpy as np
+import os
+
+
+# Where universes are saved.
+UNIVERSE_PATH = '../symbol_data/universe/'
+
+# The daily risk free rate used everywhere else in this project.
+RISK_FREE_RATE = 0.05 / 252
+
+# Universes that have been built or loaded by this process. Processes that are
+# forked afterwards (see stat_analysis.download_data) share them.
+# {(start_date, end_date, cash, testing, constituents_version): Universe, ...}
+_loaded = {}
+
+
+class Universe:
+    """
+    A class that holds the universe of one in-sample window.
+    """
+    def __init__(self, start_date, end_date, cash, symbols_dict, strategies,
+                 growth, excess, constituents_version):
+        """
+        Initialize the class variables.
+        :param start_date: String; the first in-sample date. YYYY-mm-dd.
+        :param end_date: String; the last in-sample date. YYYY-mm-dd.
+        :param cash: The cash each symbol's backtesters were run with.
+        :param symbols_dict: A dictionary {'industry1': ['sym1', ...], ...} of
+        every symbol in the universe.
+        :param strategies: A pandas series of the name of each symbol's chosen
+        backtester, indexed by symbol.
+        :param growth: A (dates x symbols) dataframe of how one dollar grows
+        under each symbol's backtester (see portfolio_batch.growth_matrix).
+        :param excess: A (dates x symbols) dataframe of each symbol's excess
+        returns.
+        :param constituents_version: String; the snapshot of the s&p500 the
+        symbols came from (see obtain_symbols.load_constituents).
+        """
+        self.start_date = start_date
+        self.end_date = end_date
+        self.cash = cash
+        self.symbols_dict = symbols_dict
+        self.strategies = strategies
+        self.growth = growth
+        self.excess = excess
+        self.constituents_version = constituents_version
+
+    @staticmethod
+    def file(start_date, end_date, cash, constituents_version, testing=False,
+             path=UNIVERSE_PATH):
+        """
+        :return: String; where the universe of these arguments is saved. See
+        get_universe for the arguments. The backtest cache's version is part
+        of the name too, since it changes whenever a backtester changes how
+        it trades (which changes every symbol's results).
+        """
+        name = 'universe_' + start_date + '_' + end_date + '_' + \
+            str(int(cash)) + '_sp500_' + constituents_version + '_v' + \
+            str(backtest_cache.CACHE_VERSION)
+        if testing:
+            name += '_testing'
+        return os.path.join(path, name + '.npz')
+
+    def save(self, file):
+        """
+        Saves the universe into a single .npz file.
+        :param file: String; the file to save into (see Universe.file).
+        :return: Nothing.
+        """
+        folder = os.path.dirname(file)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder, exist_ok=True)
+        symbols = list(self.growth.columns)
+        sector_of = {symbol: industry for industry in self.symbols_dict
+                     for symbol in self.symbols_dict[industry]}
+        # Written to a temporary file first, so that a process loading it
+        # never reads half of it.
+        tmp_file = file + '.' + str(os.getpid()) + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            np.savez(f, start_date=np.array(self.start_date),
+                     end_date=np.array(self.end_date),
+                     cash=np.array(float(self.cash)),
+                     dates=self.growth.index.values.astype('M8[ns]'),
+                     symbols=np.array(symbols),
+                     sectors=np.array([sector_of[symbol]
+                                       for symbol in symbols]),
+                     strategies=self.strategies[symbols].to_numpy(dtype=str),
+                     growth=self.growth.to_numpy(dtype=float),
+                     excess=self.excess[symbols].to_numpy(dtype=float),
+                     constituents_version=np.array(
+                         self.constituents_version))
+        os.replace(tmp_file, file)
+
+    @classmethod
+    def load(cls, file):
+        """
+        Loads a universe saved by Universe.save.
+        :param file: String; the file it was saved into.
+        :return: The Universe, or None if there is no such file.
+        """
+        if not os.path.isfile(file):
+            return None
+        with np.load(file) as f:
+            index = pd.DatetimeIndex(f['dates'], name='Date')
+            symbols = [str(symbol) for symbol in f['symbols']]
+            symbols_dict = {}
+            for symbol, sector in zip(symbols, f['sectors']):
+                symbols_dict.setdefault(str(sector), []).append(symbol)
+            return cls(str(f['start_date'][()]), str(f['end_date'][()]),
+                       float(f['cash'][()]), symbols_dict,
+                       pd.Series(f['strategies'].astype(str), index=symbols),
+                       pd.DataFrame(f['growth'], index=index, columns=symbols),
+                       pd.DataFrame(f['excess'], index=index, columns=symbols),
+                       str(f['constituents_version'][()]))
+
+    def excess_returns(self, symbols_dict):
+        """
+        Picks each industry's excess returns out of the universe's matrix.
+        :param symbols_dict: A dictionary {'industry1': ['sym1', ...], ...};
+        every symbol has to be in the universe.
+        :return: A dictionary {'industry1': (dates x symbols) dataframe, ...}
+        """
+        return {industry: self.excess[symbols_dict[industry]]
+                for industry in symbols_dict}
+
+    def sample_symbols(self, num_symbols, seed=None):
+        """
+        Randomly picks num_symbols symbols from the universe in each industry
+        (see obtain_symbols.get_random_symbols).
+        :param num_symbols: Int; the number of symbols to get per industry.
+        :param seed: Int (or None); seeds the random picks.
+        :return: A dictionary {'industry1': ['sym1', ...], ...}
+        """
+        return obtain_symbols.get_random_symbols(self.symbols_dict,
+                                                 num_symbols, seed=seed)
+
+    def setup_portfolio(self, cash, num_symbols, seed=None, provider=None,
+                        risk_free_rate=RISK_FREE_RATE):
+        """
+        Does what run_backtesters.setup_backtesters does, but out of the
+        universe: the symbols are picked from the universe, and the industry
+        and main tangency portfolios are found from the columns of its
+        matrices without running any backtesters.
+        :param cash: Int; the amount of money to be invested in the portfolio.
+        :param num_symbols: Int; the number of symbols to use in each industry.
+        :param seed: Int (or None); seeds which symbols are randomly picked.
+        :param provider: Where missing days of the symbols' data are
+        downloaded from (see data_providers.py). Defaults to a YahooProvider.
+        :param risk_free_rate: The daily risk free rate used for excess
+        returns.
+        :return: The same tuple as setup_backtesters. Each symbol's backtester
+        in the SymbolsHelper hasn't been run; it's only there to tell
+        run_out_of_sample which backtester the symbol uses (so warm starts
+        start over).
+        """
+        symbol_helper = rb.SymbolsHelper()
+        # The symbols' data is still needed to run the portfolio out of sample.
+        rb.get_symbol_data(start_date=self.start_date, end_date=None,
+                           num_symbols=num_symbols, symb_help=symbol_helper,
+                           provider=provider,
+                           symbols_dict=self.sample_symbols(num_symbols,
+                                                            seed=seed),
+                           constituents_version=self.constituents_version)
+        symbols_dict = symbol_helper.obtained_symbols_dict
+        for industry in symbols_dict:
+            for symbol in list(symbols_dict[industry]):
+                if symbol not in self.strategies.index:
+                    # It can only get here if the symbol's data went missing
+                    # since the universe was built, and it was replaced.
+                    print(symbol + " isn't in the universe, leaving it out")
+                    symbols_dict[industry].remove(symbol)
+        symbols_dict = {industry: symbols_dict[industry]
+                        for industry in symbols_dict if symbols_dict[industry]}
+        symbol_helper.obtained_symbols_dict = symbols_dict
+        for industry in symbols_dict:
+            for symbol in symbols_dict[industry]:
+                symbol_helper.symbol_backtesters_dict[symbol] = \
+                    backtesters.find_backtester(self.strategies[symbol], cash)
+
+        print("\n*** Computing tangency portfolios for each industry")
+        tangencies = finlib.compute_tangencies(
+            self.excess_returns(symbols_dict), diagonalize=False)
+
+        # {industry: industry_weight (% of cash to allocate)}
+        industry_wts = {}
+        industry_totals = {}  # {industry: cash + holdings per day}
+        for industry in tangencies:
+            wts_tangency, mu_tilde, sigma = tangencies[industry]
+            sharpe = finlib.get_annualized_sharpe_ratio_wts(wts_tangency,
+                                                            mu_tilde, sigma)
+            print("Theoretical Sharpe ratio for " + industry + ":",
+                  round(sharpe, 3))
+            industry_wts[industry] = wts_tangency
+            industry_totals[industry] = cash * (
+                self.growth[wts_tangency.index].to_numpy(dtype=float) @
+                wts_tangency.to_numpy(dtype=float))
+
+        # Each industry's excess returns, the same ones run_tangency_portfolio
+        # would have found.
+        industry_excess_returns = pd.DataFrame(industry_totals,
+                                               index=self.growth.index)
+        industry_excess_returns = industry_excess_returns.pct_change() - \
+            risk_free_rate
+        wts_tangency_final, mu_tilde, sigma = finlib.compute_tangency(
+            industry_excess_returns, diagonalize=False)
+        sharpe = finlib.get_annualized_sharpe_ratio_wts(wts_tangency_final,
+                                                        mu_tilde, sigma)
+        print("\nTheoretical sharpe ratio for the main tangency portfolio:",
+              round(sharpe, 3))
+
+        # Each industry was worked out with all of the cash, so the portfolio
+        # puts each industry's weight of it in.
+        daily_total = sum(
+            weight * industry_totals[industry]
+            for industry, weight in wts_tangency_final.iteritems())
+        tangency_res = pd.DataFrame(data=daily_total, index=self.growth.index,
+                                    columns=['Total'])
+        finlib.excess_returns(tangency_res, risk_free_rate=risk_free_rate,
+                              column_name='Total')
+        print("\nInitial investment in main tangency portfolio:", cash)
+        print("Total profit:", round(tangency_res.iloc[-1]['Total'] - cash, 2))
+        print("Annualized sharpe ratio:",
+              round(finlib.get_annualized_sharpe_ratio_df(tangency_res), 3))
+
+        # Comparing in-sample results against spy
+        spy_res, spy_summary = rb.compare_against_spy(
+            tangency_res, cash, start_date=self.start_date,
+            end_date=self.end_date)
+
+        return wts_tangency_final, industry_wts, tangency_res, spy_res, \
+            symbol_helper, spy_summary
+
+
+def build_universe(start_date, end_date, cash, testing=False, num_workers=1,
+                   provider=None, constituents_version=None):
+    """
+    Loads the data of every s&p500 symbol, picks and runs the best backtester
+    for each one over the in-sample dates (see
+    run_backtesters.get_backtester_data) and keeps their results. Symbols
+    without all of the data are left out, the same way get_symbol_data tosses
+    them.
+    :param start_date: String; the first in-sample date. YYYY-mm-dd.
+    :param end_date: String; the last in-sample date. YYYY-mm-dd.
+    :param cash: The amount of cash each backtester starts with.
+    :param testing: Bool; if True, only the first two industries are used
+    (see obtain_symbols.organize_symbols). Default is False.
+    :param num_workers: Int; the number of processes used to pick each
+    symbol's backtester (see get_backtester_data). Default is 1.
+    :param provider: Where missing days of data are downloaded from (see
+    data_providers.py). Defaults to a YahooProvider.
+    :param constituents_version: String; the snapshot of the s&p500 whose
+    symbols make up the universe (see obtain_symbols.load_constituents). If
+    None, the latest snapshot is used.
+    :return: The Universe.
+    """
+    if constituents_version is None:
+        constituents_version = obtain_symbols.latest_constituents_version()
+    print("\n*** Building the universe for", start_date, "--", end_date)
+    symbol_helper = rb.SymbolsHelper()
+    # End date is none for the same reason as in setup_backtesters: the
+    # symbols need data for the out-of-sample dates as well.
+    rb.get_symbol_data(start_date=start_date, end_date=None, num_symbols=None,
+                       symb_help=symbol_helper, provider=provider,
+                       symbols_dict=obtain_symbols.organize_symbols(
+                           testing=testing, version=constituents_version),
+                       constituents_version=constituents_version)
+    rb.get_backtester_data(start_date=start_date, end_date=end_date,
+                           cash=cash, symb_help=symbol_helper,
+                           num_workers=num_workers)
+
+    symbol_backtesters_dict = symbol_helper.symbol_backtesters_dict
+    growth = portfolio_batch.growth_matrix(symbol_backtesters_dict)
+    excess = pd.DataFrame({symbol: symbol_backtesters_dict[symbol].results[
+        'Excess Return'] for symbol in growth.columns}, index=growth.index)
+    strategies = pd.Series({symbol: symbol_backtesters_dict[symbol].name
+                            for symbol in growth.columns})
+
+    # Symbols with extra days (that the others don't have) would leave holes
+    # in the matrix, so those days are left out.
+    num_days = growth.shape[0]
+    keep = growth.notna().all(axis=1).to_numpy()
+    if not keep.all():
+        print("Leaving out", num_days - keep.sum(),
+              "days that not every symbol has data for")
+        growth = growth[keep]
+        excess = excess[keep]
+
+    obtained_symbols_dict = symbol_helper.obtained_symbols_dict
+    symbols_dict = {industry: list(obtained_symbols_dict[industry])
+                    for industry in obtained_symbols_dict
+                    if obtained_symbols_dict[industry]}
+    print("Universe has", growth.shape[1], "symbols and", growth.shape[0],
+          "days")
+    return Universe(start_date, end_date, cash, symbols_dict, strategies,
+                    growth, excess, constituents_version)
+
+
+def get_universe(start_date, end_date, cash, testing=False, num_workers=1,
+                 provider=None, rebuild=False, path=UNIVERSE_PATH,
+                 constituents_version=None):
+    """
+    Returns the universe of an in-sample window, only building it if it hasn't
+    been built (and saved) before.
+    :param start_date: String; the first in-sample date. YYYY-mm-dd.
+    :param end_date: String; the last in-sample date. YYYY-mm-dd.
+    :param cash: The amount of cash each backtester starts with.
+    :param testing: Bool; see build_universe. Default is False.
+    :param num_workers: Int; see build_universe. Default is 1.
+    :param provider: See build_universe.
+    :param rebuild: Bool; if True, the universe is built again even if it has
+    been saved, e.g. after the symbols' data was updated. Default is False.
+    :param path: String; the folder universes are saved in.
+    :param constituents_version: String; see build_universe. Each snapshot
+    has its own universe.
+    :return: The Universe.
+    """
+    if constituents_version is None:
+        constituents_version = obtain_symbols.latest_constituents_version()
+    key = (start_date, end_date, float(cash), testing, constituents_version)
+    if not rebuild and key in _loaded:
+        return _loaded[key]
+
+    file = Universe.file(start_date, end_date, cash, constituents_version,
+                         testing=testing, path=path)
+    universe = None if rebuild else Universe.load(file)
+    if universe is None:
+        universe = build_universe(start_date, end_date, cash, testing=testing,
+                                  num_workers=num_workers, provider=provider,
+                                  constituents_version=constituents_version)
+        universe.save(file)
+        print("Saved the universe to", file)
+    _loaded[key] = universe
+    return universe
+
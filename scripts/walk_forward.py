@@ -0,0 +1,231 @@
+"""
+This file runs a portfolio walk-forward: instead of finding the industry and
+main tangency weights once (see run_backtesters.setup_backtesters) and keeping
+them for the whole out-of-sample window, the weights are found again every
+few trading days from the days just before, and the portfolio is rebalanced
+into them.
+Each symbol's backtester (the one picked for it in-sample) is run once over
+every day needed, and the means and covariances of the symbols' excess returns
+are kept up to date with a finlib.RollingCovariance as the window moves, so
+rebalancing never recomputes them from the whole window. Each industry's mean
+and covariance come straight out of the symbols' ones: with W the matrix of
+every symbol's weight in its industry, the industries' means are W^T mu and
+their covariance is W^T Sigma W (which treats each industry as if it were
+rebalanced daily).
+"""
+import finlib
+import backtesters
+import run_backtesters as rb
+import pandas as pd
+import numpy as np
+import sys
+
+
+# The daily risk free rate used everywhere else in this project.
+RISK_FREE_RATE = 0.05 / 252
+
+
+def symbol_growth(symb_help, start_date, end_date, lookback):
+    """
+    Runs each symbol's in-sample backtester over the walk-forward's days, plus
+    the days before start_date that the first weights are estimated from.
+    :param symb_help: Initialized SymbolHelper class that contains information
+    on the symbols being used + their backtesters (e.g. the one returned by
+    setup_backtesters).
+    :param start_date: String; the first day of the walk-forward. YYYY-mm-dd.
+    :param end_date: String; the last day of the walk-forward. YYYY-mm-dd.
+    :param lookback: Int; how many days before start_date are needed.
+    :return: A tuple (growth, start) where growth is a (dates x symbols)
+    dataframe of how one dollar grows under each symbol's backtester, and
+    start is the row of growth that start_date is on.
+    """
+    growth = {}
+    for symbol in symb_help.symbol_backtesters_dict:
+        symbol_data = symb_help.symbol_data_dict[symbol]
+        lo, hi = rb.date_offsets(symbol_data.index, start_date, end_date)
+        if lo < lookback:
+            sys.exit("Not enough data before " + start_date + " for " + symbol +
+                     " to estimate its weights from")
+        name = symb_help.symbol_backtesters_dict[symbol].name
+        bt = backtesters.find_backtester(name, 1)
+        rb.run_backtester(bt, symbol_data.iloc[lo - lookback:hi])
+        growth[symbol] = pd.Series(np.asarray(bt.list_total, dtype=float) /
+                                   bt.initial_cash,
+                                   index=symbol_data.index[lo - lookback:hi])
+
+    growth = pd.DataFrame(growth)
+    num_days = growth.shape[0]
+    growth = growth.dropna()
+    if growth.shape[0] < num_days:
+        print("Leaving out", num_days - growth.shape[0],
+              "days that not every symbol has data for")
+    start = int(growth.index.searchsorted(pd.Timestamp(start_date)))
+    if start < lookback:
+        sys.exit("Not enough days that every symbol has data for before " +
+                 start_date + " to estimate the weights from")
+    return growth, start
+
+
+def industry_columns(symbols_dict, columns):
+    """
+    Finds which columns of the growth matrix make up each industry.
+    :param symbols_dict: A dictionary {'industry1': ['sym1', ...], ...}
+    :param columns: A list of the growth matrix's columns (symbols).
+    :return: A tuple (industries, cols) where industries is a list of the
+    industries and cols is an (industries x symbols) int array of column
+    numbers, padded with -1.
+    """
+    column_index = {symbol: i for i, symbol in enumerate(columns)}
+    industries = [industry for industry in symbols_dict
+                  if any(symbol in column_index
+                         for symbol in symbols_dict[industry])]
+    width = max(len(symbols_dict[industry]) for industry in industries)
+    cols = np.full((len(industries), width), -1, dtype=np.int64)
+    for i, industry in enumerate(industries):
+        found = [column_index[symbol] for symbol in symbols_dict[industry]
+                 if symbol in column_index]
+        cols[i, :len(found)] = found
+    return industries, cols
+
+
+def tangency_weights(mu, sigma, cols, diagonalize=False):
+    """
+    Finds every industry's tangency portfolio, then the main tangency
+    portfolio of the industries, from the symbols' means and covariance.
+    :param mu: A (symbols) array of the mean excess returns.
+    :param sigma: A (symbols x symbols) covariance matrix.
+    :param cols: An (industries x symbols) int array; see industry_columns.
+    :param diagonalize: Boolean; whether to diagonalize the covariance
+    matrices (see finlib.compute_tangency).
+    :return: A tuple (industry_wts, main_wts) where industry_wts is a
+    (symbols x industries) array of each symbol's weight in its industry, and
+    main_wts is an (industries) array of each industry's weight.
+    """
+    if diagonalize:
+        sigma = np.diag(np.diag(sigma))
+    safe_cols = np.where(cols < 0, 0, cols)
+
+    # A backtester that sat in cash for the whole window (e.g. MACD waiting
+    # for a buy signal) has no variance, which would make sigma singular, so
+    # it's left out until it trades again.
+    variance = np.diag(sigma)
+    flat = variance <= 1e-10 * variance.max()
+    padding = (cols < 0) | flat[safe_cols]
+    wts, _, _ = finlib.tangency_weights(
+        mu[safe_cols], sigma[safe_cols[:, :, None], safe_cols[:, None, :]],
+        padding)
+
+    # W: each symbol's weight in its industry.
+    industry_wts = np.zeros((len(mu), cols.shape[0]))
+    rows, industries = np.nonzero(~padding.T)
+    industry_wts[cols.T[rows, industries], industries] = wts.T[rows, industries]
+
+    industry_mu = industry_wts.T @ mu
+    industry_sigma = industry_wts.T @ sigma @ industry_wts
+    if diagonalize:
+        industry_sigma = np.diag(np.diag(industry_sigma))
+    # Industries where every symbol was left out get no weight either.
+    main_wts, _, _ = finlib.tangency_weights(industry_mu, industry_sigma,
+                                             padding.all(axis=1))
+    return industry_wts, main_wts
+
+
+def walk_forward(symb_help, cash, start_date, end_date, window=252,
+                 rebalance_every=21, expanding=False, diagonalize=False,
+                 halflife=None, risk_free_rate=RISK_FREE_RATE):
+    """
+    Runs the portfolio from start_date to end_date, finding its weights again
+    every rebalance_every trading days.
+    :param symb_help: Initialized SymbolHelper class that contains information
+    on the symbols being used + their backtesters (e.g. the one returned by
+    setup_backtesters). Its symbol data needs window days before start_date.
+    :param cash: The amount of cash invested on start_date.
+    :param start_date: String; the first day of the walk-forward. YYYY-mm-dd.
+    :param end_date: String; the last day of the walk-forward. YYYY-mm-dd.
+    :param window: Int; how many days of excess returns the weights are
+    estimated from. Default is 252, about a year.
+    :param rebalance_every: Int; how many trading days pass between
+    rebalances. Default is 21, about a month.
+    :param expanding: Boolean; if True, the window keeps every day since the
+    first one instead of only the most recent window days. Default is False.
+    :param diagonalize: Boolean; whether to diagonalize the covariance
+    matrices (see finlib.compute_tangency). Default is False.
+    :param halflife: Float (or None); if given, every day since the first
+    window is kept, but weighed exponentially with this halflife (in days)
+    so that recent days count for more. Default is None.
+    :param risk_free_rate: The daily risk free rate used for excess returns.
+    :return:
+    1) daily_total: A dataframe holding cash + holdings per day for the whole
+    walk-forward, along with its daily and excess returns.
+    2) symbol_wts: A dataframe (rebalance dates x symbols) of the share of the
+    portfolio put into each symbol at each rebalance (its industry's weight
+    times its weight in the industry).
+    3) main_wts: A dataframe (rebalance dates x industries) of each industry's
+    weight at each rebalance.
+    """
+    print("\n\n*** Walking the portfolio forward from " + start_date + " to " +
+          end_date + ", rebalancing every " + str(rebalance_every) + " days")
+    growth, start = symbol_growth(symb_help, start_date, end_date, window)
+    industries, cols = industry_columns(symb_help.obtained_symbols_dict,
+                                        growth.columns)
+    values = growth.to_numpy(dtype=float)
+    num_days = values.shape[0]
+
+    # excess[k] is each symbol's excess return from day k to day k + 1.
+    excess = values[1:] / values[:-1] - 1 - risk_free_rate
+
+    # The first window: the days before start_date.
+    moments = finlib.RollingCovariance(values.shape[1], names=growth.columns,
+                                       halflife=halflife)
+    moments.add(excess[start - window:start])
+
+    totals = np.empty(num_days - start)
+    rebalance_rows = list(range(start, num_days, rebalance_every))
+    symbol_history = []
+    main_history = []
+    total = cash
+    for i, row in enumerate(rebalance_rows):
+        if i > 0:
+            # Move the window forward to the days just before this rebalance.
+            prev_row = rebalance_rows[i - 1]
+            moments.add(excess[prev_row:row])
+            if not expanding and halflife is None:
+                moments.remove(excess[prev_row - window:row - window])
+
+        industry_wts, main_wts = tangency_weights(
+            moments.mean, moments.covariance, cols, diagonalize=diagonalize)
+        symbol_wts = industry_wts @ main_wts
+        symbol_history.append(symbol_wts)
+        main_history.append(main_wts)
+
+        # Hold the new weights until the next rebalance.
+        next_row = rebalance_rows[i + 1] if i + 1 < len(rebalance_rows) \
+            else num_days - 1
+        # Like run_final_tangency_portfolio, each symbol gets its weight times
+        # the portfolio's value. The weights don't always add up to one (a
+        # tangency portfolio that was flipped adds up to -1), so whatever
+        # isn't put into a symbol is kept as cash.
+        held = (total * symbol_wts) / values[row]
+        cash_held = total * (1 - symbol_wts.sum())
+        totals[row - start:next_row - start + 1] = \
+            values[row:next_row + 1] @ held + cash_held
+        total = totals[next_row - start]
+
+    index = growth.index[start:]
+    daily_total = pd.DataFrame(data=totals, index=index, columns=['Total'])
+    finlib.excess_returns(daily_total, risk_free_rate=risk_free_rate,
+                          column_name='Total')
+    rebalance_dates = growth.index[rebalance_rows]
+    symbol_wts = pd.DataFrame(symbol_history, index=rebalance_dates,
+                              columns=growth.columns)
+    main_wts = pd.DataFrame(main_history, index=rebalance_dates,
+                            columns=industries)
+
+    # Summary stats
+    print("\nInitial investment in walk-forward portfolio:", cash)
+    print("Rebalanced", len(rebalance_rows), "times")
+    print("Total profit:", round(daily_total.iloc[-1]['Total'] - cash, 2))
+    print("Annualized sharpe ratio:",
+          round(finlib.get_annualized_sharpe_ratio_df(daily_total), 3))
+
+    return daily_total, symbol_wts, main_wts